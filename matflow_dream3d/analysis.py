@@ -0,0 +1,1751 @@
+"""Functions for analysing (parsed) volume elements."""
+
+import hashlib
+from pathlib import Path
+
+import h5py
+import numpy as np
+from scipy import fft
+from scipy.spatial import cKDTree
+from scipy.special import betainc, ndtr
+
+from matflow_dream3d.utilities import (
+    disorientations,
+    get_symmetry_quaternions,
+    multiply_quaternions_batch,
+    quat2euler,
+    _conjugate,
+)
+
+# Maximum disorientation angles (degrees) for the supported crystal structures:
+MAX_DISORIENTATION_ANGLES = {
+    'cubic': 62.8,
+    'hexagonal': 93.9,
+}
+
+# Maximum second Euler angle (Phi) and third Euler angle (phi2), in degrees, of the
+# symmetry-reduced Euler space used for texture histograms:
+REDUCED_EULER_LIMITS = {
+    'cubic': (90, 90),
+    'hexagonal': (90, 60),
+}
+
+# Default pole figure poles, as Cartesian crystal directions (x//a):
+DEFAULT_POLES = {
+    'cubic': [[0, 0, 1], [1, 1, 0], [1, 1, 1]],
+    'hexagonal': [[0, 0, 1], [1, 0, 0]],
+}
+
+TEXTURE_CHUNK_SIZE = 2 ** 16
+
+
+def get_label_contingency(labels_a, labels_b):
+    """Find the sparse contingency table (voxel overlap counts) of two labelings.
+
+    Parameters
+    ----------
+    labels_a : ndarray of int
+        Non-negative labels (e.g. `element_material_idx`) of each element.
+    labels_b : ndarray of int
+        Non-negative labels of each element; must have the same shape as `labels_a`.
+
+    Returns
+    -------
+    contingency : dict
+        Dict with keys:
+            row : ndarray of shape (K,) of int
+                Label in `labels_a` of each of the K non-zero table entries.
+            col : ndarray of shape (K,) of int
+                Label in `labels_b` of each of the K non-zero table entries.
+            count : ndarray of shape (K,) of int
+                Number of elements labelled `row` in `labels_a` and `col` in
+                `labels_b`.
+            shape : tuple of int
+                Dense shape of the table, i.e. (max(labels_a) + 1, max(labels_b) + 1).
+        The `row`, `col` and `count` arrays are in COO format, so they can be passed
+        directly to `scipy.sparse.coo_matrix((count, (row, col)), shape=shape)`.
+
+    """
+    labels_a = np.asarray(labels_a).reshape(-1).astype(np.int64)
+    labels_b = np.asarray(labels_b).reshape(-1).astype(np.int64)
+    if labels_a.size != labels_b.size:
+        raise ValueError(
+            f'Labelings must have the same number of elements, but have {labels_a.size} '
+            f'and {labels_b.size} elements.'
+        )
+
+    shape = (int(labels_a.max()) + 1, int(labels_b.max()) + 1)
+    keys, count = np.unique(labels_a * shape[1] + labels_b, return_counts=True)
+
+    contingency = {
+        'row': keys // shape[1],
+        'col': keys % shape[1],
+        'count': count,
+        'shape': shape,
+    }
+    return contingency
+
+
+def compare_labelings(labels_ref, labels, min_overlap_fraction=0.05):
+    """Compare a labeling (e.g. a segmentation) with a reference labeling.
+
+    Parameters
+    ----------
+    labels_ref : ndarray of int
+        Reference labels (e.g. the `element_material_idx` of the original volume
+        element) of each element.
+    labels : ndarray of int
+        Labels to compare with the reference; must have the same shape as `labels_ref`.
+    min_overlap_fraction : float, optional
+        A reference grain is considered split (fragmented) if more than one grain in
+        `labels` overlaps with at least this fraction of its voxels; similarly, a grain
+        in `labels` is considered merged if it overlaps more than one reference grain
+        by at least this fraction of its voxels.
+
+    Returns
+    -------
+    comparison : dict
+        Dict with keys:
+            jaccard : ndarray of shape (M,) of float
+                For each of the M reference grains, the Jaccard index (intersection over
+                union) with its best-matching grain in `labels`.
+            best_match : ndarray of shape (M,) of int
+                For each reference grain, the grain in `labels` with the largest Jaccard
+                index.
+            num_fragments : ndarray of shape (M,) of int
+                For each reference grain, the number of significantly overlapping grains
+                in `labels`.
+            num_split : int
+                Number of reference grains that are split into more than one grain.
+            num_merged : int
+                Number of grains in `labels` that merge more than one reference grain.
+            adjusted_rand_index : float
+                Adjusted Rand index of the two labelings.
+
+    Notes
+    -----
+    All quantities are found from the sparse contingency table, so the cost is linear
+    in the number of elements and no dense grain-by-grain table is formed.
+
+    """
+    cont = get_label_contingency(labels_ref, labels)
+    row, col, count = cont['row'], cont['col'], cont['count']
+    num_ref, num_lab = cont['shape']
+
+    size_ref = np.bincount(row, weights=count, minlength=num_ref)
+    size_lab = np.bincount(col, weights=count, minlength=num_lab)
+
+    jaccard_all = count / (size_ref[row] + size_lab[col] - count)
+    ref_uniq, best_idx = _get_best_match(row, np.arange(row.size), jaccard_all)
+    jaccard = np.zeros(num_ref)
+    best_match = np.full(num_ref, -1)
+    jaccard[ref_uniq] = jaccard_all[best_idx]
+    best_match[ref_uniq] = col[best_idx]
+
+    is_frag = count >= min_overlap_fraction * size_ref[row]
+    num_fragments = np.bincount(row[is_frag], minlength=num_ref)
+    is_merge = count >= min_overlap_fraction * size_lab[col]
+    num_merged_parents = np.bincount(col[is_merge], minlength=num_lab)
+
+    # Adjusted Rand index, with all pair counts as floats to avoid overflow:
+    def num_pairs(n):
+        n = np.asarray(n, dtype=float)
+        return n * (n - 1) / 2
+
+    sum_comb = np.sum(num_pairs(count))
+    sum_comb_ref = np.sum(num_pairs(size_ref))
+    sum_comb_lab = np.sum(num_pairs(size_lab))
+    expected = sum_comb_ref * sum_comb_lab / num_pairs(np.sum(count))
+    max_index = (sum_comb_ref + sum_comb_lab) / 2
+    if np.isclose(max_index, expected):
+        ARI = 1.0
+    else:
+        ARI = (sum_comb - expected) / (max_index - expected)
+
+    comparison = {
+        'jaccard': jaccard,
+        'best_match': best_match,
+        'num_fragments': num_fragments,
+        'num_split': int(np.sum(num_fragments > 1)),
+        'num_merged': int(np.sum(num_merged_parents > 1)),
+        'adjusted_rand_index': float(ARI),
+    }
+    return comparison
+
+
+def _get_best_match(group, other, count):
+    """For each distinct value in `group`, find the entry with the largest `count`.
+
+    Returns the distinct group values and the corresponding best `other` values."""
+    srt = np.lexsort((-count, group))
+    group_uniq, first_idx = np.unique(group[srt], return_index=True)
+    return group_uniq, other[srt][first_idx]
+
+
+def track_grains(volume_elements, min_overlap_fraction=0.2):
+    """Find persistent grain identities over a sequence of segmented volume elements.
+
+    Parameters
+    ----------
+    volume_elements : list of (dict or ndarray)
+        Successive volume elements (e.g. the `segment_grains` outputs of successive
+        simulation increments), or their `element_material_idx` arrays. All must have
+        the same grid size.
+    min_overlap_fraction : float, optional
+        A grain in one volume element is only considered related to a grain in the next
+        volume element if their voxel overlap is at least this fraction of the smaller
+        of the two grains.
+
+    Returns
+    -------
+    tracking : dict
+        Dict with keys:
+            persistent_grain_idx : list of ndarray of int
+                For each volume element, the persistent grain ID of each grain.
+            num_persistent_grains : int
+                Total number of persistent grain IDs assigned.
+            splits : list of dict
+                Split events, each with keys: `increment` (index of the volume element
+                in which the split is first observed), `parent` (persistent ID of the
+                parent grain) and `children` (persistent IDs of the resulting grains;
+                if one child is in a one-to-one correspondence with the parent (see
+                Notes), it is listed first and has inherited the parent ID).
+            merges : list of dict
+                Merge events, each with keys: `increment`, `parents` (persistent IDs of
+                the merging grains, listing first the largest-overlap parent of the
+                child) and `child` (which has inherited the ID of that parent only if
+                they are in a one-to-one correspondence).
+
+    Notes
+    -----
+    Successive labelings are compared through their sparse contingency tables. A grain
+    inherits the persistent ID of its largest-overlap parent if it is also the
+    largest-overlap child of that parent (a one-to-one correspondence). Other
+    significantly overlapping children of a parent are split products and receive new
+    IDs; other significantly overlapping parents of a child are merged into it.
+
+    """
+    labelings = [
+        np.asarray(i['element_material_idx'] if isinstance(i, dict) else i)
+        for i in volume_elements
+    ]
+
+    num_grains = int(labelings[0].max()) + 1
+    persistent_idx = [np.arange(num_grains)]
+    num_persistent = num_grains
+    splits = []
+    merges = []
+
+    for inc_idx in range(1, len(labelings)):
+
+        labels_a, labels_b = labelings[inc_idx - 1], labelings[inc_idx]
+        if labels_a.shape != labels_b.shape:
+            raise ValueError(
+                f'Volume element {inc_idx} has grid size {labels_b.shape}, but volume '
+                f'element {inc_idx - 1} has grid size {labels_a.shape}.'
+            )
+
+        cont = get_label_contingency(labels_a, labels_b)
+        row, col, count = cont['row'], cont['col'], cont['count']
+        size_a = np.bincount(labels_a.reshape(-1), minlength=cont['shape'][0])
+        size_b = np.bincount(labels_b.reshape(-1), minlength=cont['shape'][1])
+
+        is_sig = count >= min_overlap_fraction * np.minimum(size_a[row], size_b[col])
+        row, col, count = row[is_sig], col[is_sig], count[is_sig]
+
+        best_child = np.full(cont['shape'][0], -1)
+        best_parent = np.full(cont['shape'][1], -1)
+        a_uniq, a_child = _get_best_match(row, col, count)
+        b_uniq, b_parent = _get_best_match(col, row, count)
+        best_child[a_uniq] = a_child
+        best_parent[b_uniq] = b_parent
+
+        # One-to-one correspondences inherit the persistent ID of the parent:
+        new_persistent = np.full(cont['shape'][1], -1)
+        b_idx = np.arange(cont['shape'][1])
+        has_parent = best_parent >= 0
+        inherits = np.zeros_like(has_parent)
+        inherits[has_parent] = best_child[best_parent[has_parent]] == b_idx[has_parent]
+        new_persistent[inherits] = persistent_idx[-1][best_parent[inherits]]
+
+        # All other grains get new persistent IDs:
+        num_new = np.sum(~inherits)
+        new_persistent[~inherits] = np.arange(num_persistent, num_persistent + num_new)
+        num_persistent += num_new
+
+        # Splits: parents with more than one significant child for which they are the
+        # best parent:
+        is_split_link = best_parent[col] == row
+        split_row, split_col = row[is_split_link], col[is_split_link]
+        srt = np.lexsort((~inherits[split_col], split_row))
+        split_row, split_col = split_row[srt], split_col[srt]
+        split_parents, split_start, split_counts = np.unique(
+            split_row,
+            return_index=True,
+            return_counts=True,
+        )
+        for parent, start, num in zip(split_parents, split_start, split_counts):
+            if num > 1:
+                splits.append({
+                    'increment': inc_idx,
+                    'parent': int(persistent_idx[-1][parent]),
+                    'children': new_persistent[split_col[start:start + num]].tolist(),
+                })
+
+        # Merges: children with more than one significant parent for which they are the
+        # best child:
+        is_merge_link = best_child[row] == col
+        merge_row, merge_col = row[is_merge_link], col[is_merge_link]
+        srt = np.lexsort((best_parent[merge_col] != merge_row, merge_col))
+        merge_row, merge_col = merge_row[srt], merge_col[srt]
+        merge_children, merge_start, merge_counts = np.unique(
+            merge_col,
+            return_index=True,
+            return_counts=True,
+        )
+        for child, start, num in zip(merge_children, merge_start, merge_counts):
+            if num > 1:
+                merges.append({
+                    'increment': inc_idx,
+                    'parents': persistent_idx[-1][merge_row[start:start + num]].tolist(),
+                    'child': int(new_persistent[child]),
+                })
+
+        persistent_idx.append(new_persistent)
+
+    tracking = {
+        'persistent_grain_idx': persistent_idx,
+        'num_persistent_grains': int(num_persistent),
+        'splits': splits,
+        'merges': merges,
+    }
+    return tracking
+
+
+def _get_grain_data(volume_element):
+    """Get the orientation (quaternion) and phase label of each material (grain) of a
+    validated, single-constituent-per-material volume element."""
+
+    const_mat_idx = np.asarray(volume_element['constituent_material_idx'])
+    mat_const_idx = np.empty(const_mat_idx.size, dtype=int)
+    mat_const_idx[const_mat_idx] = np.arange(const_mat_idx.size)
+
+    ori_idx = np.asarray(volume_element['constituent_orientation_idx'])[mat_const_idx]
+    oris = volume_element['orientations']
+    grain_quats = np.asarray(oris['quaternions'])[ori_idx]
+    grain_phase = np.asarray(volume_element['constituent_phase_label'])[mat_const_idx]
+
+    return grain_quats, grain_phase, oris.get('P', 1)
+
+
+def get_grain_boundary_faces(element_material_idx, size=None, periodic=True):
+    """Find the pairs of grains that share element faces, and their shared face areas.
+
+    Parameters
+    ----------
+    element_material_idx : ndarray of shape (Nx, Ny, Nz) of int
+    size : list of float, optional
+        Size of the volume element; by default, a unit cube.
+    periodic : bool, optional
+        If True, faces across the volume element boundaries are included.
+
+    Returns
+    -------
+    boundaries : dict
+        Dict with keys:
+            pairs : ndarray of shape (B, 2) of int
+                Grain indices either side of each of the B grain boundaries, where the
+                first index is smaller than the second.
+            area : ndarray of shape (B,) of float
+                Shared surface area of each boundary.
+            num_faces : ndarray of shape (B,) of int
+                Number of shared element faces of each boundary.
+
+    """
+    element_material_idx = np.asarray(element_material_idx)
+    grid_size = np.array(element_material_idx.shape)
+    size = np.ones(3) if size is None else np.asarray(size, dtype=float)
+    face_areas = np.prod(size / grid_size) / (size / grid_size)
+    num_grains = int(element_material_idx.max()) + 1
+
+    keys = []
+    areas = []
+    for axis in range(3):
+        if periodic:
+            nbr = np.roll(element_material_idx, -1, axis=axis)
+            this = element_material_idx
+        else:
+            nbr = np.delete(element_material_idx, 0, axis=axis)
+            this = np.delete(element_material_idx, -1, axis=axis)
+        is_bound = this != nbr
+        grain_a, grain_b = this[is_bound], nbr[is_bound]
+        keys.append(
+            np.minimum(grain_a, grain_b).astype(np.int64) * num_grains +
+            np.maximum(grain_a, grain_b)
+        )
+        areas.append(np.full(grain_a.size, face_areas[axis]))
+
+    keys, inv, num_faces = np.unique(
+        np.concatenate(keys),
+        return_inverse=True,
+        return_counts=True,
+    )
+    boundaries = {
+        'pairs': np.array([keys // num_grains, keys % num_grains]).T,
+        'area': np.bincount(inv, weights=np.concatenate(areas), minlength=keys.size),
+        'num_faces': num_faces,
+    }
+    return boundaries
+
+
+def get_grain_adjacency(element_material_idx, size=None, periodic=True):
+    """Find the (symmetric) grain adjacency graph as a sparse matrix.
+
+    Parameters
+    ----------
+    element_material_idx : ndarray of shape (Nx, Ny, Nz) of int
+    size : list of float, optional
+        Size of the volume element; by default, a unit cube.
+    periodic : bool, optional
+        If True, grains that share faces across the volume element boundaries are
+        adjacent.
+
+    Returns
+    -------
+    adjacency : dict
+        Dict with keys:
+            row : ndarray of shape (2B,) of int
+            col : ndarray of shape (2B,) of int
+            count : ndarray of shape (2B,) of int
+                Number of element faces shared by grains `row` and `col`.
+            area : ndarray of shape (2B,) of float
+                Surface area shared by grains `row` and `col`.
+            indptr : ndarray of shape (M + 1,) of int
+                Row pointers, such that the neighbours of grain `g` are
+                `col[indptr[g]:indptr[g + 1]]`.
+            shape : tuple of int
+                Dense shape of the matrix, i.e. (M, M) for M grains.
+        Entries are sorted by `row` then `col`, so, for example, both
+        `scipy.sparse.coo_matrix((count, (row, col)), shape=shape)` and
+        `scipy.sparse.csr_matrix((count, col, indptr), shape=shape)` may be used.
+
+    """
+    boundaries = get_grain_boundary_faces(element_material_idx, size, periodic)
+    num_grains = int(np.max(element_material_idx)) + 1
+    pairs = boundaries['pairs']
+
+    row = np.concatenate([pairs[:, 0], pairs[:, 1]])
+    col = np.concatenate([pairs[:, 1], pairs[:, 0]])
+    srt = np.lexsort((col, row))
+
+    adjacency = {
+        'row': row[srt],
+        'col': col[srt],
+        'count': np.tile(boundaries['num_faces'], 2)[srt],
+        'area': np.tile(boundaries['area'], 2)[srt],
+        'indptr': np.concatenate([
+            [0],
+            np.cumsum(np.bincount(row, minlength=num_grains)),
+        ]),
+        'shape': (num_grains, num_grains),
+    }
+    return adjacency
+
+
+def get_grain_boundary_mesh(element_material_idx, size=None, origin=None,
+                            periodic=False):
+    """Extract a quadrilateral surface mesh of the element faces that separate grains.
+
+    Parameters
+    ----------
+    element_material_idx : ndarray of shape (Nx, Ny, Nz) of int
+    size : list of float, optional
+        Size of the volume element; by default, a unit cube.
+    origin : list of float, optional
+        Origin of the volume element; by default, zero.
+    periodic : bool, optional
+        If True, faces across the volume element boundaries (at the upper boundary of
+        each axis) are included.
+
+    Returns
+    -------
+    mesh : dict
+        Dict with keys:
+            vertices : ndarray of shape (V, 3) of float
+                Coordinates of the mesh vertices, which are shared between faces.
+            quads : ndarray of shape (F, 4) of int
+                Vertex indices of each face, ordered such that the face normal points
+                in the positive `axis` direction.
+            grain_pairs : ndarray of shape (F, 2) of int
+                Grain indices on the negative and positive sides of each face.
+            axis : ndarray of shape (F,) of int
+                Axis to which each face is normal.
+
+    """
+    element_material_idx = np.asarray(element_material_idx)
+    grid_size = np.array(element_material_idx.shape)
+    size = np.ones(3) if size is None else np.asarray(size, dtype=float)
+    origin = np.zeros(3) if origin is None else np.asarray(origin, dtype=float)
+    vertex_grid_size = grid_size + 1
+
+    keys = []
+    grain_pairs = []
+    axes = []
+    for axis in range(3):
+        if periodic:
+            nbr = np.roll(element_material_idx, -1, axis=axis)
+            this = element_material_idx
+        else:
+            nbr = np.delete(element_material_idx, 0, axis=axis)
+            this = np.delete(element_material_idx, -1, axis=axis)
+        is_bound = this != nbr
+
+        # Face corners relative to the element on the negative side, ordered
+        # anticlockwise about the positive `axis` direction:
+        corner_offsets = np.zeros((4, 3), dtype=int)
+        corner_offsets[:, axis] = 1
+        corner_offsets[[1, 2], (axis + 1) % 3] = 1
+        corner_offsets[[2, 3], (axis + 2) % 3] = 1
+
+        elem_subs = np.array(np.nonzero(is_bound)).T
+        corners = elem_subs[:, None] + corner_offsets  # shape (F, 4, 3)
+        keys.append(np.ravel_multi_index(corners.reshape(-1, 3).T, vertex_grid_size))
+        grain_pairs.append(np.array([this[is_bound], nbr[is_bound]]).T)
+        axes.append(np.full(elem_subs.shape[0], axis))
+
+    # Share vertices by hashing their integer coordinates:
+    vertex_keys, quads = np.unique(np.concatenate(keys), return_inverse=True)
+    vertex_subs = np.array(np.unravel_index(vertex_keys, vertex_grid_size)).T
+
+    mesh = {
+        'vertices': origin + vertex_subs * (size / grid_size),
+        'quads': quads.reshape(-1, 4),
+        'grain_pairs': np.concatenate(grain_pairs).reshape(-1, 2),
+        'axis': np.concatenate(axes),
+    }
+    return mesh
+
+
+def write_grain_boundary_mesh(mesh, path):
+    """Write a grain boundary mesh to an HDF5 file, with an accompanying XDMF file (with
+    the same stem) for visualisation, for example, in ParaView.
+
+    Parameters
+    ----------
+    mesh : dict
+        As returned by `get_grain_boundary_mesh`.
+    path : str or Path
+        Path of the HDF5 file to write.
+
+    """
+    path = Path(path)
+    with h5py.File(path, mode='w') as fh:
+        for key, val in mesh.items():
+            fh.create_dataset(key, data=val)
+
+    num_faces = mesh['quads'].shape[0]
+    num_verts = mesh['vertices'].shape[0]
+    h5_item = 'Format="HDF" NumberType="{}" Precision="8" Dimensions="{}"'
+    int_item = h5_item.format('Int', '{}')
+    grain_attrs = ''.join([
+        f'      <Attribute Name="{name}" AttributeType="Scalar" Center="Cell">\n'
+        f'        <DataItem ItemType="HyperSlab" Dimensions="{num_faces} 1">\n'
+        f'          <DataItem Dimensions="3 2" Format="XML">'
+        f'0 {col_idx} 1 1 {num_faces} 1</DataItem>\n'
+        f'          <DataItem {int_item.format(f"{num_faces} 2")}>'
+        f'{path.name}:/grain_pairs</DataItem>\n'
+        f'        </DataItem>\n'
+        f'      </Attribute>\n'
+        for col_idx, name in enumerate(('grain_a', 'grain_b'))
+    ])
+    xdmf = (
+        f'<?xml version="1.0"?>\n'
+        f'<!DOCTYPE Xdmf SYSTEM "Xdmf.dtd"[]>\n'
+        f'<Xdmf xmlns:xi="http://www.w3.org/2003/XInclude" Version="2.2">\n'
+        f'  <Domain>\n'
+        f'    <Grid Name="GrainBoundaries" GridType="Uniform">\n'
+        f'      <Topology TopologyType="Quadrilateral" NumberOfElements="{num_faces}">\n'
+        f'        <DataItem {int_item.format(f"{num_faces} 4")}>'
+        f'{path.name}:/quads</DataItem>\n'
+        f'      </Topology>\n'
+        f'      <Geometry GeometryType="XYZ">\n'
+        f'        <DataItem {h5_item.format("Float", f"{num_verts} 3")}>'
+        f'{path.name}:/vertices</DataItem>\n'
+        f'      </Geometry>\n'
+        f'{grain_attrs}'
+        f'      <Attribute Name="axis" AttributeType="Scalar" Center="Cell">\n'
+        f'        <DataItem {int_item.format(num_faces)}>{path.name}:/axis</DataItem>\n'
+        f'      </Attribute>\n'
+        f'    </Grid>\n'
+        f'  </Domain>\n'
+        f'</Xdmf>\n'
+    )
+
+    with path.with_suffix('.xdmf').open('w') as fh:
+        fh.write(xdmf)
+
+
+def _get_grain_centroids(grain_idx, grid_size, size, num_grains, periodic):
+    """Find grain centroids with grouped sums over elements, using circular means along
+    each axis if `periodic`."""
+
+    elem_size = size / grid_size
+    num_elements = np.bincount(grain_idx, minlength=num_grains)
+    centroid = np.empty((num_grains, 3))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for axis in range(3):
+
+            coord = (np.arange(grid_size[axis]) + 0.5) * elem_size[axis]
+            if periodic:
+                theta = 2 * np.pi * coord / size[axis]
+                mean_theta = np.arctan2(
+                    _sum_over_grains(np.sin(theta), axis, grain_idx, grid_size,
+                                     num_grains),
+                    _sum_over_grains(np.cos(theta), axis, grain_idx, grid_size,
+                                     num_grains),
+                )
+                # Wrap into [0, size); the modulo of a tiny negative value rounds to
+                # exactly `size`:
+                axis_centroid = np.mod(mean_theta * size[axis] / (2 * np.pi), size[axis])
+                axis_centroid[axis_centroid == size[axis]] = 0
+                centroid[:, axis] = axis_centroid
+            else:
+                centroid[:, axis] = _sum_over_grains(
+                    coord, axis, grain_idx, grid_size, num_grains
+                ) / num_elements
+
+    centroid[num_elements == 0] = np.nan
+
+    return centroid
+
+
+def _sum_over_grains(per_plane_val, axis, grain_idx, grid_size, num_grains):
+    """Sum a value defined for each plane of elements normal to `axis` over grains."""
+    shape = [1, 1, 1]
+    shape[axis] = grid_size[axis]
+    val = np.broadcast_to(np.reshape(per_plane_val, shape), grid_size)
+    return np.bincount(grain_idx, weights=val.reshape(-1), minlength=num_grains)
+
+
+def get_grain_statistics(element_material_idx, size=None, periodic=True):
+    """Find the volumes, equivalent sphere diameters, centroids and numbers of
+    neighbours of all grains of a volume element.
+
+    Parameters
+    ----------
+    element_material_idx : ndarray of shape (Nx, Ny, Nz) of int
+    size : list of float, optional
+        Size of the volume element; by default, a unit cube.
+    periodic : bool, optional
+        If True, centroids are found as circular means, such that grains that wrap
+        around the volume element boundaries have sensible centroids, and neighbours
+        across the volume element boundaries are counted.
+
+    Returns
+    -------
+    grain_statistics : dict
+        Dict with keys:
+            num_elements : ndarray of shape (M,) of int
+                Number of elements in each of the M grains.
+            volume : ndarray of shape (M,) of float
+            ESD : ndarray of shape (M,) of float
+                Equivalent sphere diameter of each grain.
+            centroid : ndarray of shape (M, 3) of float
+                Centroid of each grain, within the volume element (i.e. in the range
+                [0, `size`) along each axis). Centroids of grains without elements are
+                NaN.
+            num_neighbours : ndarray of shape (M,) of int
+                Number of distinct grains that share at least one element face with each
+                grain.
+
+    """
+    element_material_idx = np.asarray(element_material_idx)
+    grid_size = np.array(element_material_idx.shape)
+    size = np.ones(3) if size is None else np.asarray(size, dtype=float)
+    elem_size = size / grid_size
+    num_grains = int(element_material_idx.max()) + 1
+    grain_idx = element_material_idx.reshape(-1)
+
+    num_elements = np.bincount(grain_idx, minlength=num_grains)
+    volume = num_elements * np.prod(elem_size)
+    ESD = np.cbrt(6 * volume / np.pi)
+
+    centroid = _get_grain_centroids(grain_idx, grid_size, size, num_grains, periodic)
+
+    pairs = get_grain_boundary_faces(element_material_idx, size, periodic)['pairs']
+    num_neighbours = np.bincount(pairs.reshape(-1), minlength=num_grains)
+
+    grain_statistics = {
+        'num_elements': num_elements,
+        'volume': volume,
+        'ESD': ESD,
+        'centroid': centroid,
+        'num_neighbours': num_neighbours,
+    }
+    return grain_statistics
+
+
+def get_grain_shapes(element_material_idx, size=None, periodic=True):
+    """Find ellipsoid shape descriptors of all grains of a volume element from their
+    second-moment tensors.
+
+    Parameters
+    ----------
+    element_material_idx : ndarray of shape (Nx, Ny, Nz) of int
+    size : list of float, optional
+        Size of the volume element; by default, a unit cube.
+    periodic : bool, optional
+        If True, element coordinates are taken relative to the (circular mean)
+        grain centroids using the minimum image convention, such that grains that wrap
+        around the volume element boundaries are treated as contiguous.
+
+    Returns
+    -------
+    grain_shapes : dict
+        Dict with keys:
+            axis_lengths : ndarray of shape (M, 3) of float
+                Semi-axis lengths (a >= b >= c) of the ellipsoid with the same second
+                moments as each of the M grains.
+            b/a : ndarray of shape (M,) of float
+            c/a : ndarray of shape (M,) of float
+            omega3 : ndarray of shape (M,) of float
+                Moment invariant (normalised to one for ellipsoids) as used by Dream3D
+                to describe deviation from an ellipsoidal shape.
+            principal_axes : ndarray of shape (M, 3, 3) of float
+                Unit principal directions of each grain, where `principal_axes[:, i]`
+                corresponds to `axis_lengths[:, i]`.
+        Values of grains without elements are NaN.
+
+    Notes
+    -----
+    Grain second-moment tensors are accumulated from grouped sums of the element
+    coordinate products, and then all tensors are diagonalised in a single batched
+    call to `np.linalg.eigh`. The moments of each element about its own centre are
+    included, so that single-element grains are described as spheres (for cubic
+    elements).
+
+    """
+    element_material_idx = np.asarray(element_material_idx)
+    grid_size = np.array(element_material_idx.shape)
+    size = np.ones(3) if size is None else np.asarray(size, dtype=float)
+    elem_size = size / grid_size
+    elem_vol = np.prod(elem_size)
+    num_grains = int(element_material_idx.max()) + 1
+    grain_idx = element_material_idx.reshape(-1)
+    num_elements = np.bincount(grain_idx, minlength=num_grains)
+
+    centroid = _get_grain_centroids(grain_idx, grid_size, size, num_grains, periodic)
+
+    # Element coordinates relative to their grain centroids:
+    coords = np.empty((grain_idx.size, 3))
+    for axis in range(3):
+        shape = [1, 1, 1]
+        shape[axis] = grid_size[axis]
+        coord = (np.arange(grid_size[axis]) + 0.5) * elem_size[axis]
+        coord = np.broadcast_to(coord.reshape(shape), grid_size).reshape(-1)
+        rel = coord - centroid[grain_idx, axis]
+        if periodic:
+            rel -= np.round(rel / size[axis]) * size[axis]
+        coords[:, axis] = rel
+
+    moments = np.zeros((num_grains, 3, 3))
+    for i in range(3):
+        for j in range(i, 3):
+            moments[:, i, j] = np.bincount(
+                grain_idx,
+                weights=coords[:, i] * coords[:, j],
+                minlength=num_grains,
+            )
+            moments[:, j, i] = moments[:, i, j]
+    moments += np.diag(elem_size ** 2 / 12) * num_elements[:, None, None]
+    moments *= elem_vol  # integral of (x - c)(x - c)^T over each grain
+
+    is_empty = num_elements == 0
+    moments[is_empty] = np.eye(3)
+    eig_vals, eig_vecs = np.linalg.eigh(moments)
+    eig_vals, eig_vecs = eig_vals[:, ::-1], eig_vecs[:, :, ::-1]  # descending
+
+    # A uniform ellipsoid of volume V has principal moments V * a^2 / 5:
+    volume = num_elements * elem_vol
+    with np.errstate(invalid='ignore', divide='ignore'):
+        axis_lengths = np.sqrt(5 * np.clip(eig_vals, 0, None) / volume[:, None])
+        omega3 = (
+            ((4 * np.pi / 15) ** 3 / (4 * np.pi / 3) ** 5) *
+            volume ** 5 / np.prod(eig_vals, axis=1)
+        )
+        b_a = axis_lengths[:, 1] / axis_lengths[:, 0]
+        c_a = axis_lengths[:, 2] / axis_lengths[:, 0]
+
+    for arr in (axis_lengths, omega3, b_a, c_a, eig_vecs):
+        arr[is_empty] = np.nan
+
+    grain_shapes = {
+        'axis_lengths': axis_lengths,
+        'b/a': b_a,
+        'c/a': c_a,
+        'omega3': omega3,
+        'principal_axes': eig_vecs,
+    }
+    return grain_shapes
+
+
+def get_misorientation_distribution(volume_element, phase_label, crystal_structure,
+                                    periodic=True, angle_bin_size=5):
+    """Find the boundary-area-weighted misorientation distribution function (MDF) of
+    one phase of a volume element.
+
+    Parameters
+    ----------
+    volume_element : dict
+        Validated volume element, with one constituent per material.
+    phase_label : str
+        Only boundaries between pairs of grains of this phase are considered.
+    crystal_structure : str
+        Crystal structure of the phase; one of "cubic" or "hexagonal".
+    periodic : bool, optional
+        If True, boundaries across the volume element boundaries are included.
+    angle_bin_size : float, optional
+        Width of the disorientation angle bins in degrees.
+
+    Returns
+    -------
+    MDF : dict
+        Dict with keys:
+            angles : list of float
+                Centre of each non-empty angle bin, in degrees.
+            axes : list of list of float
+                Area-weighted mean disorientation axis (in the standard stereographic
+                triangle) of each non-empty angle bin.
+            weights : list of float
+                Boundary area fraction of each non-empty angle bin.
+            angle_bin_edges : ndarray of float
+                Edges of all angle bins, in degrees.
+            angle_density : ndarray of float
+                Boundary-area-weighted probability density of the disorientation angle,
+                in each angle bin.
+        The `angles`, `axes` and `weights` keys can be used as the `MDF` of a phase in
+        `phase_statistics`.
+
+    """
+    grain_quats, grain_phase, P = _get_grain_data(volume_element)
+    boundaries = get_grain_boundary_faces(
+        volume_element['element_material_idx'],
+        size=volume_element.get('size'),
+        periodic=periodic,
+    )
+    pairs, area = boundaries['pairs'], boundaries['area']
+
+    in_phase = np.logical_and(
+        grain_phase[pairs[:, 0]] == phase_label,
+        grain_phase[pairs[:, 1]] == phase_label,
+    )
+    pairs, area = pairs[in_phase], area[in_phase]
+
+    angles, axes = disorientations(
+        grain_quats[pairs[:, 0]],
+        grain_quats[pairs[:, 1]],
+        crystal_structure,
+        P=P,
+        degrees=True,
+    )
+
+    max_angle = MAX_DISORIENTATION_ANGLES[crystal_structure]
+    bin_edges = np.arange(0, max_angle + angle_bin_size, angle_bin_size)
+    num_bins = bin_edges.size - 1
+    bin_idx = np.clip(np.digitize(angles, bin_edges) - 1, 0, num_bins - 1)
+
+    bin_area = np.bincount(bin_idx, weights=area, minlength=num_bins)
+    bin_axes = np.array([
+        np.bincount(bin_idx, weights=area * axes[:, i], minlength=num_bins)
+        for i in range(3)
+    ]).T
+    total_area = np.sum(area)
+
+    is_filled = bin_area > 0
+    mean_axes = bin_axes[is_filled]
+    mean_axes /= np.linalg.norm(mean_axes, axis=1)[:, None]
+    bin_centres = (bin_edges[:-1] + bin_edges[1:]) / 2
+
+    MDF = {
+        'angles': bin_centres[is_filled].tolist(),
+        'axes': mean_axes.tolist(),
+        'weights': (bin_area[is_filled] / total_area).tolist(),
+        'angle_bin_edges': bin_edges,
+        'angle_density': bin_area / (total_area * angle_bin_size),
+    }
+    return MDF
+
+
+def _KS_distance(samples, cdf):
+    """Find the Kolmogorov-Smirnov distance between the empirical distribution of
+    `samples` and a distribution with cumulative distribution function `cdf`."""
+
+    samples = np.sort(samples[~np.isnan(samples)])
+    num = samples.size
+    if not num:
+        return np.nan
+    cdf_vals = cdf(samples)
+    upper = np.arange(1, num + 1) / num - cdf_vals
+    lower = cdf_vals - np.arange(num) / num
+    return float(max(np.max(upper), np.max(lower)))
+
+
+def _beta_cdf(alpha, beta):
+    return lambda x: betainc(alpha, beta, np.clip(x, 0, 1))
+
+
+def _lognormal_cdf(log_mean, log_stddev, min_val=None, max_val=None):
+    """Get the CDF of a log-normal distribution, optionally truncated."""
+
+    def cdf(x):
+        with np.errstate(divide='ignore'):
+            z = (np.log(x) - log_mean) / log_stddev
+        if min_val is None:
+            return ndtr(z)
+        z_min = (np.log(min_val) - log_mean) / log_stddev
+        z_max = (np.log(max_val) - log_mean) / log_stddev
+        return np.clip(
+            (ndtr(z) - ndtr(z_min)) / (ndtr(z_max) - ndtr(z_min)),
+            0,
+            1,
+        )
+
+    return cdf
+
+
+def get_statistics_fidelity(element_material_idx, grain_phase_idx, requested,
+                            size=None, periodic=True):
+    """Compare the achieved statistics of a volume element with requested statistics.
+
+    Parameters
+    ----------
+    element_material_idx : ndarray of shape (Nx, Ny, Nz) of int
+    grain_phase_idx : ndarray of shape (M,) of int
+        Index into `requested` of the phase of each of the M grains.
+    requested : list of dict
+        Requested statistics of each phase, each with keys:
+            name : str
+            volume_fraction : float
+            ESD_bins : dict, optional
+                Log-normal equivalent sphere diameter (ESD) distribution, with keys:
+                `log_mean`, `log_stddev`, `min_ESD`, `max_ESD`, `bins` (lower edges of
+                the ESD bins) and `bin_step_size`.
+            distributions : dict, optional
+                Per-ESD-bin distributions, with keys any of "b/a", "c/a" and "omega3"
+                (each with per-bin lists `alpha` and `beta` of a beta distribution) and
+                "neighbours" (with per-bin lists `average` and `stddev` of a log-normal
+                distribution).
+    size : list of float, optional
+        Size of the volume element; by default, a unit cube.
+    periodic : bool, optional
+
+    Returns
+    -------
+    fidelity : list of dict
+        For each phase, a dict with keys:
+            name : str
+            num_grains : int
+            volume_fraction : dict
+                With keys `requested`, `achieved` and `difference`.
+            ESD : dict, optional
+                With keys `bins`, `requested_fraction` (expected fraction of grains in
+                each bin), `achieved_fraction` and `KS_distance`. Only included if
+                `ESD_bins` is given for the phase.
+            distributions : dict, optional
+                For each requested per-bin distribution, a dict with keys
+                `KS_distance` (per bin; NaN for empty bins) and `mean_KS_distance`
+                (weighted by the number of grains in each bin).
+
+    Notes
+    -----
+    All grain quantities are found together, by `get_grain_statistics` and
+    `get_grain_shapes`. Grain neighbour counts are face-neighbour counts, which may
+    differ from the neighbourhood definition used within Dream3D.
+
+    """
+    grain_phase_idx = np.asarray(grain_phase_idx)
+    grain_stats = get_grain_statistics(element_material_idx, size, periodic)
+    grain_shapes = get_grain_shapes(element_material_idx, size, periodic)
+    grain_vals = {
+        'b/a': grain_shapes['b/a'],
+        'c/a': grain_shapes['c/a'],
+        'omega3': grain_shapes['omega3'],
+        'neighbours': grain_stats['num_neighbours'].astype(float),
+    }
+
+    num_elems = grain_stats['num_elements']
+    phase_vol_frac = np.bincount(
+        grain_phase_idx,
+        weights=num_elems,
+        minlength=len(requested),
+    ) / np.sum(num_elems)
+
+    fidelity = []
+    for phase_idx, phase_req in enumerate(requested):
+
+        in_phase = np.logical_and(grain_phase_idx == phase_idx, num_elems > 0)
+        phase_fid = {
+            'name': phase_req['name'],
+            'num_grains': int(np.sum(in_phase)),
+            'volume_fraction': {
+                'requested': phase_req['volume_fraction'],
+                'achieved': phase_vol_frac[phase_idx],
+                'difference': phase_vol_frac[phase_idx] - phase_req['volume_fraction'],
+            },
+        }
+
+        ESD_bins = phase_req.get('ESD_bins')
+        if ESD_bins:
+
+            ESD = grain_stats['ESD'][in_phase]
+            bins = np.asarray(ESD_bins['bins'])
+            num_bins = bins.size
+            bin_idx = np.clip(
+                np.floor((ESD - bins[0]) / ESD_bins['bin_step_size']).astype(int),
+                0,
+                num_bins - 1,
+            )
+            ESD_cdf = _lognormal_cdf(
+                ESD_bins['log_mean'],
+                ESD_bins['log_stddev'],
+                ESD_bins['min_ESD'],
+                ESD_bins['max_ESD'],
+            )
+            bin_edges = np.append(bins, ESD_bins['max_ESD'])
+            bin_counts = np.bincount(bin_idx, minlength=num_bins)
+
+            phase_fid['ESD'] = {
+                'bins': bins,
+                'requested_fraction': np.diff(ESD_cdf(bin_edges)),
+                'achieved_fraction': bin_counts / max(ESD.size, 1),
+                'KS_distance': _KS_distance(ESD, ESD_cdf),
+            }
+
+            phase_fid['distributions'] = {}
+            for dist_key, dist in phase_req.get('distributions', {}).items():
+                vals = grain_vals[dist_key][in_phase]
+                KS = np.full(num_bins, np.nan)
+                for bin_i in np.unique(bin_idx):
+                    if dist_key == 'neighbours':
+                        cdf = _lognormal_cdf(dist['average'][bin_i], dist['stddev'][bin_i])
+                    else:
+                        cdf = _beta_cdf(dist['alpha'][bin_i], dist['beta'][bin_i])
+                    KS[bin_i] = _KS_distance(vals[bin_idx == bin_i], cdf)
+
+                has_grains = bin_counts > 0
+                phase_fid['distributions'][dist_key] = {
+                    'KS_distance': KS,
+                    'mean_KS_distance': float(np.average(
+                        KS[has_grains],
+                        weights=bin_counts[has_grains],
+                    )) if np.any(has_grains) else np.nan,
+                }
+
+        fidelity.append(phase_fid)
+
+    return fidelity
+
+
+def _fit_beta_moments(vals):
+    """Fit beta distribution parameters to samples in (0, 1) using the method of
+    moments; returns NaNs if the samples do not determine a beta distribution."""
+
+    if vals.size < 2:
+        return np.nan, np.nan
+    mean = np.mean(vals)
+    var = np.var(vals, ddof=1)
+    if var <= 0 or var >= mean * (1 - mean):
+        return np.nan, np.nan
+    common = mean * (1 - mean) / var - 1
+    return mean * common, (1 - mean) * common
+
+
+def _fit_lognormal(vals):
+    """Fit log-normal distribution parameters to positive samples; returns NaNs if
+    there are too few samples."""
+
+    vals = vals[vals > 0]
+    if vals.size < 2:
+        return np.nan, np.nan
+    log_vals = np.log(vals)
+    return np.mean(log_vals), np.std(log_vals, ddof=1)
+
+
+def fit_phase_statistics(volume_element, crystal_structures, phase_types=None,
+                         num_bins=10, periodic=True):
+    """Fit `phase_statistics` to the grains of an existing volume element, for the
+    generation of statistically equivalent volume elements.
+
+    Parameters
+    ----------
+    volume_element : dict
+        Validated, single-constituent-per-material volume element, for example, as
+        parsed from a grain segmentation.
+    crystal_structures : dict of (str: str)
+        Crystal structure ("cubic" or "hexagonal") of each phase label.
+    phase_types : dict of (str: str), optional
+        Phase type ("primary" or "matrix") of each phase label. By default, all phases
+        are "primary".
+    num_bins : int, optional
+        Number of ESD bins for each phase.
+    periodic : bool, optional
+        If True, grains are considered to be continuous across the volume element
+        boundaries.
+
+    Returns
+    -------
+    phase_statistics : list of dict
+        Phase statistics in the format of the `generate_volume_element` task's
+        `phase_statistics` input. For each "primary" phase, the ESD log-normal
+        distribution is fit to the grain ESDs, with cut-offs that include the smallest
+        and largest grains, and the `b/a`, `c/a` and `omega3` beta distributions and the
+        `neighbours` log-normal distribution are fit within each ESD bin. Within bins
+        that contain too few grains, the fit to all grains of the phase is used.
+
+    Notes
+    -----
+    Beta distributions are fit using the method of moments. Grain neighbour counts are
+    face-neighbour counts.
+
+    """
+    phase_types = phase_types or {}
+    element_material_idx = np.asarray(volume_element['element_material_idx'])
+    _, grain_phase, _ = _get_grain_data(volume_element)
+
+    grain_stats = get_grain_statistics(
+        element_material_idx,
+        volume_element.get('size'),
+        periodic,
+    )
+    grain_shapes = get_grain_shapes(
+        element_material_idx,
+        volume_element.get('size'),
+        periodic,
+    )
+    grain_vals = {
+        'b/a': grain_shapes['b/a'],
+        'c/a': grain_shapes['c/a'],
+        'omega3': grain_shapes['omega3'],
+        'neighbours': grain_stats['num_neighbours'].astype(float),
+    }
+    num_elems = grain_stats['num_elements']
+    total_elems = np.sum(num_elems)
+
+    phase_statistics = []
+    for phase_label in np.unique(grain_phase):
+
+        err_msg = f'Problem with phase "{phase_label}": '
+        phase_type = phase_types.get(phase_label, 'primary')
+        if phase_type not in ('primary', 'matrix'):
+            raise ValueError(err_msg + f'Phase type "{phase_type}" cannot be fit; must '
+                             f'be one of "primary" or "matrix".')
+
+        in_phase = np.logical_and(grain_phase == phase_label, num_elems > 0)
+        phase_stats = {
+            'type': phase_type,
+            'name': str(phase_label),
+            'crystal_structure': crystal_structures[phase_label],
+            'volume_fraction': float(np.sum(num_elems[in_phase]) / total_elems),
+        }
+        if phase_type == 'matrix':
+            phase_statistics.append(phase_stats)
+            continue
+
+        ESD = grain_stats['ESD'][in_phase]
+        log_mean, log_stddev = _fit_lognormal(ESD)
+        if np.isnan(log_stddev) or log_stddev == 0:
+            raise ValueError(err_msg + f'At least two grains of different sizes are '
+                             f'required to fit the ESD distribution.')
+
+        # Cut-offs that include all grains:
+        min_cut_off = (log_mean - np.log(np.min(ESD))) / log_stddev
+        max_cut_off = (np.log(np.max(ESD)) - log_mean) / log_stddev
+        bin_step_size = (np.max(ESD) - np.min(ESD)) / num_bins
+        bin_idx = np.clip(
+            np.floor((ESD - np.min(ESD)) / bin_step_size).astype(int),
+            0,
+            num_bins - 1,
+        )
+
+        size_dist = {
+            'ESD_log_mean': float(log_mean),
+            'ESD_log_stddev': float(log_stddev),
+            'ESD_log_stddev_min_cut_off': float(min_cut_off),
+            'ESD_log_stddev_max_cut_off': float(max_cut_off),
+            'num_bins': num_bins,
+        }
+        for dist_key, vals in grain_vals.items():
+            vals = vals[in_phase]
+            fit_func = _fit_lognormal if dist_key == 'neighbours' else _fit_beta_moments
+            all_params = fit_func(vals)
+            if np.isnan(all_params[0]):
+                # Leave the distribution unspecified, so the defaults are used:
+                continue
+            params = np.array([fit_func(vals[bin_idx == i]) for i in range(num_bins)])
+            params[np.isnan(params[:, 0])] = all_params
+            param_names = ('average', 'stddev') if dist_key == 'neighbours' else (
+                'alpha', 'beta')
+            size_dist[dist_key] = {
+                name: params[:, i].tolist() for i, name in enumerate(param_names)
+            }
+
+        phase_stats['size_distribution'] = size_dist
+        phase_statistics.append(phase_stats)
+
+    return phase_statistics
+
+
+def get_element_material_idx_checksum(element_material_idx):
+    """Find the SHA-256 digest of the shape and (int64) values of an
+    `element_material_idx` array, as an array of bytes."""
+    element_material_idx = np.ascontiguousarray(element_material_idx, dtype=np.int64)
+    digest = hashlib.sha256(np.array(element_material_idx.shape, dtype=np.int64))
+    digest.update(element_material_idx)
+    return np.frombuffer(digest.digest(), dtype=np.uint8)
+
+
+def get_grain_voxel_index(element_material_idx, num_grains=None):
+    """Build a compressed sparse row (CSR) style index of the voxels of each grain.
+
+    Parameters
+    ----------
+    element_material_idx : ndarray of shape (Nx, Ny, Nz) of int
+    num_grains : int, optional
+        Number of grains; by default, one more than the largest grain index.
+
+    Returns
+    -------
+    grain_voxel_index : dict
+        Dict with keys:
+            voxel_idx : ndarray of shape (Nx * Ny * Nz,) of int
+                Flat (C-order) voxel indices, sorted (stably) by grain index.
+            offsets : ndarray of shape (num_grains + 1,) of int
+                The voxels of grain `g` are `voxel_idx[offsets[g]:offsets[g + 1]]`.
+            grid_size : ndarray of shape (3,) of int
+            checksum : ndarray of shape (32,) of uint8
+                Checksum of `element_material_idx` (see
+                `get_element_material_idx_checksum`), used to validate cached indices.
+
+    """
+    element_material_idx = np.asarray(element_material_idx)
+    flat_idx = element_material_idx.reshape(-1)
+    if num_grains is None:
+        num_grains = flat_idx.max() + 1
+
+    grain_voxel_index = {
+        'voxel_idx': np.argsort(flat_idx, kind='stable'),
+        'offsets': np.concatenate([
+            [0],
+            np.cumsum(np.bincount(flat_idx, minlength=num_grains)),
+        ]),
+        'grid_size': np.array(element_material_idx.shape),
+        'checksum': get_element_material_idx_checksum(element_material_idx),
+    }
+    return grain_voxel_index
+
+
+def get_grain_voxels(grain_voxel_index, grain_idx, subscripts=False):
+    """Get the voxels of a grain from a grain-voxel index.
+
+    Parameters
+    ----------
+    grain_voxel_index : dict
+        As returned by `get_grain_voxel_index`.
+    grain_idx : int
+    subscripts : bool, optional
+        If True, return voxel subscripts of shape (3, N), suitable for indexing into
+        an array of shape `grid_size`. Otherwise, return flat voxel indices of shape
+        (N,).
+
+    Returns
+    -------
+    voxels : ndarray of int
+
+    """
+    offsets = grain_voxel_index['offsets']
+    voxels = grain_voxel_index['voxel_idx'][offsets[grain_idx]:offsets[grain_idx + 1]]
+    if subscripts:
+        voxels = np.array(np.unravel_index(voxels, grain_voxel_index['grid_size']))
+    return voxels
+
+
+def write_grain_voxel_index(grain_voxel_index, path):
+    """Write a grain-voxel index to an HDF5 file."""
+    with h5py.File(path, mode='w') as fh:
+        for key, val in grain_voxel_index.items():
+            fh.create_dataset(key, data=val)
+
+
+def read_grain_voxel_index(path):
+    """Read a grain-voxel index from an HDF5 file."""
+    with h5py.File(path, mode='r') as fh:
+        grain_voxel_index = {key: fh[key][()] for key in fh}
+    return grain_voxel_index
+
+
+def load_grain_voxel_index(path, element_material_idx):
+    """Read a grain-voxel index from an HDF5 file if it exists and was built from the
+    same `element_material_idx` (by comparing checksums); otherwise build it and write
+    it to the file."""
+
+    element_material_idx = np.asarray(element_material_idx)
+    try:
+        grain_voxel_index = read_grain_voxel_index(path)
+        if np.array_equal(
+            grain_voxel_index['checksum'],
+            get_element_material_idx_checksum(element_material_idx),
+        ):
+            return grain_voxel_index
+    except (OSError, KeyError):
+        pass
+
+    grain_voxel_index = get_grain_voxel_index(element_material_idx)
+    write_grain_voxel_index(grain_voxel_index, path)
+    return grain_voxel_index
+
+
+def _get_grain_boundary_indicator(element_material_idx):
+    """Find the elements that have at least one (periodic) face-neighbour in a
+    different grain."""
+    is_GB = np.zeros(element_material_idx.shape, dtype=bool)
+    for axis in range(3):
+        for shift in (-1, 1):
+            is_GB |= element_material_idx != np.roll(element_material_idx, shift, axis)
+    return is_GB
+
+
+def get_two_point_statistics(element_material_idx, grain_phase_label, size=None,
+                             grain_boundaries=True, cross_correlations=True,
+                             radial_bin_size=None, dtype=np.float32, full=False,
+                             workers=None):
+    """Compute periodic two-point correlation functions of the phase (and grain
+    boundary) indicator fields of a volume element using FFTs.
+
+    Parameters
+    ----------
+    element_material_idx : ndarray of shape (Nx, Ny, Nz) of int
+    grain_phase_label : ndarray of shape (M,) of str
+        Phase label of each grain; for a single-constituent-per-material volume
+        element, this is `constituent_phase_label`.
+    size : list of float, optional
+        Size of the volume element; by default, a unit cube.
+    grain_boundaries : bool, optional
+        If True, include a grain boundary indicator field, which is one for elements
+        with at least one face-neighbour in a different grain.
+    cross_correlations : bool, optional
+        If True, compute cross-correlations between each pair of fields, in addition
+        to the autocorrelations.
+    radial_bin_size : float, optional
+        Radial distance bin size for the radially averaged correlations; by default,
+        the smallest element dimension.
+    dtype : numpy dtype, optional
+        Floating point type of the transforms, stored spectra and returned
+        correlations. The default, float32, halves the memory required for large grids,
+        and the transforms are computed in single precision.
+    full : bool, optional
+        If True, include the full (Nx, Ny, Nz) correlation functions.
+    workers : int, optional
+        Maximum number of workers for the parallel FFTs (see `scipy.fft.rfftn`).
+
+    Returns
+    -------
+    two_point_stats : dict
+        Dict with keys:
+            fields : list of str
+                Names of the F fields: the phase labels and, optionally,
+                "grain_boundary".
+            volume_fractions : ndarray of shape (F,) of float
+            pairs : ndarray of shape (P, 2) of int
+                Field indices of each of the P correlation functions.
+            radial_distance : ndarray of shape (R,) of float
+                Mean separation distance within each non-empty radial bin, up to half
+                the smallest volume element dimension.
+            radial_correlations : ndarray of shape (P, R) of float
+                Radially averaged correlation functions.
+            correlation_length : ndarray of shape (F,) of float
+                For each field, the radial distance at which the normalised
+                autocorrelation, (f(r) - v^2) / (v - v^2), for volume fraction v,
+                first falls below 1/e.
+            residual_correlation : ndarray of shape (F,) of float
+                For each field, the maximum absolute normalised autocorrelation over
+                the outer half of the radial distances. Values much smaller than one
+                indicate the volume element is large enough to capture the decay of
+                the correlations.
+            correlations : ndarray of shape (P, Nx, Ny, Nz) of float, optional
+                Correlation functions, where the first element is at zero separation.
+                Only included if `full` is True.
+
+    Notes
+    -----
+    The correlation of fields `i` and `j` at separation `r` is the mean over all
+    elements `x` of `field_i(x) * field_j(x + r)`. Real-input (half-spectrum) FFTs of
+    `scipy.fft` are used, which, unlike those of `numpy.fft`, retain single precision.
+
+    """
+    element_material_idx = np.asarray(element_material_idx)
+    grid_size = np.array(element_material_idx.shape)
+    size = np.ones(3) if size is None else np.asarray(size, dtype=float)
+    resolution = size / grid_size
+
+    phase_labels, grain_phase_idx = np.unique(grain_phase_label, return_inverse=True)
+    element_phase_idx = grain_phase_idx[element_material_idx]
+    fields = [str(i) for i in phase_labels]
+    indicators = [element_phase_idx == i for i in range(len(phase_labels))]
+    if grain_boundaries:
+        fields.append('grain_boundary')
+        indicators.append(_get_grain_boundary_indicator(element_material_idx))
+
+    num_fields = len(fields)
+    num_elems = element_material_idx.size
+    spectra = [fft.rfftn(i.astype(dtype), workers=workers) for i in indicators]
+    vol_fracs = np.array([np.mean(i) for i in indicators])
+
+    if cross_correlations:
+        pairs = np.array(np.triu_indices(num_fields)).T
+    else:
+        pairs = np.repeat(np.arange(num_fields)[:, None], 2, axis=1)
+
+    # Minimum-image radial distance of each separation:
+    dists_1D = [
+        np.minimum(np.arange(n), n - np.arange(n)) * res
+        for n, res in zip(grid_size, resolution)
+    ]
+    dists = np.sqrt(sum(np.square(i) for i in np.ix_(*dists_1D)))
+    radial_bin_size = radial_bin_size or np.min(resolution)
+    max_dist = np.min(size) / 2
+    radial_idx = np.floor(dists / radial_bin_size).astype(int).reshape(-1)
+    num_radial = int(np.floor(max_dist / radial_bin_size)) + 1
+    in_range = radial_idx < num_radial
+    radial_counts = np.bincount(radial_idx[in_range], minlength=num_radial)
+    has_radial = radial_counts > 0
+
+    correlations = []
+    radial_corrs = np.zeros((len(pairs), np.sum(has_radial)))
+    for pair_idx, (i, j) in enumerate(pairs):
+        corr = fft.irfftn(
+            np.conj(spectra[i]) * spectra[j],
+            s=element_material_idx.shape,
+            workers=workers,
+        )
+        corr /= num_elems
+        radial_sum = np.bincount(
+            radial_idx[in_range],
+            weights=corr.reshape(-1)[in_range],
+            minlength=num_radial,
+        )
+        radial_corrs[pair_idx] = (radial_sum / np.maximum(radial_counts, 1))[has_radial]
+        if full:
+            correlations.append(corr)
+
+    radial_dist = np.bincount(
+        radial_idx[in_range],
+        weights=dists.reshape(-1)[in_range],
+        minlength=num_radial,
+    )[has_radial] / radial_counts[has_radial]
+
+    # Normalised autocorrelations, which decay from one to zero:
+    auto_idx = np.flatnonzero(pairs[:, 0] == pairs[:, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        norm_auto = (
+            (radial_corrs[auto_idx] - vol_fracs[:, None] ** 2) /
+            (vol_fracs - vol_fracs ** 2)[:, None]
+        )
+    below = norm_auto < np.exp(-1)
+    corr_length = np.where(
+        np.any(below, axis=1),
+        radial_dist[np.argmax(below, axis=1)],
+        np.nan,
+    )
+    outer = radial_dist >= (max_dist / 2)
+    residual = np.max(np.abs(norm_auto[:, outer]), axis=1, initial=0)
+
+    two_point_stats = {
+        'fields': fields,
+        'volume_fractions': vol_fracs,
+        'pairs': pairs,
+        'radial_distance': radial_dist,
+        'radial_correlations': radial_corrs.astype(dtype),
+        'correlation_length': corr_length,
+        'residual_correlation': residual,
+    }
+    if full:
+        two_point_stats['correlations'] = np.array(correlations)
+
+    return two_point_stats
+
+
+def get_precipitate_statistics(element_material_idx, grain_phase_idx, precipitate_phase,
+                               size=None, periodic=True, min_distance=0,
+                               max_distance=None, num_bins=50):
+    """Find the radial distribution function (RDF) of the centroids of a precipitate
+    phase, and the fraction of precipitates that lie on grain boundaries.
+
+    Parameters
+    ----------
+    element_material_idx : ndarray of shape (Nx, Ny, Nz) of int
+    grain_phase_idx : ndarray of shape (M,) of int
+        Phase index of each of the M grains.
+    precipitate_phase : int
+        Phase index of the precipitate phase.
+    size : list of float, optional
+        Size of the volume element; by default, a unit cube.
+    periodic : bool, optional
+        If True, centroids and distances are found using periodic boundary conditions.
+    min_distance : float, optional
+        Minimum centroid separation distance of the RDF.
+    max_distance : float, optional
+        Maximum centroid separation distance of the RDF. By default, half the smallest
+        volume element dimension.
+    num_bins : int, optional
+        Number of RDF distance bins.
+
+    Returns
+    -------
+    precipitate_statistics : dict
+        Dict with keys:
+            num_precipitates : int
+            centroids : ndarray of shape (N, 3) of float
+                Centroids of the N precipitates.
+            RDF_bin_edges : ndarray of shape (num_bins + 1,) of float
+            pair_counts : ndarray of shape (num_bins,) of int
+                Number of (unordered) pairs of precipitates with centroid separation
+                distances within each bin.
+            RDF : ndarray of shape (num_bins,) of float
+                Pair counts normalised by those expected for the same number of
+                uniformly random (ideal gas) centroids in the volume element, such that
+                the RDF tends to one at large distances.
+            on_boundary : ndarray of shape (N,) of bool
+                Whether each precipitate shares element faces with at least two
+                distinct grains of other (non-precipitate) phases.
+            number_fraction_on_boundary : float
+
+    Notes
+    -----
+    Separations are counted with a k-d tree (periodic if `periodic`) in a single
+    pass over all bins, so this scales to many thousands of precipitates.
+
+    """
+    element_material_idx = np.asarray(element_material_idx)
+    grain_phase_idx = np.asarray(grain_phase_idx)
+    size = np.ones(3) if size is None else np.asarray(size, dtype=float)
+    if max_distance is None:
+        max_distance = np.min(size) / 2
+
+    grain_stats = get_grain_statistics(element_material_idx, size, periodic)
+    is_precip = np.logical_and(
+        grain_phase_idx == precipitate_phase,
+        grain_stats['num_elements'] > 0,
+    )
+    precip_idx = np.flatnonzero(is_precip)
+    centroids = grain_stats['centroid'][precip_idx]
+    num_precips = precip_idx.size
+
+    bin_edges = np.linspace(min_distance, max_distance, num_bins + 1)
+    if periodic:
+        tree = cKDTree(np.mod(centroids, size), boxsize=size)
+    else:
+        tree = cKDTree(centroids)
+    cumulative_counts = tree.count_neighbors(tree, bin_edges)
+    pair_counts = np.diff(cumulative_counts) // 2  # counted as ordered pairs
+
+    # Expected unordered pair counts for uniformly distributed centroids:
+    shell_vols = 4 / 3 * np.pi * np.diff(bin_edges ** 3)
+    num_density = num_precips / np.prod(size)
+    expected = 0.5 * num_precips * num_density * shell_vols
+    with np.errstate(invalid='ignore', divide='ignore'):
+        RDF = pair_counts / expected
+
+    # Precipitates on boundaries touch at least two distinct non-precipitate grains:
+    adjacency = get_grain_adjacency(element_material_idx, size, periodic)
+    is_other = ~is_precip[adjacency['col']]
+    num_other_nbrs = np.bincount(
+        adjacency['row'][is_other],
+        minlength=grain_phase_idx.size,
+    )
+    on_boundary = num_other_nbrs[precip_idx] >= 2
+
+    precipitate_statistics = {
+        'num_precipitates': num_precips,
+        'centroids': centroids,
+        'RDF_bin_edges': bin_edges,
+        'pair_counts': pair_counts,
+        'RDF': RDF,
+        'on_boundary': on_boundary,
+        'number_fraction_on_boundary': (
+            float(np.mean(on_boundary)) if num_precips else np.nan
+        ),
+    }
+    return precipitate_statistics
+
+
+def _get_symmetric_poles(pole, crystal_structure):
+    """Find the distinct symmetric equivalents (up to sign) of a crystal direction."""
+    pole = np.asarray(pole, dtype=float)
+    pole = pole / np.linalg.norm(pole)
+    sym_quats = get_symmetry_quaternions(crystal_structure)
+    equiv = multiply_quaternions_batch(
+        multiply_quaternions_batch(_conjugate(sym_quats), np.append(0, pole)),
+        sym_quats,
+    )[:, 1:]
+    # Antipodal directions give the same pole figure point:
+    first_nonzero = np.argmax(~np.isclose(equiv, 0), axis=1)
+    equiv[equiv[np.arange(equiv.shape[0]), first_nonzero] < 0] *= -1
+    return np.unique(np.round(equiv, 10), axis=0)
+
+
+def get_texture_histograms(quats, weights, crystal_structure, P=1, euler_bin_size=5,
+                           poles=None, pole_figure_bin_size=5,
+                           chunk_size=TEXTURE_CHUNK_SIZE):
+    """Compute weighted Euler-space orientation histograms and pole figure densities.
+
+    Parameters
+    ----------
+    quats : ndarray of shape (N, 4) of float
+        Orientations as scalar-vector unit quaternions (e.g. one per grain).
+    weights : ndarray of shape (N,) of float
+        Weight of each orientation (e.g. grain volumes).
+    crystal_structure : str
+        One of "cubic" or "hexagonal".
+    P : int, optional
+        The "P" constant, either +1 or -1, as defined within [1].
+    euler_bin_size : float, optional
+        Width of the Euler angle bins in degrees.
+    poles : list of list of float, optional
+        Crystal directions for which pole figures are computed, as Cartesian vectors in
+        the crystal frame with x//a (hexagonal Miller-Bravais indices must be converted
+        first). By default, `DEFAULT_POLES` of the crystal structure.
+    pole_figure_bin_size : float, optional
+        Width of the polar and azimuthal pole figure bins in degrees.
+    chunk_size : int, optional
+        Maximum number of orientations processed at once.
+
+    Returns
+    -------
+    texture : dict
+        Dict with keys:
+            euler_bin_edges : list of ndarray of float
+                Bin edges (degrees) of each Bunge Euler angle, within the
+                symmetry-reduced Euler space (`REDUCED_EULER_LIMITS`).
+            euler_histogram : ndarray of shape (N1, N2, N3) of float
+                Weight fraction in each Euler bin.
+            euler_MRD : ndarray of shape (N1, N2, N3) of float
+                Orientation density in each Euler bin, in multiples of a random
+                distribution (MRD).
+            pole_figures : list of dict
+                For each pole: `pole`, `polar_bin_edges` and `azimuthal_bin_edges`
+                (degrees, from and about the sample Z axis, upper hemisphere),
+                `histogram` (weight fraction of pole directions in each bin) and `MRD`.
+
+    Notes
+    -----
+    Each orientation is expanded into its crystal-symmetric equivalents, and its weight
+    is shared equally between the equivalents that lie in the reduced Euler space;
+    similarly, for pole figures, the weight is shared between the distinct symmetric
+    equivalents of each pole. Histograms are accumulated by `np.bincount` on flattened
+    bin indices. Densities are normalised by the invariant measure of each bin
+    (proportional to `sin(Phi)` in Euler space, and to `sin(polar angle)` on the
+    hemisphere).
+
+    References
+    ----------
+    [1] Rowenhorst, D, A D Rollett, G S Rohrer, M Groeber, M Jackson,
+        P J Konijnenberg, and M De Graef. "Consistent Representations
+        of and Conversions between 3D Rotations". Modelling and Simulation
+        in Materials Science and Engineering 23, no. 8 (1 December 2015):
+        083501. https://doi.org/10.1088/0965-0393/23/8/083501.
+
+    """
+    quats = np.asarray(quats, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    weights = weights / np.sum(weights)
+    sym_quats = get_symmetry_quaternions(crystal_structure)
+    if poles is None:
+        poles = DEFAULT_POLES[crystal_structure]
+
+    Phi_max, phi2_max = REDUCED_EULER_LIMITS[crystal_structure]
+    euler_bin_edges = [
+        np.arange(0, 360 + euler_bin_size / 2, euler_bin_size),
+        np.arange(0, Phi_max + euler_bin_size / 2, euler_bin_size),
+        np.arange(0, phi2_max + euler_bin_size / 2, euler_bin_size),
+    ]
+    euler_shape = tuple(i.size - 1 for i in euler_bin_edges)
+    polar_edges = np.arange(0, 90 + pole_figure_bin_size / 2, pole_figure_bin_size)
+    azimuth_edges = np.arange(0, 360 + pole_figure_bin_size / 2, pole_figure_bin_size)
+    PF_shape = (polar_edges.size - 1, azimuth_edges.size - 1)
+    sym_poles = [_get_symmetric_poles(i, crystal_structure) for i in poles]
+
+    def get_flat_bin_idx(angles, bin_size, shape):
+        bin_idx = np.minimum((angles / bin_size).astype(int), np.array(shape) - 1)
+        return np.ravel_multi_index(tuple(bin_idx.T), shape)
+
+    euler_hist = np.zeros(np.prod(euler_shape))
+    PF_hists = [np.zeros(np.prod(PF_shape)) for _ in poles]
+    for start in range(0, quats.shape[0], chunk_size):
+        quats_i = quats[start:start + chunk_size]
+        weights_i = weights[start:start + chunk_size]
+        num_i = quats_i.shape[0]
+
+        # Symmetric equivalents, of shape (num_i, K, 4):
+        equiv = multiply_quaternions_batch(sym_quats[None], quats_i[:, None], P=P)
+        eulers = quat2euler(equiv.reshape(-1, 4), degrees=True, P=P)
+        in_reduced = np.logical_and(eulers[:, 1] <= Phi_max, eulers[:, 2] < phi2_max)
+        num_reduced = np.sum(in_reduced.reshape(num_i, -1), axis=1)
+        equiv_weights = np.repeat(weights_i / np.maximum(num_reduced, 1), sym_quats.shape[0])
+        euler_hist += np.bincount(
+            get_flat_bin_idx(eulers[in_reduced], euler_bin_size, euler_shape),
+            weights=equiv_weights[in_reduced],
+            minlength=euler_hist.size,
+        )
+
+        # Crystal axes in the sample frame (columns), of shape (num_i, 3, 3):
+        axes = np.stack([
+            multiply_quaternions_batch(
+                multiply_quaternions_batch(_conjugate(quats_i), basis, P=P),
+                quats_i,
+                P=P,
+            )[:, 1:]
+            for basis in np.eye(4)[1:]
+        ], axis=-1)
+        for PF_hist, sym_poles_j in zip(PF_hists, sym_poles):
+            dirs = np.einsum('nij,ej->nei', axes, sym_poles_j).reshape(-1, 3)
+            dirs[dirs[:, 2] < 0] *= -1  # upper hemisphere
+            polar = np.rad2deg(np.arccos(np.clip(dirs[:, 2], -1, 1)))
+            azimuth = np.rad2deg(np.arctan2(dirs[:, 1], dirs[:, 0])) % 360
+            PF_hist += np.bincount(
+                get_flat_bin_idx(
+                    np.column_stack([polar, azimuth]),
+                    pole_figure_bin_size,
+                    PF_shape,
+                ),
+                weights=np.repeat(weights_i / sym_poles_j.shape[0], sym_poles_j.shape[0]),
+                minlength=PF_hist.size,
+            )
+
+    # Fraction of the invariant measure within each bin:
+    d_cos_Phi = -np.diff(np.cos(np.deg2rad(euler_bin_edges[1])))
+    euler_bin_measure = (
+        np.diff(euler_bin_edges[0])[:, None, None] *
+        d_cos_Phi[None, :, None] *
+        np.diff(euler_bin_edges[2])[None, None, :]
+    ) / (360 * phi2_max * (1 - np.cos(np.deg2rad(Phi_max))))
+    d_cos_polar = -np.diff(np.cos(np.deg2rad(polar_edges)))
+    PF_bin_measure = d_cos_polar[:, None] * np.diff(azimuth_edges)[None, :] / 360
+
+    euler_hist = euler_hist.reshape(euler_shape)
+    texture = {
+        'euler_bin_edges': euler_bin_edges,
+        'euler_histogram': euler_hist,
+        'euler_MRD': euler_hist / euler_bin_measure,
+        'pole_figures': [
+            {
+                'pole': np.asarray(pole, dtype=float),
+                'polar_bin_edges': polar_edges,
+                'azimuthal_bin_edges': azimuth_edges,
+                'histogram': PF_hist.reshape(PF_shape),
+                'MRD': PF_hist.reshape(PF_shape) / PF_bin_measure,
+            }
+            for pole, PF_hist in zip(poles, PF_hists)
+        ],
+    }
+    return texture
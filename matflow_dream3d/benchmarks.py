@@ -0,0 +1,201 @@
+"""Timing benchmarks for the orientation kernels of `utilities`, and for Laguerre
+tessellation labelling in `tessellation`.
+
+Run with `python -m matflow_dream3d.benchmarks`.
+
+"""
+
+from timeit import default_timer
+
+import numpy as np
+
+from matflow_dream3d.tessellation import get_laguerre_labels, LAGUERRE_BLOCK_SIZE
+from matflow_dream3d.utilities import (
+    disorientation_angles,
+    pairwise_disorientation_angles,
+    get_random_quaternions,
+    sample_ESDs,
+    DISORIENTATION_CHUNK_SIZE,
+)
+
+# Realistic problem sizes: voxel-pair counts of segmented volume elements, and grain
+# counts for pairwise (grain-grain) comparisons:
+ELEMENT_WISE_SIZES = (10 ** 5, 10 ** 6, 4 * 10 ** 6)
+PAIRWISE_SIZES = (500, 2000)
+CHUNK_SIZES = (2 ** 16, DISORIENTATION_CHUNK_SIZE, 2 ** 20)
+
+# Cubic grid sizes, and mean grain volumes (in elements), of Laguerre tessellations:
+LAGUERRE_GRID_SIZES = (64, 128, 256)
+LAGUERRE_GRAIN_VOLUMES = (300, 2500)
+LAGUERRE_BLOCK_SIZES = (4, LAGUERRE_BLOCK_SIZE, 16)
+
+
+def _time(func, repeats):
+    """Find the minimum wall time of `repeats` calls of `func`."""
+    times = []
+    for _ in range(repeats):
+        start = default_timer()
+        func()
+        times.append(default_timer() - start)
+    return min(times)
+
+
+def benchmark_disorientations(crystal_structures=('cubic', 'hexagonal'),
+                              element_wise_sizes=ELEMENT_WISE_SIZES,
+                              pairwise_sizes=PAIRWISE_SIZES, chunk_sizes=CHUNK_SIZES,
+                              repeats=3, RNG_seed=0):
+    """Time `disorientation_angles` and `pairwise_disorientation_angles` over a range of
+    problem and chunk sizes.
+
+    Parameters
+    ----------
+    crystal_structures : tuple of str, optional
+    element_wise_sizes : tuple of int, optional
+        Numbers of orientation pairs for element-wise disorientations.
+    pairwise_sizes : tuple of int, optional
+        Numbers of orientations, N, of each array for N x N pairwise disorientations.
+    chunk_sizes : tuple of int, optional
+    repeats : int, optional
+        Number of calls of each case; the minimum time is reported.
+    RNG_seed : int, optional
+
+    Returns
+    -------
+    results : list of dict
+        For each case, the `function`, `crystal_structure`, `size` (number of
+        orientation pairs), `chunk_size`, `time` (seconds) and `pairs_per_second`.
+
+    """
+    rng = np.random.default_rng(RNG_seed)
+    results = []
+
+    def add_result(function, crystal_structure, size, chunk_size, time):
+        results.append({
+            'function': function,
+            'crystal_structure': crystal_structure,
+            'size': size,
+            'chunk_size': chunk_size,
+            'time': time,
+            'pairs_per_second': size / time,
+        })
+
+    for crystal_structure in crystal_structures:
+        for num in element_wise_sizes:
+            quats_a = get_random_quaternions(num, rng)
+            quats_b = get_random_quaternions(num, rng)
+            for chunk_size in chunk_sizes:
+                time = _time(
+                    lambda: disorientation_angles(
+                        quats_a,
+                        quats_b,
+                        crystal_structure,
+                        chunk_size=chunk_size,
+                    ),
+                    repeats,
+                )
+                add_result('disorientation_angles', crystal_structure, num,
+                           chunk_size, time)
+
+        for num in pairwise_sizes:
+            quats_a = get_random_quaternions(num, rng)
+            quats_b = get_random_quaternions(num, rng)
+            for chunk_size in chunk_sizes:
+                time = _time(
+                    lambda: pairwise_disorientation_angles(
+                        quats_a,
+                        quats_b,
+                        crystal_structure,
+                        chunk_size=chunk_size,
+                    ),
+                    repeats,
+                )
+                add_result('pairwise_disorientation_angles', crystal_structure,
+                           num ** 2, chunk_size, time)
+
+    return results
+
+
+def benchmark_laguerre_labels(grid_sizes=LAGUERRE_GRID_SIZES,
+                              grain_volumes=LAGUERRE_GRAIN_VOLUMES,
+                              block_sizes=LAGUERRE_BLOCK_SIZES, periodic=True,
+                              repeats=3, RNG_seed=0):
+    """Time `get_laguerre_labels` over a range of grid sizes, grain sizes and block
+    sizes.
+
+    Parameters
+    ----------
+    grid_sizes : tuple of int, optional
+        Numbers of elements, N, along each axis of N x N x N grids.
+    grain_volumes : tuple of int, optional
+        Mean grain volumes, in elements. Seed weights are the squared radii of
+        equivalent spheres sampled from a log-normal distribution (with a log standard
+        deviation of 0.3), until the total volume of the spheres reaches the grid
+        volume.
+    block_sizes : tuple of int, optional
+    periodic : bool, optional
+    repeats : int, optional
+        Number of calls of each case; the minimum time is reported.
+    RNG_seed : int, optional
+
+    Returns
+    -------
+    results : list of dict
+        For each case, the `grid_size` (N), `grain_volume`, `num_seeds`, `block_size`,
+        `time` (seconds) and `elements_per_second`.
+
+    """
+    rng = np.random.default_rng(RNG_seed)
+    results = []
+    for grid_size in grid_sizes:
+        size = np.full(3, grid_size, dtype=float)
+        for grain_volume in grain_volumes:
+            ESD = sample_ESDs(
+                {'ESD_mean': np.cbrt(6 * grain_volume / np.pi), 'ESD_log_stddev': 0.3,
+                 'num_bins': 1},
+                rng,
+                volume=np.prod(size),
+            )
+            seeds = rng.random((ESD.size, 3)) * size
+            for block_size in block_sizes:
+                time = _time(
+                    lambda: get_laguerre_labels(
+                        seeds,
+                        (ESD / 2) ** 2,
+                        [grid_size] * 3,
+                        size,
+                        periodic=periodic,
+                        block_size=block_size,
+                    ),
+                    repeats,
+                )
+                results.append({
+                    'grid_size': grid_size,
+                    'grain_volume': grain_volume,
+                    'num_seeds': ESD.size,
+                    'block_size': block_size,
+                    'time': time,
+                    'elements_per_second': grid_size ** 3 / time,
+                })
+
+    return results
+
+
+if __name__ == '__main__':
+    print(f'{"function":<32}{"crystal":<11}{"pairs":>10}{"chunk":>10}{"time / s":>10}'
+          f'{"pairs / s":>12}')
+    for result in benchmark_disorientations():
+        print(
+            f'{result["function"]:<32}{result["crystal_structure"]:<11}'
+            f'{result["size"]:>10}{result["chunk_size"]:>10}{result["time"]:>10.3f}'
+            f'{result["pairs_per_second"]:>12.3g}'
+        )
+
+    print(f'\n{"function":<32}{"grid":>6}{"grain vol.":>12}{"seeds":>9}{"block":>7}'
+          f'{"time / s":>10}{"elems / s":>12}')
+    for result in benchmark_laguerre_labels():
+        print(
+            f'{"get_laguerre_labels":<32}{result["grid_size"]:>6}'
+            f'{result["grain_volume"]:>12}{result["num_seeds"]:>9}'
+            f'{result["block_size"]:>7}{result["time"]:>10.3f}'
+            f'{result["elements_per_second"]:>12.3g}'
+        )
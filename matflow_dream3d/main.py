@@ -12,8 +12,44 @@ import numpy as np
 from damask_parse.utils import validate_orientations, validate_volume_element
 from damask_parse.quats import axang2quat, multiply_quaternions
 
-from matflow_dream3d import input_mapper, output_mapper
-from matflow_dream3d.utilities import quat2euler, process_dream3D_euler_angles
+from matflow_dream3d import input_mapper, output_mapper, func_mapper
+from matflow_dream3d.analysis import (
+    compare_labelings,
+    get_grain_statistics,
+    get_grain_shapes,
+    get_statistics_fidelity,
+    load_grain_voxel_index,
+    get_grain_adjacency,
+    get_grain_boundary_mesh,
+    write_grain_boundary_mesh,
+    get_two_point_statistics,
+    get_precipitate_statistics,
+    get_texture_histograms,
+)
+from matflow_dream3d.utilities import (
+    quat2euler,
+    process_dream3D_euler_angles,
+    process_dream3D_quaternions,
+    get_grain_mean_orientations,
+    get_kernel_average_misorientation,
+    get_ESD_bins,
+    sample_ODF_orientations,
+    DREAM3D_CRYSTAL_STRUCTURES,
+    DISTRIBUTIONS_MAP,
+    ODF_CUBIC_PRESETS,
+)
+from matflow_dream3d.precipitates import (
+    get_precipitates_array,
+    format_precipitates,
+    check_precipitates,
+)
+from matflow_dream3d.tessellation import generate_laguerre_volume_element
+from matflow_dream3d.match_crystallography import match_crystallography
+from matflow_dream3d.transforms import (
+    tile_volume_element,
+    read_dream3D_region,
+    merge_small_grains,
+)
 from matflow_dream3d.preset_statistics import (
     generate_omega3_dist_from_preset,
     generate_shape_dist_from_preset,
@@ -21,12 +57,225 @@ from matflow_dream3d.preset_statistics import (
 )
 
 
+GRAIN_VOXEL_INDEX_FILE_SUFFIX = '_grain_voxel_index.hdf5'
+
+
+def _write_grain_voxel_index(path, element_material_idx):
+    """Write a grain-voxel index of a parsed volume element next to the Dream3D
+    output file at `path`, unless an index of the same volume element already exists
+    there."""
+    path = Path(path)
+    load_grain_voxel_index(
+        path.with_name(path.stem + GRAIN_VOXEL_INDEX_FILE_SUFFIX),
+        element_material_idx,
+    )
+
+
+def _read_element_material_idx(synth_vol, grid_size, resolution, crop_region=None):
+    """Read the zero-indexed grain index of each element, either of the full volume
+    element, or (as a hyperslab) of `crop_region` (a dict with optional `start` and
+    `stop` element subscripts), in which case grains are compactly renumbered."""
+
+    if not crop_region:
+        # make zero-indexed:
+        # (not sure why FeatureIds is 4D?)
+        element_material_idx = synth_vol['CellData']['FeatureIds'][()][..., 0] - 1
+        element_material_idx = element_material_idx.transpose((2, 1, 0))
+        grain_idx = np.arange(element_material_idx.max() + 1)
+        return element_material_idx, grain_idx, grid_size, None
+
+    element_material_idx, grain_idx = read_dream3D_region(
+        synth_vol['CellData']['FeatureIds'],
+        start=crop_region.get('start'),
+        stop=crop_region.get('stop'),
+    )
+    grid_size = np.array(element_material_idx.shape)
+    origin = np.asarray(resolution) * np.asarray(crop_region.get('start', [0, 0, 0]))
+    return element_material_idx, grain_idx, grid_size, origin
+
+
+def _sample_without_replacement(num_population, num_samples, rng):
+    """Sample (in random order) indices without replacement, using memory proportional
+    to `num_samples`, rather than `num_population`, when sampling a small fraction."""
+
+    if num_samples > num_population // 2:
+        # Prefix of a permutation:
+        return rng.permutation(num_population)[:num_samples]
+
+    # Draw with replacement, keeping the first occurrence of each index, until enough
+    # distinct indices are found:
+    sample = np.empty(0, dtype=int)
+    while sample.size < num_samples:
+        draws = np.concatenate([
+            sample,
+            rng.integers(num_population, size=2 * (num_samples - sample.size)),
+        ])
+        _, first_idx = np.unique(draws, return_index=True)
+        sample = draws[np.sort(first_idx)]
+    return sample[:num_samples]
+
+
+def _assign_phase_orientations(constituent_phase_label, phase_statistics,
+                               phase_orientations, rng):
+    """Assign (without replacement) orientations from a separate orientation set for each
+    phase to the grains of that phase. For phases without an orientation set,
+    orientations are sampled from the phase `ODF`.
+
+    Returns the combined orientations (with the quaternion `P` convention of the first
+    orientation set) and the orientation index of each grain.
+
+    """
+    phase_labels = [i['name'] for i in phase_statistics]
+    uniq_labels, grain_label_idx = np.unique(constituent_phase_label, return_inverse=True)
+    label_phase_idx = np.array([
+        phase_labels.index(i) if i in phase_labels else -1 for i in uniq_labels
+    ])
+    if np.any(label_phase_idx == -1):
+        raise ValueError(
+            f'Phase labels in the volume element are not in `phase_statistics`: '
+            f'{", ".join([f"{i}" for i in uniq_labels[label_phase_idx == -1]])}'
+        )
+    grain_phase_idx = label_phase_idx[grain_label_idx]
+    counts = np.bincount(grain_phase_idx, minlength=len(phase_labels))
+
+    oris = None
+    sampled_quats = []
+    for phase_idx, (phase_label, num_needed) in enumerate(zip(phase_labels, counts)):
+        if not num_needed:
+            continue
+        phase_oris = None
+        if phase_idx < len(phase_orientations):
+            phase_oris = phase_orientations[phase_idx]
+        if phase_oris is None:
+            ODF = phase_statistics[phase_idx].get('ODF')
+            if not ODF:
+                raise ValueError(f'No orientations or `ODF` given for phase '
+                                 f'{phase_label!r}, which has {num_needed} grains.')
+            phase_oris = sample_ODF_orientations(
+                ODF,
+                phase_statistics[phase_idx]['crystal_structure'],
+                num_needed,
+                rng,
+            )
+        phase_oris = validate_orientations(phase_oris)
+        quats = np.asarray(phase_oris['quaternions'])
+        if oris is None:
+            oris = copy.deepcopy(phase_oris)  # combined orientations
+        elif phase_oris['P'] != oris['P']:
+            quats = quats * np.array([1, -1, -1, -1])  # same rotations in other P
+
+        num_oris = quats.shape[0]
+        if num_oris < num_needed:
+            raise ValueError(
+                f'Insufficient number of orientations ({num_oris} given for phase '
+                f'{phase_label!r}, whereas {num_needed} needed).'
+            )
+        # If there are more orientations than grains, choose a random subset:
+        if num_oris != num_needed:
+            quats = quats[_sample_without_replacement(num_oris, num_needed, rng)]
+        sampled_quats.append(quats)
+
+    # Grains of each phase take consecutive orientations, in grain order:
+    ori_idx = np.empty(grain_phase_idx.size, dtype=int)
+    ori_idx[np.argsort(grain_phase_idx, kind='stable')] = np.arange(grain_phase_idx.size)
+
+    oris['quaternions'] = np.vstack(sampled_quats)
+    return oris, ori_idx
+
+
+def _get_requested_statistics(phase_statistics):
+    """Get the requested volume fractions and size and shape distributions of each
+    phase in `phase_statistics`, in the format of `analysis.get_statistics_fidelity`.
+
+    Distributions generated from a `preset_statistics_model` are randomised by the
+    pipeline writer, so are not included unless explicitly specified."""
+
+    requested = []
+    for phase_stats in phase_statistics:
+
+        phase_req = {
+            'name': phase_stats['name'],
+            'volume_fraction': phase_stats['volume_fraction'],
+        }
+        size_dist = phase_stats.get('size_distribution')
+        if size_dist:
+
+            ESD_bins = get_ESD_bins(size_dist)
+            num_bins = len(ESD_bins['bins'])
+            phase_req['ESD_bins'] = ESD_bins
+            phase_req['distributions'] = {}
+
+            for dist_key, dist_info in DISTRIBUTIONS_MAP.items():
+                if dist_key == 'neighbours' and phase_stats['type'] == 'precipitate':
+                    continue
+                dist = size_dist.get(dist_key)
+                if not dist:
+                    if phase_stats.get('preset_statistics_model'):
+                        continue
+                    dist = dist_info['default_keys']
+                phase_req['distributions'][dist_key] = {
+                    k: np.broadcast_to(np.reshape(v, -1), num_bins)
+                    for k, v in dist.items()
+                }
+
+        requested.append(phase_req)
+
+    return requested
+
+
+def _get_segmentation_voxel_orientations(container):
+    """Get voxel quaternions, voxel phases and the crystal structure of each phase from
+    a segmentation output container.
+
+    Array shapes follow the Dream3D (z, y, x) ordering of `FeatureIds`."""
+
+    # Quaternions are written in the vector-scalar convention used by Dream3D:
+    quats_VS = container['CellData']['quats'][()]
+    quats = np.roll(quats_VS, 1, axis=-1).astype(float)
+    phases = container['CellData']['Phase'][()][..., 0]
+
+    crystal_structures = container['EnsembleAttributeMatrix']['CrystalStructures'][()]
+    phase_crystal_structure = np.array([
+        DREAM3D_CRYSTAL_STRUCTURES.get(i, '') for i in crystal_structures.reshape(-1)
+    ])
+
+    return quats, phases, phase_crystal_structure
+
+
+def _get_segmentation_grain_orientations(container, element_material_idx):
+    """Find grain mean orientations and orientation spreads from the voxel quaternions
+    of a segmentation output container; `EBSDSegmentFeatures` does not generate any
+    feature-level orientations."""
+
+    num_grains = element_material_idx.max() + 1
+    grain_idx = element_material_idx.reshape(-1)
+    quats, phases, phase_crystal_structure = _get_segmentation_voxel_orientations(
+        container
+    )
+
+    # Phases are constant within a grain, so any element of a grain may be used:
+    grain_phase = np.zeros(num_grains, dtype=int)
+    grain_phase[grain_idx] = phases.reshape(-1)
+
+    # Voxel quaternions are the DAMASK quaternions written by
+    # `write_segment_grains_orientations_file`, so P = -1:
+    mean_quats, orientation_spread = get_grain_mean_orientations(
+        quats=quats.reshape(-1, 4),
+        grain_idx=grain_idx,
+        grain_crystal_structure=phase_crystal_structure[grain_phase],
+        P=-1,
+        degrees=True,
+    )
+    return grain_phase - 1, mean_quats, orientation_spread
+
+
 @output_mapper(
     output_name='volume_element',
     task='segment_grains',
     method='burn',
 )
-def parse_dream_3D_volume_element_segmentation(path):
+def parse_dream_3D_volume_element_segmentation(path, volume_element_response,
+                                               grain_voxel_index=False):
 
     with h5py.File(path, mode='r') as fh:
 
@@ -38,14 +287,20 @@ def parse_dream_3D_volume_element_segmentation(path):
         # make zero-indexed:
         # (not sure why FeatureIds is 4D?)
         element_material_idx = container['CellData']['FeatureIds'][()][..., 0] - 1
+
+        constituent_phase_idx, mean_quats, _ = _get_segmentation_grain_orientations(
+            container,
+            element_material_idx,
+        )
         element_material_idx = element_material_idx.transpose((2, 1, 0))  # reshape
 
         num_grains = element_material_idx.max() + 1
-        phase_names = container['CellEnsembleData']['PhaseName'][()][1:]
-        constituent_phase_idx = container['Grain Data']['Phases'][()][1:] - 1
-        constituent_phase_label = [phase_names[i][0].decode()
-                                   for i in constituent_phase_idx]
-        eulers = container['Grain Data']['EulerAngles'][()][1:]
+
+    # The segmentation pipeline defines no phase names; Dream3D phase numbers are the
+    # DAMASK phase indices (plus one), as written by
+    # `write_segment_grains_orientations_file`:
+    phase_names = volume_element_response['field_data']['phase']['meta']['phase_names']
+    constituent_phase_label = [phase_names[i] for i in constituent_phase_idx]
 
     vol_elem = {
         'grid_size': grid_size,
@@ -54,12 +309,33 @@ def parse_dream_3D_volume_element_segmentation(path):
         'constituent_material_idx': np.arange(num_grains),
         'constituent_phase_label': constituent_phase_label,
         'material_homog': ['SX'] * num_grains,
-        'orientations': process_dream3D_euler_angles(eulers),
+        'orientations': process_dream3D_quaternions(mean_quats, P=-1),
     }
     vol_elem = validate_volume_element(vol_elem)
+    if grain_voxel_index:
+        _write_grain_voxel_index(path, element_material_idx)
     return vol_elem
 
 
+@output_mapper(
+    output_name='grain_orientation_spread',
+    task='segment_grains',
+    method='burn',
+)
+def parse_dream_3D_segmentation_grain_orientation_spread(path):
+
+    with h5py.File(path, mode='r') as fh:
+        container = fh['DataContainers']['DataContainer']
+        element_material_idx = container['CellData']['FeatureIds'][()][..., 0] - 1
+        _, _, orientation_spread = _get_segmentation_grain_orientations(
+            container,
+            element_material_idx,
+        )
+
+    # in degrees, as `Grain Data/GrainOrientationSpread` would be in Dream3D:
+    return orientation_spread
+
+
 @output_mapper(
     output_name='volume_element',
     task='generate_volume_element',
@@ -70,26 +346,29 @@ def parse_dream_3D_volume_element_segmentation(path):
     task='generate_volume_element',
     method='from_statistics_old',
 )
-def parse_dream_3D_volume_element_from_stats(path):
+def parse_dream_3D_volume_element_from_stats(path, grain_voxel_index=False,
+                                             crop_region=None):
     # TODO: check this works...
 
     with h5py.File(path, mode='r') as fh:
         synth_vol = fh['DataContainers']['SyntheticVolumeDataContainer']
         grid_size = synth_vol['_SIMPL_GEOMETRY']['DIMENSIONS'][()]
         resolution = synth_vol['_SIMPL_GEOMETRY']['SPACING'][()]
-        size = [i * j for i, j in zip(resolution, grid_size)]
 
-        # make zero-indexed:
-        # (not sure why FeatureIds is 4D?)
-        element_material_idx = synth_vol['CellData']['FeatureIds'][()][..., 0] - 1
-        element_material_idx = element_material_idx.transpose((2, 1, 0))
+        element_material_idx, grain_idx, grid_size, origin = _read_element_material_idx(
+            synth_vol,
+            grid_size,
+            resolution,
+            crop_region,
+        )
+        size = [i * j for i, j in zip(resolution, grid_size)]
 
         num_grains = element_material_idx.max() + 1
         phase_names = synth_vol['CellEnsembleData']['PhaseName'][()][1:]
-        constituent_phase_idx = synth_vol['Grain Data']['Phases'][()][1:] - 1
+        constituent_phase_idx = synth_vol['Grain Data']['Phases'][()][1:][grain_idx] - 1
         constituent_phase_label = [phase_names[i][0].decode()
                                    for i in constituent_phase_idx]
-        eulers = synth_vol['Grain Data']['EulerAngles'][()][1:]
+        eulers = synth_vol['Grain Data']['EulerAngles'][()][1:][grain_idx]
 
     vol_elem = {
         'grid_size': grid_size,
@@ -100,7 +379,11 @@ def parse_dream_3D_volume_element_from_stats(path):
         'material_homog': ['SX'] * num_grains,
         'orientations': process_dream3D_euler_angles(eulers),
     }
+    if origin is not None:
+        vol_elem['origin'] = origin
     vol_elem = validate_volume_element(vol_elem)
+    if grain_voxel_index:
+        _write_grain_voxel_index(path, element_material_idx)
     return vol_elem
 
 
@@ -111,86 +394,45 @@ def parse_dream_3D_volume_element_from_stats(path):
 )
 def parse_dream_3D_volume_element_from_stats(
     path,
-    phase_statistics, 
-    orientations_phase_1,
-    orientations_phase_2,
-    RNG_seed,
+    phase_statistics,
+    orientations_phase_1=None,
+    orientations_phase_2=None,
+    RNG_seed=None,
+    orientations_phases=None,
+    grain_voxel_index=False,
+    crop_region=None,
 ):
 
-    # TODO: make it work.
-    print(f"phase_statistics: {phase_statistics}")
-    print(f'ori phase 1: {orientations_phase_1}')
-    print(f'ori phase 2: {orientations_phase_2}')
-
     with h5py.File(path, mode='r') as fh:
         synth_vol = fh['DataContainers']['SyntheticVolumeDataContainer']
         grid_size = synth_vol['_SIMPL_GEOMETRY']['DIMENSIONS'][()]
         resolution = synth_vol['_SIMPL_GEOMETRY']['SPACING'][()]
-        size = [i * j for i, j in zip(resolution, grid_size)]
 
-        # make zero-indexed:
-        # (not sure why FeatureIds is 4D?)
-        element_material_idx = synth_vol['CellData']['FeatureIds'][()][..., 0] - 1
-        element_material_idx = element_material_idx.transpose((2, 1, 0))
+        element_material_idx, grain_idx, grid_size, origin = _read_element_material_idx(
+            synth_vol,
+            grid_size,
+            resolution,
+            crop_region,
+        )
+        size = [i * j for i, j in zip(resolution, grid_size)]
 
         num_grains = element_material_idx.max() + 1
         phase_names = synth_vol['CellEnsembleData']['PhaseName'][()][1:]
-        constituent_phase_idx = synth_vol['Grain Data']['Phases'][()][1:] - 1
+        constituent_phase_idx = synth_vol['Grain Data']['Phases'][()][1:][grain_idx] - 1
         constituent_phase_label = np.array([
             phase_names[i][0].decode() for i in constituent_phase_idx
         ])
-    
-    ori_1 = validate_orientations(orientations_phase_1)
-    ori_2 = validate_orientations(orientations_phase_2)
-    oris = copy.deepcopy(ori_1) # combined orientations
-    
-    phase_labels = [i['name'] for i in phase_statistics]    
-    phase_labels_idx = np.ones(constituent_phase_label.size) * np.nan
-    for idx, i in enumerate(phase_labels):
-        phase_labels_idx[constituent_phase_label == i] = idx
-    assert not np.any(np.isnan(phase_labels_idx))
-    phase_labels_idx = phase_labels_idx.astype(int)
-
-    _, counts = np.unique(phase_labels_idx, return_counts=True)
-    
-    num_ori_1 = ori_1['quaternions'].shape[0]
-    num_ori_2 = ori_2['quaternions'].shape[0]
-    sampled_oris_1 = ori_1['quaternions']
-    sampled_oris_2 = ori_2['quaternions']
-
-    rng = np.random.default_rng(seed=RNG_seed)
-
-    # If there are more orientations than phase label assignments, choose a random subset:
-    if num_ori_1 != counts[0]:
-        try:
-            ori_1_idx = rng.choice(a=num_ori_1, size=counts[0], replace=False)
-        except ValueError as err:
-            raise ValueError(
-                f"Probably an insufficient number of `orientations_phase_1` "
-                f"({num_ori_1} given for phase {phase_labels[0]!r}, whereas {counts[0]} "
-                f"needed). Caught ValueError is: {err}"
-            )
-        sampled_oris_1 = sampled_oris_1[ori_1_idx]
-    if num_ori_2 != counts[1]:
-        try:
-            ori_2_idx = rng.choice(a=num_ori_2, size=counts[1], replace=False)
-        except ValueError as err:
-            raise ValueError(
-                f"Probably an insufficient number of `orientations_phase_2` "
-                f"({num_ori_2} given for phase {phase_labels[1]!r}, whereas {counts[1]} "
-                f"needed). Caught ValueError is: {err}"
-            )
-        sampled_oris_2 = sampled_oris_2[ori_2_idx]
 
-    ori_idx = np.ones(num_grains) * np.nan
-    for idx, i in enumerate(counts):
-        ori_idx[phase_labels_idx == idx] = np.arange(i) + np.sum(counts[:idx])
+    # One orientation set per phase (`orientations_phases` for any number of phases):
+    if orientations_phases is None:
+        orientations_phases = [orientations_phase_1, orientations_phase_2]
 
-    if np.any(np.isnan(ori_idx)):
-        raise RuntimeError("Not all phases have an orientation assigned!")
-    ori_idx = ori_idx.astype(int)
-
-    oris['quaternions'] = np.vstack([sampled_oris_1, sampled_oris_2])
+    oris, ori_idx = _assign_phase_orientations(
+        constituent_phase_label,
+        phase_statistics=phase_statistics,
+        phase_orientations=orientations_phases,
+        rng=np.random.default_rng(seed=RNG_seed),
+    )
 
     volume_element = {
         'size': size,
@@ -203,10 +445,329 @@ def parse_dream_3D_volume_element_from_stats(
         'constituent_orientation_idx': ori_idx,
         'material_homog': np.full(num_grains, 'SX'),
     }
+    if origin is not None:
+        volume_element['origin'] = origin
     volume_element = validate_volume_element(volume_element)
+    if grain_voxel_index:
+        _write_grain_voxel_index(path, element_material_idx)
     return volume_element
 
 
+@output_mapper(
+    output_name='kernel_average_misorientation',
+    task='segment_grains',
+    method='burn',
+)
+def parse_dream_3D_segmentation_KAM(path, KAM_neighbours='face'):
+
+    with h5py.File(path, mode='r') as fh:
+        container = fh['DataContainers']['DataContainer']
+        element_material_idx = container['CellData']['FeatureIds'][()][..., 0] - 1
+        quats, phases, phase_crystal_structure = _get_segmentation_voxel_orientations(
+            container
+        )
+
+    KAM = get_kernel_average_misorientation(
+        quats=quats,
+        grain_idx=element_material_idx,
+        crystal_structure=phase_crystal_structure[phases],
+        P=-1,
+        neighbours=KAM_neighbours,
+        degrees=True,
+    )
+    KAM = KAM.transpose((2, 1, 0))  # reshape, as for `element_material_idx`
+
+    return KAM
+
+
+@output_mapper(
+    output_name='segmentation_comparison',
+    task='segment_grains',
+    method='burn',
+)
+def parse_dream_3D_segmentation_comparison(path, volume_element):
+
+    with h5py.File(path, mode='r') as fh:
+        container = fh['DataContainers']['DataContainer']
+        element_material_idx = container['CellData']['FeatureIds'][()][..., 0] - 1
+        element_material_idx = element_material_idx.transpose((2, 1, 0))  # reshape
+
+    return compare_labelings(
+        labels_ref=volume_element['element_material_idx'],
+        labels=element_material_idx,
+    )
+
+
+@output_mapper(
+    output_name='grain_statistics',
+    task='generate_volume_element',
+    method='from_statistics',
+)
+@output_mapper(
+    output_name='grain_statistics',
+    task='generate_volume_element',
+    method='from_statistics_old',
+)
+@output_mapper(
+    output_name='grain_statistics',
+    task='generate_volume_element',
+    method='from_statistics_dual_phase_orientations',
+)
+def parse_dream_3D_grain_statistics(path, periodic):
+
+    with h5py.File(path, mode='r') as fh:
+        synth_vol = fh['DataContainers']['SyntheticVolumeDataContainer']
+        grid_size = synth_vol['_SIMPL_GEOMETRY']['DIMENSIONS'][()]
+        resolution = synth_vol['_SIMPL_GEOMETRY']['SPACING'][()]
+        size = [i * j for i, j in zip(resolution, grid_size)]
+
+        element_material_idx = synth_vol['CellData']['FeatureIds'][()][..., 0] - 1
+        element_material_idx = element_material_idx.transpose((2, 1, 0))
+
+    grain_statistics = {
+        **get_grain_statistics(element_material_idx, size=size, periodic=periodic),
+        **get_grain_shapes(element_material_idx, size=size, periodic=periodic),
+    }
+    return grain_statistics
+
+
+@output_mapper(
+    output_name='grain_adjacency',
+    task='generate_volume_element',
+    method='from_statistics',
+)
+@output_mapper(
+    output_name='grain_adjacency',
+    task='generate_volume_element',
+    method='from_statistics_old',
+)
+@output_mapper(
+    output_name='grain_adjacency',
+    task='generate_volume_element',
+    method='from_statistics_dual_phase_orientations',
+)
+def parse_dream_3D_grain_adjacency(path, periodic):
+
+    with h5py.File(path, mode='r') as fh:
+        synth_vol = fh['DataContainers']['SyntheticVolumeDataContainer']
+        grid_size = synth_vol['_SIMPL_GEOMETRY']['DIMENSIONS'][()]
+        resolution = synth_vol['_SIMPL_GEOMETRY']['SPACING'][()]
+        size = [i * j for i, j in zip(resolution, grid_size)]
+
+        element_material_idx = synth_vol['CellData']['FeatureIds'][()][..., 0] - 1
+        element_material_idx = element_material_idx.transpose((2, 1, 0))
+
+    return get_grain_adjacency(element_material_idx, size=size, periodic=periodic)
+
+
+@output_mapper(
+    output_name='two_point_statistics',
+    task='generate_volume_element',
+    method='from_statistics',
+)
+@output_mapper(
+    output_name='two_point_statistics',
+    task='generate_volume_element',
+    method='from_statistics_old',
+)
+@output_mapper(
+    output_name='two_point_statistics',
+    task='generate_volume_element',
+    method='from_statistics_dual_phase_orientations',
+)
+def parse_dream_3D_two_point_statistics(path, two_point_full=False):
+
+    with h5py.File(path, mode='r') as fh:
+        synth_vol = fh['DataContainers']['SyntheticVolumeDataContainer']
+        grid_size = synth_vol['_SIMPL_GEOMETRY']['DIMENSIONS'][()]
+        resolution = synth_vol['_SIMPL_GEOMETRY']['SPACING'][()]
+        size = [i * j for i, j in zip(resolution, grid_size)]
+
+        element_material_idx = synth_vol['CellData']['FeatureIds'][()][..., 0] - 1
+        element_material_idx = element_material_idx.transpose((2, 1, 0))
+
+        phase_names = synth_vol['CellEnsembleData']['PhaseName'][()][1:]
+        grain_phase_idx = synth_vol['Grain Data']['Phases'][()][1:] - 1
+        grain_phase_label = [phase_names[i][0].decode() for i in grain_phase_idx]
+
+    return get_two_point_statistics(
+        element_material_idx,
+        grain_phase_label,
+        size=size,
+        full=two_point_full,
+    )
+
+
+@output_mapper(
+    output_name='statistics_fidelity',
+    task='generate_volume_element',
+    method='from_statistics',
+)
+@output_mapper(
+    output_name='statistics_fidelity',
+    task='generate_volume_element',
+    method='from_statistics_dual_phase_orientations',
+)
+def parse_dream_3D_statistics_fidelity(path, phase_statistics, periodic):
+
+    with h5py.File(path, mode='r') as fh:
+        synth_vol = fh['DataContainers']['SyntheticVolumeDataContainer']
+        grid_size = synth_vol['_SIMPL_GEOMETRY']['DIMENSIONS'][()]
+        resolution = synth_vol['_SIMPL_GEOMETRY']['SPACING'][()]
+        size = [i * j for i, j in zip(resolution, grid_size)]
+
+        element_material_idx = synth_vol['CellData']['FeatureIds'][()][..., 0] - 1
+        element_material_idx = element_material_idx.transpose((2, 1, 0))
+
+        # Phases are numbered in the order of `phase_statistics`:
+        grain_phase_idx = synth_vol['Grain Data']['Phases'][()].reshape(-1)[1:] - 1
+
+    return get_statistics_fidelity(
+        element_material_idx,
+        grain_phase_idx,
+        requested=_get_requested_statistics(phase_statistics),
+        size=size,
+        periodic=periodic,
+    )
+
+
+@output_mapper(
+    output_name='texture_histograms',
+    task='generate_volume_element',
+    method='from_statistics',
+)
+def parse_dream_3D_texture_histograms(path, phase_statistics, texture_bin_size=5,
+                                      texture_poles=None):
+
+    with h5py.File(path, mode='r') as fh:
+        synth_vol = fh['DataContainers']['SyntheticVolumeDataContainer']
+        element_material_idx = synth_vol['CellData']['FeatureIds'][()][..., 0] - 1
+        grain_phase_idx = synth_vol['Grain Data']['Phases'][()].reshape(-1)[1:] - 1
+        eulers = synth_vol['Grain Data']['EulerAngles'][()][1:]
+
+    oris = validate_orientations(process_dream3D_euler_angles(eulers))
+    grain_quats = np.asarray(oris['quaternions'])
+    grain_volume = np.bincount(
+        element_material_idx.reshape(-1),
+        minlength=grain_phase_idx.size,
+    )
+
+    # Phases are numbered in the order of `phase_statistics`:
+    texture_histograms = []
+    for phase_idx, phase_stats in enumerate(phase_statistics):
+        in_phase = np.logical_and(grain_phase_idx == phase_idx, grain_volume > 0)
+        if not np.any(in_phase):
+            continue
+        texture = get_texture_histograms(
+            grain_quats[in_phase],
+            grain_volume[in_phase],
+            phase_stats['crystal_structure'],
+            P=oris['P'],
+            euler_bin_size=texture_bin_size,
+            poles=(texture_poles or {}).get(phase_stats['name']),
+            pole_figure_bin_size=texture_bin_size,
+        )
+        texture_histograms.append({'name': phase_stats['name'], **texture})
+
+    return texture_histograms
+
+
+@output_mapper(
+    output_name='precipitate_statistics',
+    task='generate_volume_element',
+    method='from_statistics',
+)
+@output_mapper(
+    output_name='precipitate_statistics',
+    task='generate_volume_element',
+    method='from_statistics_dual_phase_orientations',
+)
+def parse_dream_3D_precipitate_statistics(path, phase_statistics, periodic):
+
+    with h5py.File(path, mode='r') as fh:
+        synth_vol = fh['DataContainers']['SyntheticVolumeDataContainer']
+        grid_size = synth_vol['_SIMPL_GEOMETRY']['DIMENSIONS'][()]
+        resolution = synth_vol['_SIMPL_GEOMETRY']['SPACING'][()]
+        size = [i * j for i, j in zip(resolution, grid_size)]
+
+        element_material_idx = synth_vol['CellData']['FeatureIds'][()][..., 0] - 1
+        element_material_idx = element_material_idx.transpose((2, 1, 0))
+
+        # Phases are numbered in the order of `phase_statistics`:
+        grain_phase_idx = synth_vol['Grain Data']['Phases'][()].reshape(-1)[1:] - 1
+
+    precipitate_statistics = []
+    for phase_idx, phase_stats in enumerate(phase_statistics):
+        if phase_stats['type'].lower() != 'precipitate':
+            continue
+        RDF = phase_stats['radial_distribution_function']
+        precip_stats = get_precipitate_statistics(
+            element_material_idx,
+            grain_phase_idx,
+            phase_idx,
+            size=size,
+            periodic=periodic,
+            min_distance=RDF['min_distance'],
+            max_distance=RDF['max_distance'],
+            num_bins=RDF['num_bins'],
+        )
+        precipitate_statistics.append({
+            'name': phase_stats['name'],
+            'requested_number_fraction_on_boundary': (
+                phase_stats['number_fraction_on_boundary']
+            ),
+            **precip_stats,
+        })
+
+    return precipitate_statistics
+
+
+@func_mapper(task='generate_volume_element', method='from_statistics_laguerre')
+def generate_RVE_from_statistics_laguerre(grid_size, resolution, size, periodic,
+                                          phase_statistics, RNG_seed=None):
+
+    if size is None:
+        size = [i * j for i, j in zip(resolution, grid_size)]
+
+    volume_element = generate_laguerre_volume_element(
+        grid_size=grid_size,
+        size=size,
+        phase_statistics=phase_statistics,
+        periodic=periodic,
+        RNG_seed=RNG_seed,
+    )
+    return {'volume_element': volume_element}
+
+
+@func_mapper(task='modify_volume_element', method='match_crystallography')
+def modify_volume_element_match_crystallography(volume_element, phase_statistics,
+                                                periodic, RNG_seed=None):
+    volume_element = match_crystallography(
+        volume_element,
+        phase_statistics,
+        periodic=periodic,
+        RNG_seed=RNG_seed,
+    )
+    return {'volume_element': volume_element}
+
+
+@func_mapper(task='modify_volume_element', method='tile')
+def modify_volume_element_tile(volume_element, repeats, duplicate_orientations=True,
+                               RNG_seed=None):
+    volume_element = tile_volume_element(
+        volume_element,
+        repeats,
+        duplicate_orientations=duplicate_orientations,
+        RNG_seed=RNG_seed,
+    )
+    return {'volume_element': volume_element}
+
+
+@func_mapper(task='modify_volume_element', method='merge_small_grains')
+def modify_volume_element_merge_small_grains(volume_element, min_voxels, periodic):
+    volume_element = merge_small_grains(volume_element, min_voxels, periodic=periodic)
+    return {'volume_element': volume_element}
+
 
 @input_mapper(
     input_file='orientation_data.txt',
@@ -1248,6 +1809,28 @@ def write_visualise_volume_element_pipeline(path, volume_element):
     with Path(path).open('w') as fh:
         json.dump(pipeline, fh, indent=4)
 
+
+@output_mapper(
+    output_name='grain_boundary_mesh',
+    task='visualise_volume_element',
+    method='Dream3D',
+)
+def parse_dream_3D_grain_boundary_mesh(path, volume_element, grain_boundary_mesh=False):
+
+    if not grain_boundary_mesh:
+        return
+
+    # Grain boundary surfaces, written alongside the Dream3D output:
+    mesh = get_grain_boundary_mesh(
+        volume_element['element_material_idx'],
+        size=volume_element.get('size', [1, 1, 1]),
+        origin=volume_element.get('origin', [0, 0, 0]),
+    )
+    write_grain_boundary_mesh(mesh, Path(path).parent.joinpath('grain_boundaries.hdf5'))
+
+    return mesh
+
+
 @input_mapper(
     input_file="precipitates.txt",
     task="generate_volume_element",
@@ -1258,22 +1841,30 @@ def write_visualise_volume_element_pipeline(path, volume_element):
     task="generate_volume_element",
     method="from_statistics"
 )
-def write_precipitate_file(path, precipitates):
-    if precipitates:
+def write_precipitate_file(path, precipitates, phase_statistics, grid_size, resolution,
+                           size, periodic):
+    if precipitates is None:
+        return
+    precipitates = get_precipitates_array(precipitates)
+    if precipitates.size:
+
+        # Check before running Dream3D:
+        if size is None:
+            size = [i * j for i, j in zip(resolution, grid_size)]
+        check_precipitates(
+            precipitates,
+            size=size,
+            periodic=periodic,
+            phase_numbers=[
+                idx for idx, i in enumerate(phase_statistics, start=1)
+                if i['type'].lower() == 'precipitate'
+            ],
+        )
+
         with Path(path).open('wt') as fp:
-            fp.write(str(len(precipitates)) + '\n')
-            for i in precipitates:
-                fp.write(
-                    f"{i['phase_number']} "
-                    f"{i['position'][0]:.6f} {i['position'][1]:.6f} {i['position'][2]:.6f} "
-                    f"{i['major_semi_axis_length']:.6f} "
-                    f"{i['mid_semi_axis_length']:.6f} "
-                    f"{i['minor_semi_axis_length']:.6f} "
-                    f"{i.get('omega3', 1):.6f} "
-                    f"{i['euler_angle'][0]:.6f} "
-                    f"{i['euler_angle'][1]:.6f} "
-                    f"{i['euler_angle'][2]:.6f}\n"
-                )
+            fp.write(str(precipitates.size) + '\n')
+            for lines in format_precipitates(precipitates):
+                fp.write(lines)
 
 
 @input_mapper(
@@ -1351,6 +1942,7 @@ def generate_RVE_from_statistics_pipeline_writer(
         'preset_statistics_model',
         'ODF',
         'axis_ODF',
+        'MDF',
     }
     ALLOWED_PHASE_KEYS = {
         'matrix': REQUIRED_PHASE_KEYS['matrix'],
@@ -1383,43 +1975,6 @@ def generate_RVE_from_statistics_pipeline_writer(
         'hexagonal': 0,
         'cubic': 1,
     }
-    SIGMA_MIN_DEFAULT = 5
-    SIGMA_MAX_DEFAULT = 5
-    # Distributions defined for each size distribution bin:
-    DISTRIBUTIONS_MAP = {
-        'omega3': {
-            'type': 'beta',
-            'default_keys': {
-                'alpha': 10.0,
-                'beta': 1.5,
-            },
-            'label': 'FeatureSize Vs Omega3 Distributions',
-        },
-        'b/a': {
-            'type': 'beta',
-            'default_keys': {
-                'alpha': 10.0,
-                'beta': 1.5,
-            },
-            'label': 'FeatureSize Vs B Over A Distributions',
-        },
-        'c/a': {
-            'type': 'beta',
-            'default_keys': {
-                'alpha': 10.0,
-                'beta': 1.5,
-            },
-            'label': 'FeatureSize Vs C Over A Distributions',
-        },
-        'neighbours': {
-            'type': 'lognormal',
-            'default_keys': {
-                'average': 2.0,
-                'stddev': 0.5,
-            },
-            'label': 'FeatureSize Vs Neighbors Distributions',
-        },
-    }
     DISTRIBUTIONS_TYPE_LABELS = {
         'lognormal': 'Log Normal Distribution',
         'beta': 'Beta Distribution',
@@ -1454,29 +2009,18 @@ def generate_RVE_from_statistics_pipeline_writer(
     ALLOWED_PHASE_AXIS_ODF_KEYS = REQUIRED_PHASE_AXIS_ODF_KEYS | {'weights', 'sigmas'}
     REQUIRED_PHASE_ODF_KEYS = set()  # presets can be specified instead of orientations
     ALLOWED_PHASE_ODF_KEYS = ALLOWED_PHASE_AXIS_ODF_KEYS | {'presets'}
+    REQUIRED_PHASE_MDF_KEYS = {'angles', 'axes', 'weights'}
+    ALLOWED_PHASE_MDF_KEYS = REQUIRED_PHASE_MDF_KEYS | {
+        # Also returned by `analysis.get_misorientation_distribution`:
+        'angle_bin_edges',
+        'angle_density',
+    }
     DEFAULT_ODF_WEIGHT = 500_000
     DEFAULT_ODF_SIGMA = 2
 
     DEFAULT_AXIS_ODF_WEIGHT = DEFAULT_ODF_WEIGHT
     DEFAULT_AXIS_ODF_SIGMA = DEFAULT_ODF_SIGMA
 
-    ODF_CUBIC_PRESETS = {
-        'cube': (0, 0, 0),
-        'goss': (0, 45, 0),
-        'brass': (35, 45, 0),
-        'copper': (90, 35, 45),
-        's': (59, 37, 63),
-        's1': (55, 30, 65),
-        's2': (45, 35, 65),
-        'rc(rd1)': (0, 20, 0),
-        'rc(rd2)': (0, 35, 0),
-        'rc(nd1)': (20, 0, 0),
-        'rc(nd2)': (35, 0, 0),
-        'p': (70, 45, 0),
-        'q': (55, 20, 0),
-        'r': (55, 75, 25),
-    }
-
     vol_frac_sum = 0.0
     stats_JSON = []
     for phase_idx, phase_stats in enumerate(phase_statistics):
@@ -1592,22 +2136,14 @@ def generate_RVE_from_statistics_pipeline_writer(
                 f'"{log_mean}") and `ESD_mean` (given as "{mean}").'
             )
 
-        sigma = size_dist['ESD_log_stddev']
-        if log_mean is None:
-            # expected value (mean) of the variable's natural log
-            log_mean = np.log(mean) - (sigma ** 2 / 2)
-
-        sigma_min = size_dist.get('ESD_log_stddev_min_cut_off', SIGMA_MIN_DEFAULT)
-        sigma_max = size_dist.get('ESD_log_stddev_max_cut_off', SIGMA_MAX_DEFAULT)
-        min_feat_ESD = np.exp(log_mean - (sigma_min * sigma))
-        max_feat_ESD = np.exp(log_mean + (sigma_max * sigma))
-
-        if bin_step_size is not None:
-            bins = np.arange(min_feat_ESD, max_feat_ESD, bin_step_size)
-            num_bins = len(bins)
-        else:
-            bin_step_size = (max_feat_ESD - min_feat_ESD) / num_bins
-            bins = np.linspace(min_feat_ESD, max_feat_ESD, num_bins, endpoint=False)
+        ESD_bins = get_ESD_bins(size_dist)
+        log_mean = ESD_bins['log_mean']
+        sigma = ESD_bins['log_stddev']
+        min_feat_ESD = ESD_bins['min_ESD']
+        max_feat_ESD = ESD_bins['max_ESD']
+        bins = ESD_bins['bins']
+        num_bins = len(bins)
+        bin_step_size = ESD_bins['bin_step_size']
 
         feat_diam_info = [bin_step_size, max_feat_ESD, min_feat_ESD]
 
@@ -1878,6 +2414,42 @@ def generate_RVE_from_statistics_pipeline_writer(
                 'Weight': axis_ODF['weights'],
             }
 
+        # MDF:
+        MDF_weights = {}
+        MDF = phase_stats.get('MDF')
+        if MDF:
+            given_MDF_keys = set(MDF.keys())
+            miss_MDF_keys = REQUIRED_PHASE_MDF_KEYS - given_MDF_keys
+            bad_MDF_keys = given_MDF_keys - ALLOWED_PHASE_MDF_KEYS
+            if miss_MDF_keys:
+                raise ValueError(
+                    err_msg + f'Missing `MDF` keys: '
+                    f'{", ".join([f"{i}" for i in miss_MDF_keys])}'
+                )
+            if bad_MDF_keys:
+                raise ValueError(
+                    err_msg + f'Unknown `MDF` keys: '
+                    f'{", ".join([f"{i}" for i in bad_MDF_keys])}'
+                )
+
+            MDF_angles = np.array(MDF['angles'], dtype=float).reshape(-1)
+            MDF_axes = np.array(MDF['axes'], dtype=float).reshape(-1, 3)
+            MDF_weights_arr = np.array(MDF['weights'], dtype=float).reshape(-1)
+            if not (MDF_angles.size == MDF_axes.shape[0] == MDF_weights_arr.size):
+                raise ValueError(
+                    err_msg + f'MDF keys "angles", "axes" and "weights" must have equal '
+                    f'lengths, but have lengths {MDF_angles.size}, {MDF_axes.shape[0]} '
+                    f'and {MDF_weights_arr.size}.'
+                )
+
+            # Angles in degrees; axes are crystal directions, flattened as for other
+            # multi-component Dream3D arrays:
+            MDF_weights = {
+                'Angle': MDF_angles.tolist(),
+                'Axis': MDF_axes.reshape(-1).tolist(),
+                'Weight': MDF_weights_arr.tolist(),
+            }
+
         stats_JSON_i = {
             "AxisODF-Weights": axis_ODF_weights,
             "Bin Count": num_bins,
@@ -1889,7 +2461,7 @@ def generate_RVE_from_statistics_pipeline_writer(
                 "Standard Deviation": sigma,
             },
             'Feature_Diameter_Info': feat_diam_info,
-            'MDF-Weights': {},
+            'MDF-Weights': MDF_weights,
             'ODF-Weights': ODF_weights,
             'Name': phase_stats['name'],
             'PhaseFraction': phase_stats['volume_fraction'],
@@ -1968,6 +2540,9 @@ def generate_RVE_from_statistics_pipeline_writer(
     for idx, i in enumerate(stats_JSON, start=1):
         stats_data_array.update({str(idx): i})
 
+    # `precipitates` may be a list of dicts, dict of arrays or structured array:
+    if precipitates is not None:
+        precipitates = get_precipitates_array(precipitates).size > 0
     if precipitates:
         precip_inp_file = str(Path(path).parent.joinpath('precipitates.txt'))
     else:
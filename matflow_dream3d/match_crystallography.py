@@ -0,0 +1,340 @@
+"""Functions for assigning grain orientations to match target orientation and
+misorientation distributions, similarly to Dream.3D's Match Crystallography filter."""
+
+import numpy as np
+from damask_parse.utils import validate_volume_element
+
+from matflow_dream3d.analysis import (
+    get_grain_boundary_faces,
+    _get_grain_data,
+    MAX_DISORIENTATION_ANGLES,
+)
+from matflow_dream3d.utilities import (
+    disorientation_angles,
+    get_ODF_components,
+    get_random_quaternions,
+    sample_ODF_orientations,
+)
+
+# Initial annealing temperature, relative to the initial cost:
+MATCH_CRYSTALLOGRAPHY_INITIAL_TEMPERATURE = 1e-2
+
+# Number of orientation swaps proposed at once, relative to the number of grains:
+MATCH_CRYSTALLOGRAPHY_SWAP_BATCH_FRACTION = 0.02
+
+
+def _get_MDF_target(MDF, angle_bin_edges):
+    """Get the target fraction of boundary area within each disorientation angle bin
+    from a phase `MDF`, whose `angles` are in degrees."""
+    target, _ = np.histogram(MDF['angles'], bins=angle_bin_edges, weights=MDF['weights'])
+    return target / np.sum(target)
+
+
+def _get_incident_boundaries(pairs, num_grains):
+    """Get a CSR-style index of the boundaries incident to each grain."""
+    grain_idx = pairs.T.reshape(-1)
+    bound_idx = np.tile(np.arange(pairs.shape[0]), 2)
+    srt = np.argsort(grain_idx, kind='stable')
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(grain_idx, minlength=num_grains))])
+    return bound_idx[srt], indptr
+
+
+def _get_swap_batch(swaps, pairs, num_grains):
+    """Select, from proposed swaps of pairs of grains, those that do not interact: no
+    grain is in more than one selected swap, and no boundary is between grains of
+    different selected swaps."""
+
+    swaps = swaps[swaps[:, 0] != swaps[:, 1]]
+
+    # Where a grain is proposed more than once, keep its last swap only:
+    owner = np.full(num_grains, -1)
+    owner[swaps.reshape(-1)] = np.repeat(np.arange(swaps.shape[0]), 2)
+    keep = np.all(owner[swaps] == np.arange(swaps.shape[0])[:, None], axis=1)
+    owner[swaps[~keep].reshape(-1)] = -1
+    owner[swaps[keep].reshape(-1)] = np.repeat(np.flatnonzero(keep), 2)
+
+    # Of two swaps that share a boundary, drop the later one:
+    bound_owners = owner[pairs]
+    conflict = np.logical_and(
+        np.all(bound_owners >= 0, axis=1),
+        bound_owners[:, 0] != bound_owners[:, 1],
+    )
+    keep[np.max(bound_owners[conflict], axis=1)] = False
+
+    return swaps[keep]
+
+
+def _anneal_phase_orientations(quats, labels, volume, pairs, area, crystal_structure,
+                               P, ODF_target, MDF_target, angle_bin_edges, num_swaps,
+                               ODF_weight, MDF_weight, rng):
+    """Swap the orientations of pairs of grains of one phase to minimise the squared
+    differences between the achieved and target ODF component volume fractions and
+    MDF angle-bin boundary area fractions."""
+
+    quats = quats.copy()
+    labels = labels.copy()
+    num_grains = labels.size
+    vol_frac = volume / np.sum(volume)
+    num_bins = angle_bin_edges.size - 1
+
+    cost = 0
+    if ODF_target is not None:
+        ODF_frac = np.bincount(labels, weights=vol_frac, minlength=ODF_target.size)
+        cost += ODF_weight * np.sum((ODF_frac - ODF_target) ** 2)
+
+    if MDF_target is not None and pairs.size:
+        area_frac = area / np.sum(area)
+        incident, indptr = _get_incident_boundaries(pairs, num_grains)
+        num_incident = np.diff(indptr)
+
+        def get_bins(bound_idx, quats):
+            angles = disorientation_angles(
+                quats[pairs[bound_idx, 0]],
+                quats[pairs[bound_idx, 1]],
+                crystal_structure,
+                P=P,
+                degrees=True,
+            )
+            return np.clip(np.digitize(angles, angle_bin_edges) - 1, 0, num_bins - 1)
+
+        bound_bins = get_bins(np.arange(pairs.shape[0]), quats)
+        MDF_frac = np.bincount(bound_bins, weights=area_frac, minlength=num_bins)
+        cost += MDF_weight * np.sum((MDF_frac - MDF_target) ** 2)
+    else:
+        MDF_target = None
+
+    if cost == 0 or num_grains < 2:
+        return quats
+
+    # Boundaries only couple swaps if the MDF is evaluated:
+    swap_pairs = pairs if MDF_target is not None else pairs[:0]
+    batch_size = max(1, int(MATCH_CRYSTALLOGRAPHY_SWAP_BATCH_FRACTION * num_grains))
+    for batch_start in range(0, num_swaps, batch_size):
+
+        proposed = rng.integers(
+            num_grains,
+            size=(min(batch_size, num_swaps - batch_start), 2),
+        )
+        swaps = _get_swap_batch(proposed, swap_pairs, num_grains)
+        temperature = (
+            MATCH_CRYSTALLOGRAPHY_INITIAL_TEMPERATURE * cost *
+            (1 - batch_start / num_swaps)
+        )
+        thresholds = rng.random(swaps.shape[0])
+        if not swaps.size:
+            continue
+        g, h = swaps.T
+        delta = np.zeros(swaps.shape[0])
+
+        if ODF_target is not None:
+            a, b = labels[g], labels[h]
+            d_vol = vol_frac[h] - vol_frac[g]
+            delta += ODF_weight * np.where(
+                a != b,
+                (ODF_frac[a] + d_vol - ODF_target[a]) ** 2 +
+                (ODF_frac[b] - d_vol - ODF_target[b]) ** 2 -
+                (ODF_frac[a] - ODF_target[a]) ** 2 -
+                (ODF_frac[b] - ODF_target[b]) ** 2,
+                0,
+            )
+
+        if MDF_target is not None:
+            # Boundaries incident to each swapped grain, and the index of their swap:
+            swap_grains = swaps.reshape(-1)
+            counts = num_incident[swap_grains]
+            bound_swap = np.repeat(np.repeat(np.arange(swaps.shape[0]), 2), counts)
+            offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts,
+                                                            counts)
+            bounds = incident[np.repeat(indptr[swap_grains], counts) + offsets]
+
+            # The boundary between the two grains of a swap is listed twice:
+            is_first = np.ones(bounds.size, dtype=bool)
+            bound_srt = np.lexsort((bounds, bound_swap))
+            is_first[bound_srt[1:]] = np.logical_or(
+                bounds[bound_srt[1:]] != bounds[bound_srt[:-1]],
+                bound_swap[bound_srt[1:]] != bound_swap[bound_srt[:-1]],
+            )
+            bounds, bound_swap = bounds[is_first], bound_swap[is_first]
+
+            # Swaps of a batch do not interact, so all are evaluated at once:
+            new_quats = quats.copy()
+            new_quats[g], new_quats[h] = quats[h], quats[g]
+            new_bins = get_bins(bounds, new_quats)
+            d_MDF = (
+                np.bincount(
+                    bound_swap * num_bins + new_bins,
+                    weights=area_frac[bounds],
+                    minlength=swaps.shape[0] * num_bins,
+                ) -
+                np.bincount(
+                    bound_swap * num_bins + bound_bins[bounds],
+                    weights=area_frac[bounds],
+                    minlength=swaps.shape[0] * num_bins,
+                )
+            ).reshape(-1, num_bins)
+            delta += MDF_weight * np.sum(
+                (MDF_frac + d_MDF - MDF_target) ** 2 - (MDF_frac - MDF_target) ** 2,
+                axis=1,
+            )
+
+        accept = delta < 0
+        if temperature > 0:
+            with np.errstate(over='ignore'):
+                accept |= thresholds < np.exp(-delta / temperature)
+        if not np.any(accept):
+            continue
+
+        g, h = g[accept], h[accept]
+        quats[g], quats[h] = quats[h], quats[g]
+        labels[g], labels[h] = labels[h], labels[g]
+        if ODF_target is not None:
+            ODF_frac = np.bincount(labels, weights=vol_frac, minlength=ODF_target.size)
+        if MDF_target is not None:
+            is_accepted = accept[bound_swap]
+            bound_bins[bounds[is_accepted]] = new_bins[is_accepted]
+            MDF_frac = np.bincount(bound_bins, weights=area_frac, minlength=num_bins)
+
+    return quats
+
+
+def match_crystallography(volume_element, phase_statistics, periodic=True,
+                          num_swaps_per_grain=10, ODF_weight=1.0, MDF_weight=1.0,
+                          angle_bin_size=5, RNG_seed=None):
+    """Assign new grain orientations to an existing volume element, to match the target
+    ODFs and MDFs of `phase_statistics`.
+
+    Parameters
+    ----------
+    volume_element : dict
+        Validated volume element, with one constituent per material.
+    phase_statistics : list of dict
+        As for the `from_statistics` method of `generate_volume_element`; for each
+        phase whose `name` matches a phase label of the volume element, the
+        `crystal_structure`, and the optional `ODF` and `MDF` (with `angles` in
+        degrees and `weights`) are used.
+    periodic : bool, optional
+        If True, boundaries across the volume element boundaries are included.
+    num_swaps_per_grain : int, optional
+        Number of proposed orientation swaps, per grain of each phase.
+    ODF_weight : float, optional
+        Weight of the ODF (component volume fractions) term of the cost.
+    MDF_weight : float, optional
+        Weight of the MDF (disorientation angle boundary area fractions) term of the
+        cost.
+    angle_bin_size : float, optional
+        Width of the MDF disorientation angle bins in degrees.
+    RNG_seed : int, optional
+
+    Returns
+    -------
+    volume_element : dict
+        Copy of the volume element with new orientations.
+
+    Notes
+    -----
+    Initial orientations are sampled from the ODF kernels (see
+    `sample_ODF_orientations`), and each grain is labelled with the ODF component from
+    which its orientation is sampled; orientations are uniformly random for phases
+    without an `ODF`. Orientation swaps between pairs of grains of the same phase are
+    then accepted by simulated annealing, where the cost is the sum of the squared
+    differences between the achieved and target grain-volume-weighted ODF component
+    fractions, and between the achieved and target boundary-area-weighted
+    disorientation angle histograms.
+
+    Swaps are proposed in batches, from which swaps that share a grain or a boundary
+    with an earlier swap of the batch are dropped. The cost changes of the remaining
+    swaps are found at once, by re-evaluating only the boundaries incident to the
+    swapped grains, and each swap is accepted independently. The achieved fractions
+    are then updated exactly. Grain volumes, boundaries and per-grain incident
+    boundaries are found once.
+
+    """
+    rng = np.random.default_rng(RNG_seed)
+    element_material_idx = np.asarray(volume_element['element_material_idx'])
+    grain_quats, grain_phase, P = _get_grain_data(volume_element)
+    grain_quats = grain_quats.astype(float)
+    num_grains = grain_phase.size
+
+    volume = np.bincount(element_material_idx.reshape(-1), minlength=num_grains)
+    boundaries = get_grain_boundary_faces(
+        element_material_idx,
+        size=volume_element.get('size'),
+        periodic=periodic,
+    )
+    pairs, area = boundaries['pairs'], boundaries['area']
+
+    for phase_stats in phase_statistics:
+
+        grain_idx = np.flatnonzero(
+            np.logical_and(grain_phase == phase_stats['name'], volume > 0)
+        )
+        if not grain_idx.size:
+            continue
+        crystal_structure = phase_stats['crystal_structure']
+
+        ODF = phase_stats.get('ODF')
+        ODF_target = None
+        if ODF:
+            _, comp_weights = get_ODF_components(ODF, crystal_structure)
+            ODF_target = comp_weights / np.sum(comp_weights)
+            oris, labels = sample_ODF_orientations(
+                ODF,
+                crystal_structure,
+                grain_idx.size,
+                rng,
+                return_component_idx=True,
+            )
+            quats = oris['quaternions']
+            if P == 1:
+                quats[:, 1:] *= -1
+        else:
+            labels = np.zeros(grain_idx.size, dtype=int)
+            quats = get_random_quaternions(grain_idx.size, rng)
+
+        # Boundaries between grains of this phase, with local grain indices:
+        local_idx = np.full(num_grains, -1)
+        local_idx[grain_idx] = np.arange(grain_idx.size)
+        phase_pairs = local_idx[pairs]
+        in_phase = np.all(phase_pairs >= 0, axis=1)
+
+        angle_bin_edges = np.arange(
+            0,
+            MAX_DISORIENTATION_ANGLES[crystal_structure] + angle_bin_size,
+            angle_bin_size,
+        )
+        MDF = phase_stats.get('MDF')
+        MDF_target = _get_MDF_target(MDF, angle_bin_edges) if MDF else None
+
+        grain_quats[grain_idx] = _anneal_phase_orientations(
+            quats,
+            labels,
+            volume[grain_idx],
+            phase_pairs[in_phase],
+            area[in_phase],
+            crystal_structure,
+            P,
+            ODF_target,
+            MDF_target,
+            angle_bin_edges,
+            num_swaps_per_grain * grain_idx.size,
+            ODF_weight,
+            MDF_weight,
+            rng,
+        )
+
+    # One orientation per material:
+    const_mat_idx = np.asarray(volume_element['constituent_material_idx'])
+    new_volume_element = {
+        **volume_element,
+        'constituent_orientation_idx': const_mat_idx,
+        'orientations': {
+            **volume_element['orientations'],
+            'type': 'quat',
+            'quaternions': grain_quats,
+            'quat_component_ordering': 'scalar-vector',
+            'P': P,
+        },
+    }
+    new_volume_element['orientations'].pop('euler_angles', None)
+    new_volume_element['orientations'].pop('euler_degrees', None)
+    return validate_volume_element(new_volume_element)
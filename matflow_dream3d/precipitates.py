@@ -0,0 +1,422 @@
+"""Functions for specifying explicit precipitates for Dream.3D."""
+
+import warnings
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from matflow_dream3d.utilities import get_ESD_bins, sample_ESDs, DISTRIBUTIONS_MAP
+
+# Explicit precipitates, as read by Dream3D's InsertPrecipitatePhases filter:
+PRECIPITATE_DTYPE = np.dtype([
+    ('phase_number', int),
+    ('position', float, (3,)),
+    ('major_semi_axis_length', float),
+    ('mid_semi_axis_length', float),
+    ('minor_semi_axis_length', float),
+    ('omega3', float),
+    ('euler_angle', float, (3,)),
+])
+PRECIPITATE_FILE_CHUNK_SIZE = 10_000
+
+
+def get_precipitates_array(precipitates):
+    """Get explicit precipitates as a structured array.
+
+    Parameters
+    ----------
+    precipitates : list of dict, dict of array, or structured ndarray
+        Precipitates given as either: a list of dicts, one for each precipitate; a dict
+        of arrays, each with one row for each precipitate; or a structured array. The
+        keys (or fields) are the field names of `PRECIPITATE_DTYPE`: "phase_number",
+        "position" (length three), "major_semi_axis_length", "mid_semi_axis_length",
+        "minor_semi_axis_length", "omega3" (optional, one by default) and
+        "euler_angle" (length three).
+
+    Returns
+    -------
+    precipitates_arr : ndarray of shape (N,) of dtype `PRECIPITATE_DTYPE`
+
+    """
+    err_msg = ('Precipitates must be given as either a list of dicts, a dict of arrays, '
+               'or a structured array of dtype `PRECIPITATE_DTYPE`')
+    if isinstance(precipitates, np.ndarray) and not precipitates.dtype.names:
+        raise ValueError(err_msg + f', not an unstructured array (of dtype '
+                                   f'"{precipitates.dtype}").')
+    if not isinstance(precipitates, (np.ndarray, dict)) and not all(
+        isinstance(i, dict) for i in precipitates
+    ):
+        raise ValueError(err_msg + '.')
+
+    if isinstance(precipitates, np.ndarray):
+        given_fields = all_fields = precipitates.dtype.names
+        num_precips = precipitates.size
+        get_field = precipitates.__getitem__
+
+    elif isinstance(precipitates, dict):
+        given_fields = all_fields = tuple(precipitates.keys())
+        num_precips = len(precipitates['phase_number'])
+        get_field = precipitates.__getitem__
+
+    else:
+        # Fields must be given for every precipitate, except for "omega3":
+        all_fields = set().union(*[i.keys() for i in precipitates])
+        common_fields = all_fields.intersection(*[i.keys() for i in precipitates])
+        given_fields = tuple(common_fields | (all_fields & {'omega3'}))
+        num_precips = len(precipitates)
+        get_field = lambda field: [i.get(field, 1) for i in precipitates]
+
+    miss_fields = set(PRECIPITATE_DTYPE.names) - set(given_fields) - {'omega3'}
+    bad_fields = set(all_fields) - set(PRECIPITATE_DTYPE.names)
+    if num_precips and miss_fields:
+        raise ValueError(f'Missing precipitate keys (each key other than "omega3" '
+                         f'must be given for every precipitate): '
+                         f'{", ".join([f"{i}" for i in miss_fields])}')
+    if bad_fields:
+        raise ValueError(f'Unknown precipitate keys: '
+                         f'{", ".join([f"{i}" for i in bad_fields])}')
+
+    precipitates_arr = np.empty(num_precips, dtype=PRECIPITATE_DTYPE)
+    precipitates_arr['omega3'] = 1
+    if num_precips:
+        for field in given_fields:
+            precipitates_arr[field] = get_field(field)
+
+    return precipitates_arr
+
+
+def format_precipitates(precipitates_arr, chunk_size=PRECIPITATE_FILE_CHUNK_SIZE):
+    """Generate the lines of a Dream3D precipitates file, formatting one chunk of
+    precipitates at a time.
+
+    Parameters
+    ----------
+    precipitates_arr : ndarray of dtype `PRECIPITATE_DTYPE`
+    chunk_size : int, optional
+        Number of precipitates to format at once.
+
+    Yields
+    ------
+    lines : str
+        Formatted lines of (at most) `chunk_size` precipitates.
+
+    """
+    row_fmt = '%d' + ' %.6f' * 10 + '\n'
+    table = np.column_stack([
+        precipitates_arr['phase_number'],
+        precipitates_arr['position'],
+        precipitates_arr['major_semi_axis_length'],
+        precipitates_arr['mid_semi_axis_length'],
+        precipitates_arr['minor_semi_axis_length'],
+        precipitates_arr['omega3'],
+        precipitates_arr['euler_angle'],
+    ])
+    for start in range(0, table.shape[0], chunk_size):
+        chunk = table[start:start + chunk_size]
+        yield (row_fmt * chunk.shape[0]) % tuple(chunk.reshape(-1).tolist())
+
+
+def _sample_beta_per_bin(rng, dist, bin_idx, num_bins):
+    """Sample from beta distributions whose parameters may be given per ESD bin."""
+    alpha = np.broadcast_to(np.reshape(dist['alpha'], -1), num_bins)
+    beta = np.broadcast_to(np.reshape(dist['beta'], -1), num_bins)
+    return rng.beta(alpha[bin_idx], beta[bin_idx])
+
+
+def _sample_positions(rng, num, size, boundary_mask, on_boundary, margin):
+    """Sample uniformly distributed positions, optionally within elements of the
+    boundary mask (where `on_boundary`) or outside them (otherwise). Without a boundary
+    mask, positions are at least `margin` from the volume element boundaries."""
+
+    if boundary_mask is None:
+        margin = margin[:, None]
+        return margin + rng.random((num, 3)) * (size - 2 * margin)
+
+    grid_size = np.array(boundary_mask.shape)
+    flat_mask = boundary_mask.reshape(-1)
+    elem_idx = np.empty(num, dtype=int)
+    for is_on, elems in ((True, np.flatnonzero(flat_mask)),
+                         (False, np.flatnonzero(~flat_mask))):
+        choose = on_boundary == is_on
+        if np.any(choose):
+            elem_idx[choose] = rng.choice(elems, size=np.sum(choose))
+
+    elem_subs = np.array(np.unravel_index(elem_idx, grid_size)).T
+    return (elem_subs + rng.random((num, 3))) * (size / grid_size)
+
+
+def _find_overlapping_pairs(positions, radii, size, periodic):
+    """Find the pairs of spheres that overlap, using a (periodic) k-d tree."""
+
+    if periodic:
+        tree = cKDTree(np.mod(positions, size), boxsize=size)
+    else:
+        tree = cKDTree(positions)
+    pairs = tree.query_pairs(2 * np.max(radii), output_type='ndarray')
+
+    sep = positions[pairs[:, 1]] - positions[pairs[:, 0]]
+    if periodic:
+        sep -= np.round(sep / size) * size
+    overlaps = (
+        np.sum(sep ** 2, axis=1) < (radii[pairs[:, 0]] + radii[pairs[:, 1]]) ** 2
+    )
+    return np.sort(pairs[overlaps], axis=1)
+
+
+def _find_overlapping(positions, radii, num_fixed, size, periodic):
+    """Find which of the (non-fixed) spheres overlap with either a fixed sphere or an
+    earlier non-fixed sphere."""
+
+    pairs = _find_overlapping_pairs(positions, radii, size, periodic)
+
+    # Reject the later sphere of each overlapping pair (fixed spheres come first):
+    is_overlapping = np.zeros(positions.shape[0], dtype=bool)
+    is_overlapping[pairs[:, 1]] = True
+    return is_overlapping[num_fixed:]
+
+
+def generate_precipitates(size_distribution, phase_number, size, volume_fraction=None,
+                          num_precipitates=None, periodic=True, boundary_mask=None,
+                          number_fraction_on_boundary=None, RNG_seed=None,
+                          max_iterations=100):
+    """Generate explicit, non-overlapping precipitates with sizes and shapes sampled
+    from a precipitate phase's size distribution.
+
+    Parameters
+    ----------
+    size_distribution : dict
+        Precipitate phase `size_distribution`, as in the `phase_statistics` input of
+        `generate_volume_element`. The ESD distribution, and the `b/a`, `c/a` and
+        `omega3` distributions (defaults are used if not specified) are sampled.
+    phase_number : int
+        Dream3D phase number of the precipitates.
+    size : list of float
+        Size of the volume element.
+    volume_fraction : float, optional
+        Target volume fraction of the precipitates. Exactly one of `volume_fraction`
+        and `num_precipitates` must be specified.
+    num_precipitates : int, optional
+        Number of precipitates.
+    periodic : bool, optional
+        If True, precipitates may overlap the volume element boundaries, and overlaps
+        are found using periodic boundary conditions. Otherwise, precipitate centres
+        are at least the major semi-axis length from the boundaries, so precipitates
+        lie within the volume element.
+    boundary_mask : ndarray of shape (Nx, Ny, Nz) of bool, optional
+        Elements of the volume element (of the same `size`) that lie on (primary)
+        grain boundaries, for example, elements with at least one face-neighbour in
+        a different grain. Must be specified with `number_fraction_on_boundary`.
+    number_fraction_on_boundary : float, optional
+        Target fraction, between zero and one, of precipitate centres that lie within
+        `boundary_mask`. Must be zero if `boundary_mask` has no True elements, and one
+        if it has no False elements.
+    RNG_seed : int, optional
+    max_iterations : int, optional
+        Maximum number of rounds of re-positioning overlapping precipitates.
+
+    Returns
+    -------
+    precipitates : ndarray of shape (N,) of dtype `PRECIPITATE_DTYPE`
+        Precipitates that may be passed directly as the `precipitates` input of
+        `generate_volume_element`. Euler angles are uniformly random, in radians.
+
+    Notes
+    -----
+    Overlaps are tested between the bounding spheres (with radii of the major
+    semi-axis lengths) of the precipitates. In each round, all unplaced precipitates
+    are positioned at once, and those overlapping placed precipitates (or each other),
+    or, if not `periodic`, too close to the volume element boundaries, are
+    re-positioned in the next round. Any precipitates that cannot be placed within
+    `max_iterations` rounds are removed, with a warning.
+
+    """
+    if sum([i is None for i in (volume_fraction, num_precipitates)]) != 1:
+        raise ValueError(
+            f'Specify exactly one of `volume_fraction` (given as "{volume_fraction}") '
+            f'and `num_precipitates` (given as "{num_precipitates}").'
+        )
+    if (boundary_mask is None) != (number_fraction_on_boundary is None):
+        raise ValueError('Specify both or neither of `boundary_mask` and '
+                         '`number_fraction_on_boundary`.')
+
+    rng = np.random.default_rng(RNG_seed)
+    size = np.asarray(size, dtype=float)
+    if boundary_mask is not None:
+        boundary_mask = np.asarray(boundary_mask, dtype=bool)
+        err_msg = (f'Invalid `number_fraction_on_boundary` '
+                   f'("{number_fraction_on_boundary}") for `boundary_mask`: ')
+        if not 0 <= number_fraction_on_boundary <= 1:
+            raise ValueError(err_msg + 'it must be between zero and one.')
+        if number_fraction_on_boundary > 0 and not np.any(boundary_mask):
+            raise ValueError(err_msg + 'the mask has no True (boundary) elements, so '
+                                       'the fraction must be zero.')
+        if number_fraction_on_boundary < 1 and np.all(boundary_mask):
+            raise ValueError(err_msg + 'the mask has no False (non-boundary) elements, '
+                                       'so the fraction must be one.')
+
+    ESD_bins = get_ESD_bins(size_distribution)
+    if num_precipitates is None:
+        ESD = sample_ESDs(size_distribution, rng, volume=volume_fraction * np.prod(size))
+        num_precipitates = ESD.size
+    else:
+        ESD = sample_ESDs(size_distribution, rng, num=num_precipitates)
+
+    num_bins = len(ESD_bins['bins'])
+    bin_idx = np.clip(
+        np.floor((ESD - ESD_bins['min_ESD']) / ESD_bins['bin_step_size']).astype(int),
+        0,
+        num_bins - 1,
+    )
+    shape_params = {
+        key: _sample_beta_per_bin(
+            rng,
+            size_distribution.get(key) or DISTRIBUTIONS_MAP[key]['default_keys'],
+            bin_idx,
+            num_bins,
+        )
+        for key in ('b/a', 'c/a', 'omega3')
+    }
+    b_over_a = np.maximum(shape_params['b/a'], shape_params['c/a'])
+    c_over_a = np.minimum(shape_params['b/a'], shape_params['c/a'])
+
+    # Semi-axes with the volume of the ESD sphere:
+    major = ESD / 2 / np.cbrt(b_over_a * c_over_a)
+
+    precipitates = np.empty(num_precipitates, dtype=PRECIPITATE_DTYPE)
+    precipitates['phase_number'] = phase_number
+    precipitates['major_semi_axis_length'] = major
+    precipitates['mid_semi_axis_length'] = major * b_over_a
+    precipitates['minor_semi_axis_length'] = major * c_over_a
+    precipitates['omega3'] = shape_params['omega3']
+    precipitates['euler_angle'] = np.array([
+        rng.uniform(0, 2 * np.pi, num_precipitates),
+        np.arccos(rng.uniform(-1, 1, num_precipitates)),
+        rng.uniform(0, 2 * np.pi, num_precipitates),
+    ]).T
+
+    # Place larger precipitates first:
+    precipitates = precipitates[np.argsort(-major)]
+    radii = precipitates['major_semi_axis_length']
+    margin = np.zeros(num_precipitates) if periodic else radii
+    if not periodic and num_precipitates and 2 * radii[0] > np.min(size):
+        raise ValueError(
+            f'The largest precipitate (major semi-axis length {radii[0]}) does not fit '
+            f'within the volume element of size {list(size)}; a non-periodic volume '
+            f'element must be larger than the precipitate bounding spheres.'
+        )
+    on_boundary = np.zeros(num_precipitates, dtype=bool)
+    if boundary_mask is not None:
+        on_boundary = rng.random(num_precipitates) < number_fraction_on_boundary
+
+    positions = np.empty((num_precipitates, 3))
+    is_placed = np.zeros(num_precipitates, dtype=bool)
+    for _ in range(max_iterations):
+        unplaced = np.flatnonzero(~is_placed)
+        if not unplaced.size:
+            break
+        positions[unplaced] = _sample_positions(
+            rng,
+            unplaced.size,
+            size,
+            boundary_mask,
+            on_boundary[unplaced],
+            margin[unplaced],
+        )
+        placed = np.flatnonzero(is_placed)
+        trial = np.concatenate([placed, unplaced])
+        is_overlapping = _find_overlapping(
+            positions[trial],
+            radii[trial],
+            placed.size,
+            size,
+            periodic,
+        )
+        is_inside = np.all(
+            np.logical_and(
+                positions[unplaced] >= margin[unplaced, None],
+                positions[unplaced] <= size - margin[unplaced, None],
+            ),
+            axis=1,
+        )
+        is_placed[unplaced[~is_overlapping & is_inside]] = True
+
+    if not np.all(is_placed):
+        warnings.warn(f'Could not place {np.sum(~is_placed)} of {num_precipitates} '
+                      f'precipitates without overlaps; removing them.')
+
+    precipitates['position'] = positions
+    return precipitates[is_placed]
+
+
+def check_precipitates(precipitates, size, periodic, phase_numbers):
+    """Check explicit precipitates for unknown phase numbers, invalid semi-axes,
+    positions outside the volume element, and overlaps.
+
+    Parameters
+    ----------
+    precipitates : list of dict, dict of array, or structured ndarray
+        See `get_precipitates_array`.
+    size : list of float
+        Size of the volume element.
+    periodic : bool
+        If True, overlaps are found using periodic boundary conditions.
+    phase_numbers : list of int
+        Allowed (Dream3D) phase numbers.
+
+    Notes
+    -----
+    Overlaps are found between spheres inscribed within (radii of the minor semi-axis
+    lengths) and bounding (radii of the major semi-axis lengths) the precipitate
+    ellipsoids. Overlapping inscribed spheres are certain overlaps, and raise; any
+    other overlapping bounding spheres are possible overlaps, and warn.
+
+    """
+    precipitates = get_precipitates_array(precipitates)
+    if not precipitates.size:
+        return
+    size = np.asarray(size, dtype=float)
+    err_msg = 'Problem with `precipitates`: '
+
+    def first_indices(idx, num=5):
+        return ", ".join([f"{i}" for i in idx[:num]]) + (", ..." if len(idx) > num else "")
+
+    bad_phase = np.flatnonzero(~np.isin(precipitates['phase_number'], phase_numbers))
+    if bad_phase.size:
+        raise ValueError(
+            err_msg + f'{bad_phase.size} precipitates have unknown `phase_number` (allowed '
+            f'phase numbers are: {", ".join([f"{i}" for i in phase_numbers])}), with '
+            f'indices: {first_indices(bad_phase)}.'
+        )
+
+    major = precipitates['major_semi_axis_length']
+    mid = precipitates['mid_semi_axis_length']
+    minor = precipitates['minor_semi_axis_length']
+    bad_axes = np.flatnonzero(~((major >= mid) & (mid >= minor) & (minor > 0)))
+    if bad_axes.size:
+        raise ValueError(
+            err_msg + f'{bad_axes.size} precipitates do not satisfy `major_semi_axis_length '
+            f'>= mid_semi_axis_length >= minor_semi_axis_length > 0`, with indices: '
+            f'{first_indices(bad_axes)}.'
+        )
+
+    pos = precipitates['position']
+    outside = np.flatnonzero(np.any((pos < 0) | (pos >= size), axis=1))
+    if outside.size:
+        raise ValueError(
+            err_msg + f'{outside.size} precipitates have positions outside the volume '
+            f'element of size {size.tolist()}, with indices: {first_indices(outside)}.'
+        )
+
+    overlaps = _find_overlapping_pairs(pos, minor, size, periodic)
+    if overlaps.size:
+        raise ValueError(
+            err_msg + f'{overlaps.shape[0]} pairs of precipitates overlap, with index '
+            f'pairs: {first_indices([tuple(i) for i in overlaps.tolist()])}.'
+        )
+    overlaps = _find_overlapping_pairs(pos, major, size, periodic)
+    if overlaps.size:
+        warnings.warn(
+            err_msg + f'{overlaps.shape[0]} pairs of precipitates may overlap (their '
+            f'bounding spheres overlap), with index pairs: '
+            f'{first_indices([tuple(i) for i in overlaps.tolist()])}.'
+        )
@@ -0,0 +1,301 @@
+"""Functions for generating volume elements from Laguerre (weighted Voronoi)
+tessellations, as a fast alternative to Dream.3D's ellipsoid packing."""
+
+import numpy as np
+from damask_parse.utils import validate_volume_element
+from scipy.spatial import cKDTree
+
+from matflow_dream3d.utilities import (
+    process_dream3D_quaternions,
+    get_random_quaternions,
+    sample_ODF_orientations,
+    sample_ESDs,
+)
+
+LAGUERRE_BLOCK_SIZE = 8
+LAGUERRE_CHUNK_SIZE = 2 ** 20
+
+
+def _get_laguerre_candidates(seeds, weights, block_centres, block_radii, size,
+                             periodic):
+    """Find, for each block of elements (within a sphere), the seeds that may be
+    nearest to an element of the block in the power distance.
+
+    Returns the candidate seed indices (grouped by block) and the number of candidates
+    of each block."""
+
+    # Best power distance over each block is at most that of the (lifted) nearest seed
+    # to the block centre, plus the block radius:
+    lift = np.sqrt(np.max(weights) - weights)
+    if periodic:
+        # The lifted dimension must not wrap:
+        lifted_tree = cKDTree(
+            np.column_stack([seeds, lift]),
+            boxsize=np.append(size, 2 * np.max(lift) + 1),
+        )
+        tree = cKDTree(seeds, boxsize=size)
+    else:
+        lifted_tree = cKDTree(np.column_stack([seeds, lift]))
+        tree = cKDTree(seeds)
+
+    _, nearest = lifted_tree.query(
+        np.column_stack([block_centres, np.zeros(block_centres.shape[0])]),
+        workers=-1,
+    )
+    nearest_dist = _get_distances(block_centres, seeds[nearest], size, periodic)
+    upper_bound = (nearest_dist + block_radii) ** 2 - weights[nearest]
+
+    # Seeds whose power distance may be within the bound somewhere within the block:
+    cand_lists = tree.query_ball_point(
+        block_centres,
+        block_radii + np.sqrt(upper_bound + np.max(weights)) * (1 + 1e-9),
+        workers=-1,
+    )
+    num_cands = np.array([len(i) for i in cand_lists])
+    cand_block_idx = np.repeat(np.arange(block_centres.shape[0]), num_cands)
+    cand_idx = np.concatenate(cand_lists).astype(int)
+    cand_dist = _get_distances(
+        block_centres[cand_block_idx],
+        seeds[cand_idx],
+        size,
+        periodic,
+    )
+    lower_bound = np.maximum(cand_dist - block_radii[cand_block_idx], 0) ** 2
+    is_cand = lower_bound - weights[cand_idx] <= upper_bound[cand_block_idx]
+
+    num_cands = np.bincount(
+        cand_block_idx[is_cand],
+        minlength=block_centres.shape[0],
+    )
+    return cand_idx[is_cand], num_cands
+
+
+def _get_distances(points_a, points_b, size, periodic):
+    """Find the (minimum-image, if `periodic`) distances between pairs of points."""
+    sep = points_b - points_a
+    if periodic:
+        sep -= np.round(sep / size) * size
+    return np.sqrt(np.sum(sep ** 2, axis=1))
+
+
+def get_laguerre_labels(seeds, weights, grid_size, size, periodic=True,
+                        block_size=LAGUERRE_BLOCK_SIZE, chunk_size=LAGUERRE_CHUNK_SIZE):
+    """Label the elements of a regular grid by their nearest seed in the power
+    (Laguerre) distance, `|x - seed| ** 2 - weight`.
+
+    Parameters
+    ----------
+    seeds : ndarray of shape (N, 3) of float
+        Seed positions within the volume element.
+    weights : ndarray of shape (N,) of float
+        Seed weights; equal weights give a Voronoi tessellation.
+    grid_size : list of int
+    size : list of float
+    periodic : bool, optional
+        If True, the tessellation is periodic.
+    block_size : int, optional
+        Edge length, in elements, of the cubic blocks of elements that share a list of
+        candidate seeds.
+    chunk_size : int, optional
+        Approximate maximum number of power distances to compute at once.
+
+    Returns
+    -------
+    element_seed_idx : ndarray of shape `grid_size` of int
+
+    Notes
+    -----
+    The grid is divided into blocks of elements. For each block, the nearest seed to
+    the block centre in the power distance (found with a (periodic) k-d tree, by
+    lifting the seeds into a fourth dimension with coordinate
+    `sqrt(max(weights) - weight)`) bounds the power distance of the nearest seed of
+    every element of the block. Only seeds within this bound of the block are
+    candidates, and the power distances from the elements of the block to its
+    candidates are found as sums of squared separations along each axis. Blocks are
+    processed in chunks, grouped by their numbers of candidates.
+
+    """
+    grid_size = np.asarray(grid_size)
+    size = np.asarray(size, dtype=float)
+    seeds = np.asarray(seeds, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    if periodic:
+        seeds = np.mod(seeds, size)
+
+    # Element centre coordinates along each axis, in blocks (padded beyond the grid):
+    elem_size = size / grid_size
+    num_blocks = -(-grid_size // block_size)
+    block_coords = [
+        ((np.arange(i * block_size) + 0.5) * j).reshape(i, block_size)
+        for i, j in zip(num_blocks, elem_size)
+    ]
+
+    # Centre and radius of the sphere enclosing the element centres of each block:
+    block_subs = np.array(np.unravel_index(np.arange(np.prod(num_blocks)), num_blocks)).T
+    first = block_subs * block_size
+    last = np.minimum(first + block_size, grid_size) - 1
+    block_centres = (first + last + 1) / 2 * elem_size
+    block_radii = np.sqrt(np.sum(((last - first) / 2 * elem_size) ** 2, axis=1))
+
+    cand_idx, num_cands = _get_laguerre_candidates(
+        seeds,
+        weights,
+        block_centres,
+        block_radii,
+        size,
+        periodic,
+    )
+    cand_start = np.cumsum(num_cands) - num_cands
+
+    # Padding candidate, which is never nearest:
+    seeds = np.vstack([seeds, np.zeros(3)])
+    weights = np.append(weights, -np.inf)
+    pad_idx = seeds.shape[0] - 1
+
+    block_seed_idx = np.empty((np.prod(num_blocks),) + (block_size,) * 3, dtype=int)
+    block_order = np.argsort(num_cands, kind='stable')
+    chunk_start = 0
+    while chunk_start < block_order.size:
+        max_cands = num_cands[block_order[chunk_start]]
+        num_chunk_blocks = 1
+        while chunk_start + num_chunk_blocks < block_order.size:
+            next_max = num_cands[block_order[chunk_start + num_chunk_blocks]]
+            if (num_chunk_blocks + 1) * next_max * block_size ** 3 > chunk_size:
+                break
+            max_cands = next_max
+            num_chunk_blocks += 1
+        chunk = block_order[chunk_start:chunk_start + num_chunk_blocks]
+        chunk_start += num_chunk_blocks
+
+        # Candidate seeds of each block of the chunk, padded to the same number:
+        cand_pos = np.arange(max(max_cands, 1))
+        is_pad = cand_pos >= num_cands[chunk][:, None]
+        chunk_cands = np.where(
+            is_pad,
+            pad_idx,
+            cand_idx[np.minimum(cand_start[chunk][:, None] + cand_pos, cand_idx.size - 1)],
+        )
+
+        # Power distances, of shape (blocks, block_size, block_size, block_size,
+        # candidates), as sums of squared separations along each axis:
+        power_dist = -weights[chunk_cands][:, None, None, None]
+        for axis in range(3):
+            sep = (
+                block_coords[axis][block_subs[chunk, axis]][:, :, None] -
+                seeds[chunk_cands, axis][:, None]
+            )
+            if periodic:
+                sep -= np.round(sep / size[axis]) * size[axis]
+            shape = [len(chunk), 1, 1, 1, chunk_cands.shape[1]]
+            shape[1 + axis] = block_size
+            power_dist = power_dist + (sep ** 2).reshape(shape)
+
+        nearest = np.argmin(power_dist, axis=-1)
+        block_seed_idx[chunk] = np.take_along_axis(
+            chunk_cands[:, None, None, None],
+            nearest[..., None],
+            axis=-1,
+        )[..., 0]
+
+    element_seed_idx = block_seed_idx.reshape(
+        tuple(num_blocks) + (block_size,) * 3
+    ).transpose((0, 3, 1, 4, 2, 5)).reshape(num_blocks * block_size)
+
+    return element_seed_idx[:grid_size[0], :grid_size[1], :grid_size[2]]
+
+
+def generate_laguerre_volume_element(grid_size, size, phase_statistics, periodic=True,
+                                     RNG_seed=None):
+    """Generate a volume element from a Laguerre tessellation, with seeds sampled from
+    the ESD distributions of `phase_statistics`.
+
+    Parameters
+    ----------
+    grid_size : list of int
+    size : list of float
+    phase_statistics : list of dict
+        As for the `from_statistics` method of `generate_volume_element`. The
+        `volume_fraction`, `size_distribution` (ESD log-normal distribution only) and,
+        optionally, `ODF` of each phase are used. "matrix" phases are not supported,
+        and "precipitate" phases are tessellated in the same way as "primary" phases.
+    periodic : bool, optional
+    RNG_seed : int, optional
+
+    Returns
+    -------
+    volume_element : dict
+        Validated volume element with one grain per non-empty Laguerre cell.
+
+    Notes
+    -----
+    For each phase, ESDs are sampled until the total volume of the equivalent spheres
+    reaches the phase volume fraction of the volume element; each seed is placed
+    uniformly at random with a weight equal to its squared equivalent sphere radius.
+    Grain orientations are uniformly random for phases without an `ODF`; otherwise,
+    they are sampled from the ODF kernels (see `sample_ODF_orientations`).
+
+    """
+    rng = np.random.default_rng(RNG_seed)
+    grid_size = np.asarray(grid_size)
+    size = np.asarray(size, dtype=float)
+
+    seed_ESDs = []
+    seed_phase_idx = []
+    for phase_idx, phase_stats in enumerate(phase_statistics):
+        err_msg = f'Problem with `phase_statistics` index {phase_idx}: '
+        if phase_stats['type'].lower() == 'matrix':
+            raise ValueError(err_msg + '"matrix" phases are not supported by Laguerre '
+                             'tessellations.')
+        ESD = sample_ESDs(
+            phase_stats['size_distribution'],
+            rng,
+            volume=phase_stats['volume_fraction'] * np.prod(size),
+        )
+        seed_ESDs.append(ESD)
+        seed_phase_idx.append(np.full(ESD.size, phase_idx))
+
+    seed_ESDs = np.concatenate(seed_ESDs)
+    seed_phase_idx = np.concatenate(seed_phase_idx)
+    seeds = rng.random((seed_ESDs.size, 3)) * size
+
+    element_seed_idx = get_laguerre_labels(
+        seeds,
+        (seed_ESDs / 2) ** 2,
+        grid_size,
+        size,
+        periodic=periodic,
+    )
+
+    # Remove empty cells:
+    grain_seed_idx, element_material_idx = np.unique(
+        element_seed_idx,
+        return_inverse=True,
+    )
+    element_material_idx = element_material_idx.reshape(grid_size)
+    grain_phase_idx = seed_phase_idx[grain_seed_idx]
+    num_grains = grain_seed_idx.size
+
+    quats = get_random_quaternions(num_grains, rng)
+    for phase_idx, phase_stats in enumerate(phase_statistics):
+        ODF = phase_stats.get('ODF')
+        in_phase = np.flatnonzero(grain_phase_idx == phase_idx)
+        if ODF and in_phase.size:
+            quats[in_phase] = sample_ODF_orientations(
+                ODF,
+                phase_stats['crystal_structure'],
+                in_phase.size,
+                rng,
+            )['quaternions']
+
+    phase_names = np.array([i['name'] for i in phase_statistics])
+    volume_element = {
+        'grid_size': grid_size,
+        'size': size,
+        'element_material_idx': element_material_idx,
+        'constituent_material_idx': np.arange(num_grains),
+        'constituent_phase_label': phase_names[grain_phase_idx],
+        'material_homog': np.full(num_grains, 'SX'),
+        'orientations': process_dream3D_quaternions(quats, P=-1),
+    }
+    volume_element = validate_volume_element(volume_element)
+    return volume_element
@@ -0,0 +1,272 @@
+"""Functions for transforming (parsed) volume elements, and for reading regions of
+Dream.3D volume elements."""
+
+import numpy as np
+from damask_parse.utils import validate_volume_element
+
+from matflow_dream3d.analysis import get_grain_boundary_faces
+
+
+def _permute_within_groups(group_idx, rng):
+    """Get a random permutation that only exchanges items of the same group."""
+    by_group = np.argsort(group_idx, kind='stable')
+    shuffled = np.lexsort((rng.random(group_idx.size), group_idx))
+    perm = np.empty(group_idx.size, dtype=int)
+    perm[by_group] = shuffled
+    return perm
+
+
+def tile_volume_element(volume_element, repeats, duplicate_orientations=True,
+                        RNG_seed=None):
+    """Tile a (periodic) volume element.
+
+    Parameters
+    ----------
+    volume_element : dict
+        Validated volume element.
+    repeats : list of int
+        Number of copies along each axis.
+    duplicate_orientations : bool, optional
+        If True, each copy of a constituent references the orientation of the original
+        constituent. Otherwise, the orientations of the constituents of each copy
+        (other than the first) are randomly permuted among the constituents of the
+        same phase, which retains the texture but not the spatial orientation
+        correlations across copies.
+    RNG_seed : int, optional
+        Used if `duplicate_orientations` is False.
+
+    Returns
+    -------
+    volume_element : dict
+        Validated, tiled volume element. The materials of copy `t` (in C order of the
+        copies) are offset by `t` times the number of materials of the original volume
+        element.
+
+    Notes
+    -----
+    Grains that cross the volume element boundaries are split into separate materials
+    at the boundaries between copies.
+
+    """
+    repeats = np.asarray(repeats, dtype=int)
+    num_copies = np.prod(repeats)
+    element_material_idx = np.asarray(volume_element['element_material_idx'])
+    num_mats = len(volume_element['material_homog'])
+    grid_size = np.asarray(element_material_idx.shape)
+
+    copy_offsets = np.arange(num_copies).reshape(repeats) * num_mats
+    for axis, num in enumerate(grid_size):
+        copy_offsets = np.repeat(copy_offsets, num, axis=axis)
+    tiled_element_material_idx = np.tile(element_material_idx, repeats) + copy_offsets
+
+    const_mat_idx = np.asarray(volume_element['constituent_material_idx'])
+    const_ori_idx = np.asarray(volume_element['constituent_orientation_idx'])
+    const_phase_label = np.asarray(volume_element['constituent_phase_label'])
+    orientations = {**volume_element['orientations']}
+
+    if duplicate_orientations:
+        tiled_ori_idx = np.tile(const_ori_idx, num_copies)
+    else:
+        rng = np.random.default_rng(RNG_seed)
+        _, const_phase_idx = np.unique(const_phase_label, return_inverse=True)
+        tiled_ori_idx = np.concatenate([const_ori_idx] + [
+            const_ori_idx[_permute_within_groups(const_phase_idx, rng)]
+            for _ in range(num_copies - 1)
+        ])
+
+    new_volume_element = {
+        **volume_element,
+        'grid_size': grid_size * repeats,
+        'element_material_idx': tiled_element_material_idx,
+        'constituent_material_idx': (
+            const_mat_idx[None] + np.arange(num_copies)[:, None] * num_mats
+        ).reshape(-1),
+        'constituent_phase_label': np.tile(const_phase_label, num_copies),
+        'constituent_orientation_idx': tiled_ori_idx,
+        'material_homog': np.tile(volume_element['material_homog'], num_copies),
+        'orientations': orientations,
+    }
+    if 'constituent_material_fraction' in volume_element:
+        new_volume_element['constituent_material_fraction'] = np.tile(
+            volume_element['constituent_material_fraction'],
+            num_copies,
+        )
+    if volume_element.get('size') is not None:
+        new_volume_element['size'] = np.asarray(volume_element['size']) * repeats
+
+    return validate_volume_element(new_volume_element)
+
+
+def read_dream3D_region(feature_ids, start=None, stop=None):
+    """Read a region of a Dream.3D `FeatureIds` array, and renumber the grains within the
+    region compactly.
+
+    Parameters
+    ----------
+    feature_ids : h5py.Dataset
+        Dream.3D `FeatureIds` cell array, of shape (Z, Y, X, 1).
+    start : list of int, optional
+        Start (inclusive) element subscripts (x, y, z) of the region. By default, zero.
+    stop : list of int, optional
+        Stop (exclusive) element subscripts (x, y, z) of the region. By default, the
+        grid size.
+
+    Returns
+    -------
+    element_material_idx : ndarray of int
+        Zero-indexed compact grain index of each element of the region, of shape
+        (X, Y, Z).
+    grain_idx : ndarray of shape (M,) of int
+        Zero-indexed Dream.3D grain (feature) index of each of the M grains within the
+        region, in increasing order.
+
+    Notes
+    -----
+    Only the region is read from the file, as an HDF5 hyperslab selection.
+
+    """
+    grid_size = feature_ids.shape[:3][::-1]
+    start = [0, 0, 0] if start is None else start
+    stop = grid_size if stop is None else stop
+    if any(i < 0 or j > k or i >= j for i, j, k in zip(start, stop, grid_size)):
+        raise ValueError(f'Invalid region with `start` {list(start)} and `stop` '
+                         f'{list(stop)} for grid size {list(grid_size)}.')
+
+    region = feature_ids[
+        start[2]:stop[2],
+        start[1]:stop[1],
+        start[0]:stop[0],
+        0,
+    ].transpose((2, 1, 0))
+    grain_idx, element_material_idx = np.unique(region - 1, return_inverse=True)
+    element_material_idx = element_material_idx.reshape(region.shape)
+
+    return element_material_idx, grain_idx
+
+
+def compact_volume_element(volume_element):
+    """Remove materials without elements and orientations without constituents, and
+    renumber the remaining materials and orientations compactly.
+
+    Parameters
+    ----------
+    volume_element : dict
+        Validated volume element.
+
+    Returns
+    -------
+    volume_element : dict
+        Validated volume element, in which materials retain their relative order.
+
+    """
+    element_material_idx = np.asarray(volume_element['element_material_idx'])
+    num_mats = len(volume_element['material_homog'])
+    mat_idx, new_element_material_idx = np.unique(
+        element_material_idx,
+        return_inverse=True,
+    )
+    new_mat_idx = np.full(num_mats, -1)
+    new_mat_idx[mat_idx] = np.arange(mat_idx.size)
+
+    const_mat_idx = new_mat_idx[np.asarray(volume_element['constituent_material_idx'])]
+    keep = const_mat_idx >= 0
+    ori_idx, const_ori_idx = np.unique(
+        np.asarray(volume_element['constituent_orientation_idx'])[keep],
+        return_inverse=True,
+    )
+    orientations = {**volume_element['orientations']}
+    orientations['quaternions'] = np.asarray(orientations['quaternions'])[ori_idx]
+
+    new_volume_element = {
+        **volume_element,
+        'element_material_idx': new_element_material_idx.reshape(
+            element_material_idx.shape
+        ),
+        'constituent_material_idx': const_mat_idx[keep],
+        'constituent_phase_label': (
+            np.asarray(volume_element['constituent_phase_label'])[keep]
+        ),
+        'constituent_orientation_idx': const_ori_idx,
+        'material_homog': np.asarray(volume_element['material_homog'])[mat_idx],
+        'orientations': orientations,
+    }
+    if 'constituent_material_fraction' in volume_element:
+        new_volume_element['constituent_material_fraction'] = np.asarray(
+            volume_element['constituent_material_fraction']
+        )[keep]
+
+    return validate_volume_element(new_volume_element)
+
+
+def merge_small_grains(volume_element, min_voxels, periodic=True):
+    """Merge grains (materials) with fewer than `min_voxels` elements into their largest
+    face neighbour, and compact the volume element.
+
+    Parameters
+    ----------
+    volume_element : dict
+        Validated volume element.
+    min_voxels : int
+        Grains with fewer elements than this are merged.
+    periodic : bool, optional
+        If True, grains that share faces across the volume element boundaries are
+        neighbours.
+
+    Returns
+    -------
+    volume_element : dict
+        Validated, compacted volume element (see `compact_volume_element`); merged
+        grains take the material (and so the phase and orientation) of the grain into
+        which they are merged.
+
+    Notes
+    -----
+    In each pass, each small grain is merged into its face neighbour with the most
+    elements, preferring neighbours that are not small, as long as that neighbour
+    ranks higher by (not small, number of elements, index), so that there are no
+    cycles and chains of merges are resolved by pointer jumping. Passes are repeated,
+    with updated grain sizes, until no more small grains can be merged (e.g. small
+    grains without neighbours are retained).
+
+    """
+    element_material_idx = np.asarray(volume_element['element_material_idx'])
+    num_mats = len(volume_element['material_homog'])
+    merged_idx = element_material_idx
+
+    while True:
+        num_voxels = np.bincount(merged_idx.reshape(-1), minlength=num_mats)
+        is_small = np.logical_and(num_voxels > 0, num_voxels < min_voxels)
+        if not np.any(is_small):
+            break
+
+        pairs = get_grain_boundary_faces(merged_idx, periodic=periodic)['pairs']
+        grain, neighbour = np.concatenate([pairs, pairs[:, ::-1]]).T
+        consider = is_small[grain]
+        grain, neighbour = grain[consider], neighbour[consider]
+
+        # Rank of each grain by (not small, number of elements, index):
+        rank = np.empty(num_mats, dtype=int)
+        rank[np.lexsort((np.arange(num_mats), num_voxels, ~is_small))] = np.arange(num_mats)
+
+        # Highest ranked neighbour of each small grain is last in its group:
+        srt = np.lexsort((rank[neighbour], grain))
+        grain, neighbour = grain[srt], neighbour[srt]
+        is_last = np.append(grain[1:] != grain[:-1], True)
+        grain, neighbour = grain[is_last], neighbour[is_last]
+        do_merge = rank[neighbour] > rank[grain]
+        if not np.any(do_merge):
+            break
+
+        target = np.arange(num_mats)
+        target[grain[do_merge]] = neighbour[do_merge]
+        while True:
+            next_target = target[target]
+            if np.array_equal(next_target, target):
+                break
+            target = next_target
+        merged_idx = target[merged_idx]
+
+    return compact_volume_element({
+        **volume_element,
+        'element_material_idx': merged_idx,
+    })
@@ -1,4 +1,6 @@
 import numpy as np
+from damask_parse.utils import validate_orientations
+from scipy.special import ndtr, ndtri
 
 
 def quat2euler(quats, degrees=False, P=1):
@@ -94,3 +96,890 @@ def process_dream3D_euler_angles(euler_angles, degrees=False):
         'unit_cell_alignment': {'x': 'a'},
     }
     return orientations
+
+
+def process_dream3D_quaternions(quaternions, P=-1):
+    orientations = {
+        'type': 'quat',
+        'quaternions': quaternions,
+        'quat_component_ordering': 'scalar-vector',
+        'unit_cell_alignment': {'x': 'a'},
+        'P': P,
+    }
+    return orientations
+
+
+def axang2quat_batch(axes, angles):
+    """Convert axis-angle pairs to unit quaternions.
+
+    Parameters
+    ----------
+    axes : ndarray of shape (N, 3) of float
+        Rotation axes; these do not need to be normalised.
+    angles : ndarray of shape (N,) of float
+        Rotation angles in radians.
+
+    Returns
+    -------
+    quats : ndarray of shape (N, 4) of float
+        Unit quaternions in the scalar-vector convention.
+
+    """
+    axes = np.asarray(axes, dtype=float)
+    angles = np.asarray(angles, dtype=float)
+    axes = axes / np.linalg.norm(axes, axis=1)[:, None]
+    quats = np.empty((axes.shape[0], 4))
+    quats[:, 0] = np.cos(angles / 2)
+    quats[:, 1:] = np.sin(angles / 2)[:, None] * axes
+    return quats
+
+
+def multiply_quaternions_batch(q1, q2, P=1):
+    """Find the element-wise products of two arrays of quaternions.
+
+    Parameters
+    ----------
+    q1 : ndarray of shape (..., 4) of float
+    q2 : ndarray of shape (..., 4) of float
+        Must be broadcastable against `q1`.
+    P : int, optional
+        The "P" constant, either +1 or -1, as defined within [1].
+
+    Returns
+    -------
+    q3 : ndarray of shape (..., 4) of float
+
+    References
+    ----------
+    [1] Rowenhorst, D, A D Rollett, G S Rohrer, M Groeber, M Jackson,
+        P J Konijnenberg, and M De Graef. "Consistent Representations
+        of and Conversions between 3D Rotations". Modelling and Simulation
+        in Materials Science and Engineering 23, no. 8 (1 December 2015):
+        083501. https://doi.org/10.1088/0965-0393/23/8/083501.
+
+    """
+    s1, v1 = q1[..., :1], q1[..., 1:]
+    s2, v2 = q2[..., :1], q2[..., 1:]
+    scalar = s1 * s2 - np.sum(v1 * v2, axis=-1, keepdims=True)
+    vector = s1 * v2 + s2 * v1 + P * np.cross(v1, v2)
+    return np.concatenate([scalar, vector], axis=-1)
+
+
+def _get_cubic_symmetry_quats():
+    half_pi = np.pi / 2
+    axes_angles = [([0, 0, 1], 0)]
+    for axis in ([1, 0, 0], [0, 1, 0], [0, 0, 1]):
+        axes_angles += [(axis, np.pi), (axis, half_pi), (axis, -half_pi)]
+    for axis in ([1, 1, 1], [1, 1, -1], [1, -1, 1], [-1, 1, 1]):
+        axes_angles += [(axis, 2 * np.pi / 3), (axis, -2 * np.pi / 3)]
+    for axis in ([1, 1, 0], [1, -1, 0], [1, 0, 1], [1, 0, -1], [0, 1, 1], [0, 1, -1]):
+        axes_angles += [(axis, np.pi)]
+    axes, angles = zip(*axes_angles)
+    return axang2quat_batch(axes, angles)
+
+
+def _get_hexagonal_symmetry_quats():
+    # Six-fold axis parallel to z and two-fold axes in the basal plane (x//a):
+    rot_z = np.arange(6) * np.pi / 3
+    basal = np.arange(6) * np.pi / 6
+    axes = np.vstack([
+        np.tile([0, 0, 1], (6, 1)),
+        np.array([np.cos(basal), np.sin(basal), np.zeros(6)]).T,
+    ])
+    angles = np.concatenate([rot_z, np.full(6, np.pi)])
+    return axang2quat_batch(axes, angles)
+
+
+# Proper rotation point groups of the crystal structures supported by the pipeline
+# writers, as (K, 4) arrays of scalar-vector unit quaternions. Since each group is
+# closed under inversion, the same tables apply for P = +1 and P = -1:
+SYMMETRY_QUATS = {
+    'cubic': _get_cubic_symmetry_quats(),
+    'hexagonal': _get_hexagonal_symmetry_quats(),
+}
+
+# Dream3D crystal structure indices, as in `CrystalStructures` ensemble arrays:
+DREAM3D_CRYSTAL_STRUCTURES = {
+    0: 'hexagonal',
+    1: 'cubic',
+}
+
+
+def _conjugate(quats):
+    return quats * np.array([1, -1, -1, -1])
+
+
+def get_symmetry_quaternions(crystal_structure):
+    """Get the proper rotation symmetry operators of a crystal structure.
+
+    Parameters
+    ----------
+    crystal_structure : str
+        One of "cubic" or "hexagonal".
+
+    Returns
+    -------
+    sym_quats : ndarray of shape (K, 4) of float
+
+    """
+    try:
+        return SYMMETRY_QUATS[crystal_structure]
+    except KeyError:
+        raise ValueError(
+            f'Crystal structure "{crystal_structure}" unknown. Must be one of: '
+            f'{", ".join([f"{i}" for i in SYMMETRY_QUATS])}'
+        )
+
+
+DISORIENTATION_CHUNK_SIZE = 2 ** 18
+
+
+def _max_symmetric_cos_half_angle(mis_quats, sym_quats):
+    """Find the cosine of the half disorientation angle of each of an array of
+    misorientation quaternions.
+
+    The scalar part of the product of a symmetry operator with a misorientation
+    quaternion is (up to the sign of the vector part, to which the symmetry group is
+    invariant) a dot product, so the minimum angle over all symmetry operators only
+    requires the maximum absolute value of a single matrix product with the table of
+    symmetry operators.
+
+    """
+    return np.max(np.abs(mis_quats @ sym_quats.T), axis=-1)
+
+
+def disorientation_angles(quats_a, quats_b, crystal_structure, P=1, degrees=False,
+                          chunk_size=DISORIENTATION_CHUNK_SIZE):
+    """Find the element-wise disorientation angles between two arrays of orientations.
+
+    The misorientation of each pair is `quats_b * conj(quats_a)`, as in
+    `disorientations`; for passive (sample-to-crystal) orientations, this is the
+    rotation from crystal frame `a` to crystal frame `b`, expressed in the crystal
+    frame.
+
+    Parameters
+    ----------
+    quats_a : ndarray of shape (N, 4) of float
+    quats_b : ndarray of shape (N, 4) of float
+    crystal_structure : str
+        One of "cubic" or "hexagonal".
+    P : int, optional
+        The "P" constant, either +1 or -1, as defined within [1].
+    degrees : bool, optional
+        If True, angles are returned in degrees, rather than radians.
+    chunk_size : int, optional
+        Maximum number of orientation pairs processed at once, which limits temporary
+        memory use to approximately `chunk_size * (8 + K)` floats, where K is the
+        number of symmetry operators.
+
+    Returns
+    -------
+    angles : ndarray of shape (N,) of float
+
+    References
+    ----------
+    [1] Rowenhorst, D, A D Rollett, G S Rohrer, M Groeber, M Jackson,
+        P J Konijnenberg, and M De Graef. "Consistent Representations
+        of and Conversions between 3D Rotations". Modelling and Simulation
+        in Materials Science and Engineering 23, no. 8 (1 December 2015):
+        083501. https://doi.org/10.1088/0965-0393/23/8/083501.
+
+    """
+    sym_quats = get_symmetry_quaternions(crystal_structure)
+    quats_a = np.asarray(quats_a, dtype=float)
+    quats_b = np.asarray(quats_b, dtype=float)
+    num_oris = quats_a.shape[0]
+
+    cos_half = np.empty(num_oris)
+    for start in range(0, num_oris, chunk_size):
+        sl = slice(start, start + chunk_size)
+        mis_quats = multiply_quaternions_batch(quats_b[sl], _conjugate(quats_a[sl]), P=P)
+        cos_half[sl] = _max_symmetric_cos_half_angle(mis_quats, sym_quats)
+
+    angles = 2 * np.arccos(np.clip(cos_half, 0, 1))
+    if degrees:
+        angles = np.rad2deg(angles)
+
+    return angles
+
+
+def pairwise_disorientation_angles(quats_a, quats_b, crystal_structure, P=1,
+                                   degrees=False, chunk_size=DISORIENTATION_CHUNK_SIZE):
+    """Find the disorientation angles between all pairs of two arrays of orientations.
+
+    The misorientation of each pair is `quats_b[j] * conj(quats_a[i])`, as in
+    `disorientation_angles`.
+
+    Parameters
+    ----------
+    quats_a : ndarray of shape (N, 4) of float
+    quats_b : ndarray of shape (M, 4) of float
+    crystal_structure : str
+        One of "cubic" or "hexagonal".
+    P : int, optional
+        The "P" constant, either +1 or -1, as defined within [1].
+    degrees : bool, optional
+        If True, angles are returned in degrees, rather than radians.
+    chunk_size : int, optional
+        Maximum number of orientation pairs processed at once. Rows of `quats_a` are
+        processed in chunks of `max(1, chunk_size // M)`.
+
+    Returns
+    -------
+    angles : ndarray of shape (N, M) of float
+
+    References
+    ----------
+    [1] Rowenhorst, D, A D Rollett, G S Rohrer, M Groeber, M Jackson,
+        P J Konijnenberg, and M De Graef. "Consistent Representations
+        of and Conversions between 3D Rotations". Modelling and Simulation
+        in Materials Science and Engineering 23, no. 8 (1 December 2015):
+        083501. https://doi.org/10.1088/0965-0393/23/8/083501.
+
+    """
+    sym_quats = get_symmetry_quaternions(crystal_structure)
+    quats_a_conj = _conjugate(np.asarray(quats_a, dtype=float))
+    quats_b = np.asarray(quats_b, dtype=float)
+    num_a, num_b = quats_a_conj.shape[0], quats_b.shape[0]
+    rows_per_chunk = max(1, chunk_size // max(num_b, 1))
+
+    cos_half = np.empty((num_a, num_b))
+    for start in range(0, num_a, rows_per_chunk):
+        sl = slice(start, start + rows_per_chunk)
+        mis_quats = multiply_quaternions_batch(
+            quats_b[None],
+            quats_a_conj[sl, None],
+            P=P,
+        )
+        cos_half[sl] = _max_symmetric_cos_half_angle(mis_quats, sym_quats)
+
+    angles = 2 * np.arccos(np.clip(cos_half, 0, 1))
+    if degrees:
+        angles = np.rad2deg(angles)
+
+    return angles
+
+
+def _reduce_disorientation_axes(axes, crystal_structure):
+    """Move disorientation axes into the standard stereographic triangle of the Laue
+    group of a crystal structure."""
+
+    axes = np.abs(axes)
+    if crystal_structure == 'cubic':
+        axes = -np.sort(-axes, axis=1)  # |x| >= |y| >= |z|
+    elif crystal_structure == 'hexagonal':
+        # Reduce the azimuth to [0, 30] degrees, using the six-fold axis and mirrors:
+        azimuth = np.arctan2(axes[:, 1], axes[:, 0]) % (np.pi / 3)
+        azimuth = np.minimum(azimuth, np.pi / 3 - azimuth)
+        radius = np.linalg.norm(axes[:, :2], axis=1)
+        axes = np.array([radius * np.cos(azimuth), radius * np.sin(azimuth), axes[:, 2]]).T
+    return axes
+
+
+def disorientations(quats_a, quats_b, crystal_structure, P=1, degrees=False,
+                    chunk_size=DISORIENTATION_CHUNK_SIZE):
+    """Find the element-wise disorientation angles and axes between two arrays of
+    orientations.
+
+    The misorientation of each pair is `quats_b * conj(quats_a)`; for passive
+    (sample-to-crystal) orientations, this is the rotation from crystal frame `a` to
+    crystal frame `b`, expressed in the crystal frame.
+
+    Parameters
+    ----------
+    quats_a : ndarray of shape (N, 4) of float
+    quats_b : ndarray of shape (N, 4) of float
+    crystal_structure : str
+        One of "cubic" or "hexagonal".
+    P : int, optional
+        The "P" constant, either +1 or -1, as defined within [1].
+    degrees : bool, optional
+        If True, angles are returned in degrees, rather than radians.
+    chunk_size : int, optional
+        Maximum number of orientation pairs processed at once.
+
+    Returns
+    -------
+    angles : ndarray of shape (N,) of float
+    axes : ndarray of shape (N, 3) of float
+        Unit disorientation axes in the crystal frame, reduced to the standard
+        stereographic triangle. Axes of zero-angle disorientations are set to [0, 0, 1].
+
+    References
+    ----------
+    [1] Rowenhorst, D, A D Rollett, G S Rohrer, M Groeber, M Jackson,
+        P J Konijnenberg, and M De Graef. "Consistent Representations
+        of and Conversions between 3D Rotations". Modelling and Simulation
+        in Materials Science and Engineering 23, no. 8 (1 December 2015):
+        083501. https://doi.org/10.1088/0965-0393/23/8/083501.
+
+    """
+    sym_quats = get_symmetry_quaternions(crystal_structure)
+    quats_a = np.asarray(quats_a, dtype=float)
+    quats_b = np.asarray(quats_b, dtype=float)
+    num_oris = quats_a.shape[0]
+
+    dis_quats = np.empty((num_oris, 4))
+    for start in range(0, num_oris, chunk_size):
+        sl = slice(start, start + chunk_size)
+        mis_quats = multiply_quaternions_batch(quats_b[sl], _conjugate(quats_a[sl]), P=P)
+        # The scalar part of `conj(sym) * mis` is the dot product of `sym` and `mis`:
+        best_sym = np.argmax(np.abs(mis_quats @ sym_quats.T), axis=1)
+        dis_quats[sl] = multiply_quaternions_batch(
+            _conjugate(sym_quats[best_sym]),
+            mis_quats,
+            P=P,
+        )
+
+    dis_quats[dis_quats[:, 0] < 0] *= -1
+    angles = 2 * np.arccos(np.clip(dis_quats[:, 0], 0, 1))
+
+    axes = np.tile([0.0, 0, 1], (num_oris, 1))
+    vec_norm = np.linalg.norm(dis_quats[:, 1:], axis=1)
+    has_axis = ~np.isclose(vec_norm, 0)
+    axes[has_axis] = dis_quats[has_axis, 1:] / vec_norm[has_axis, None]
+    axes = _reduce_disorientation_axes(axes, crystal_structure)
+
+    if degrees:
+        angles = np.rad2deg(angles)
+
+    return angles, axes
+
+
+def get_grain_mean_orientations(quats, grain_idx, grain_crystal_structure, P=1,
+                                degrees=False):
+    """Find symmetry-aware mean orientations and orientation spreads of grains.
+
+    Parameters
+    ----------
+    quats : ndarray of shape (N, 4) of float
+        Element (voxel) orientations as scalar-vector unit quaternions.
+    grain_idx : ndarray of shape (N,) of int
+        Zero-indexed grain to which each element belongs.
+    grain_crystal_structure : ndarray of shape (M,) of str
+        Crystal structure ("cubic" or "hexagonal") of each of the M grains.
+    P : int, optional
+        The "P" constant, either +1 or -1, as defined within [1].
+    degrees : bool, optional
+        If True, `orientation_spread` is returned in degrees, rather than radians.
+
+    Returns
+    -------
+    mean_quats : ndarray of shape (M, 4) of float
+        Mean orientation of each grain. Grains without elements are assigned the
+        identity orientation.
+    orientation_spread : ndarray of shape (M,) of float
+        Grain orientation spread (GOS) of each grain; the mean disorientation angle
+        between each element of a grain and the grain mean orientation.
+
+    Notes
+    -----
+    Element orientations are first replaced by their symmetric equivalent closest to a
+    reference orientation (the first element) of their grain, such that the quaternion
+    average is not corrupted by symmetrically equivalent but numerically distant
+    quaternions. Sums over grains are then found by grouped reductions using
+    `np.bincount`.
+
+    References
+    ----------
+    [1] Rowenhorst, D, A D Rollett, G S Rohrer, M Groeber, M Jackson,
+        P J Konijnenberg, and M De Graef. "Consistent Representations
+        of and Conversions between 3D Rotations". Modelling and Simulation
+        in Materials Science and Engineering 23, no. 8 (1 December 2015):
+        083501. https://doi.org/10.1088/0965-0393/23/8/083501.
+
+    """
+    quats = np.asarray(quats, dtype=float)
+    grain_idx = np.asarray(grain_idx).reshape(-1)
+    grain_crystal_structure = np.asarray(grain_crystal_structure)
+    num_grains = grain_crystal_structure.size
+
+    uniq_grains, first_idx = np.unique(grain_idx, return_index=True)
+    ref_quats = np.tile([1.0, 0, 0, 0], (num_grains, 1))
+    ref_quats[uniq_grains] = quats[first_idx]
+
+    mean_quats = np.zeros((num_grains, 4))
+    spread_sum = np.zeros(num_grains)
+    elem_crystal_structure = grain_crystal_structure[grain_idx]
+
+    for crystal_structure in np.unique(grain_crystal_structure):
+
+        elem_idx = np.where(elem_crystal_structure == crystal_structure)[0]
+        quats_i = quats[elem_idx]
+        grain_idx_i = grain_idx[elem_idx]
+        ref_i = ref_quats[grain_idx_i]
+
+        # Find the symmetric equivalent of each element closest to its grain reference:
+        best_dot = np.full(elem_idx.size, -np.inf)
+        aligned = np.empty_like(quats_i)
+        for sym_quat in get_symmetry_quaternions(crystal_structure):
+            equiv = multiply_quaternions_batch(sym_quat, quats_i, P=P)
+            dot = np.sum(equiv * ref_i, axis=1)
+            equiv[dot < 0] *= -1
+            dot = np.abs(dot)
+            is_better = dot > best_dot
+            aligned[is_better] = equiv[is_better]
+            best_dot[is_better] = dot[is_better]
+
+        for comp_idx in range(4):
+            mean_quats[:, comp_idx] += np.bincount(
+                grain_idx_i,
+                weights=aligned[:, comp_idx],
+                minlength=num_grains,
+            )
+
+    norms = np.linalg.norm(mean_quats, axis=1)
+    is_empty = np.isclose(norms, 0)
+    mean_quats[is_empty] = [1, 0, 0, 0]
+    norms[is_empty] = 1
+    mean_quats /= norms[:, None]
+    mean_quats[mean_quats[:, 0] < 0] *= -1
+
+    for crystal_structure in np.unique(grain_crystal_structure):
+        elem_idx = np.where(elem_crystal_structure == crystal_structure)[0]
+        grain_idx_i = grain_idx[elem_idx]
+        angles = disorientation_angles(
+            quats[elem_idx],
+            mean_quats[grain_idx_i],
+            crystal_structure,
+            P=P,
+            degrees=degrees,
+        )
+        spread_sum += np.bincount(grain_idx_i, weights=angles, minlength=num_grains)
+
+    counts = np.bincount(grain_idx, minlength=num_grains)
+    orientation_spread = spread_sum / np.maximum(counts, 1)
+
+    return mean_quats, orientation_spread
+
+
+# Neighbour shifts for kernel calculations; only one of each pair of opposite shifts
+# is listed, since (dis)orientation relationships between neighbours are symmetric:
+KERNEL_NEIGHBOUR_SHIFTS = {
+    'face': [
+        (1, 0, 0), (0, 1, 0), (0, 0, 1),
+    ],
+    'edge': [
+        (1, 0, 0), (0, 1, 0), (0, 0, 1),
+        (1, 1, 0), (1, -1, 0), (1, 0, 1), (1, 0, -1), (0, 1, 1), (0, 1, -1),
+    ],
+}
+
+
+def get_kernel_average_misorientation(quats, grain_idx, crystal_structure, P=1,
+                                      neighbours='face', degrees=False):
+    """Find the kernel average misorientation (KAM) of each element of a 3D grid.
+
+    Parameters
+    ----------
+    quats : ndarray of shape (*grid_size, 4) of float
+        Element orientations as scalar-vector unit quaternions.
+    grain_idx : ndarray of shape `grid_size` of int
+        Grain to which each element belongs. Only neighbours within the same grain
+        contribute to the kernel average.
+    crystal_structure : ndarray of shape `grid_size` of str
+        Crystal structure ("cubic" or "hexagonal") of each element.
+    P : int, optional
+        The "P" constant, either +1 or -1, as defined within [1].
+    neighbours : str, optional
+        Either "face" (six nearest neighbours) or "edge" (the face neighbours and the
+        twelve next-nearest neighbours that share an edge).
+    degrees : bool, optional
+        If True, the KAM is returned in degrees, rather than radians.
+
+    Returns
+    -------
+    KAM : ndarray of shape `grid_size` of float32
+        Elements without any same-grain neighbours have a KAM of zero.
+
+    Notes
+    -----
+    The grid is treated as periodic. For each neighbour shift, the whole grid is
+    compared with a rolled copy of itself; the disorientation found for a shift is
+    also rolled back to give the disorientation for the opposite shift.
+
+    References
+    ----------
+    [1] Rowenhorst, D, A D Rollett, G S Rohrer, M Groeber, M Jackson,
+        P J Konijnenberg, and M De Graef. "Consistent Representations
+        of and Conversions between 3D Rotations". Modelling and Simulation
+        in Materials Science and Engineering 23, no. 8 (1 December 2015):
+        083501. https://doi.org/10.1088/0965-0393/23/8/083501.
+
+    """
+    if neighbours not in KERNEL_NEIGHBOUR_SHIFTS:
+        raise ValueError(
+            f'`neighbours` "{neighbours}" unknown. Must be one of: '
+            f'{", ".join([f"{i}" for i in KERNEL_NEIGHBOUR_SHIFTS])}'
+        )
+
+    grid_size = grain_idx.shape
+    crystal_structure = np.broadcast_to(crystal_structure, grid_size)
+    angle_sum = np.zeros(grid_size)
+    num_neighbours = np.zeros(grid_size, dtype=int)
+
+    for shift in KERNEL_NEIGHBOUR_SHIFTS[neighbours]:
+
+        # Element `i` of the rolled arrays is the neighbour at `i + shift`:
+        neg_shift = tuple(-i for i in shift)
+        same_grain = grain_idx == np.roll(grain_idx, neg_shift, axis=(0, 1, 2))
+        quats_nbr = np.roll(quats, neg_shift, axis=(0, 1, 2))
+
+        angles = np.zeros(grid_size)
+        for cs in np.unique(crystal_structure[same_grain]):
+            is_cs = np.logical_and(same_grain, crystal_structure == cs)
+            angles[is_cs] = disorientation_angles(
+                quats[is_cs],
+                quats_nbr[is_cs],
+                cs,
+                P=P,
+                degrees=degrees,
+            )
+
+        angle_sum += angles + np.roll(angles, shift, axis=(0, 1, 2))
+        num_neighbours += same_grain
+        num_neighbours += np.roll(same_grain, shift, axis=(0, 1, 2))
+
+    KAM = angle_sum / np.maximum(num_neighbours, 1)
+
+    return KAM.astype(np.float32)
+
+
+SIGMA_MIN_DEFAULT = 5
+SIGMA_MAX_DEFAULT = 5
+# Distributions defined for each size distribution bin:
+DISTRIBUTIONS_MAP = {
+    'omega3': {
+        'type': 'beta',
+        'default_keys': {
+            'alpha': 10.0,
+            'beta': 1.5,
+        },
+        'label': 'FeatureSize Vs Omega3 Distributions',
+    },
+    'b/a': {
+        'type': 'beta',
+        'default_keys': {
+            'alpha': 10.0,
+            'beta': 1.5,
+        },
+        'label': 'FeatureSize Vs B Over A Distributions',
+    },
+    'c/a': {
+        'type': 'beta',
+        'default_keys': {
+            'alpha': 10.0,
+            'beta': 1.5,
+        },
+        'label': 'FeatureSize Vs C Over A Distributions',
+    },
+    'neighbours': {
+        'type': 'lognormal',
+        'default_keys': {
+            'average': 2.0,
+            'stddev': 0.5,
+        },
+        'label': 'FeatureSize Vs Neighbors Distributions',
+    },
+}
+
+# Bunge Euler angles (degrees) of common cubic texture components:
+ODF_CUBIC_PRESETS = {
+    'cube': (0, 0, 0),
+    'goss': (0, 45, 0),
+    'brass': (35, 45, 0),
+    'copper': (90, 35, 45),
+    's': (59, 37, 63),
+    's1': (55, 30, 65),
+    's2': (45, 35, 65),
+    'rc(rd1)': (0, 20, 0),
+    'rc(rd2)': (0, 35, 0),
+    'rc(nd1)': (20, 0, 0),
+    'rc(nd2)': (35, 0, 0),
+    'p': (70, 45, 0),
+    'q': (55, 20, 0),
+    'r': (55, 75, 25),
+}
+
+
+def get_ESD_bins(size_dist):
+    """Get the equivalent sphere diameter (ESD) log-normal distribution parameters and
+    the ESD bins of a (validated) phase `size_distribution`, as used by Dream3D."""
+
+    sigma = size_dist['ESD_log_stddev']
+    log_mean = size_dist.get('ESD_log_mean')
+    if log_mean is None:
+        # expected value (mean) of the variable's natural log
+        log_mean = np.log(size_dist['ESD_mean']) - (sigma ** 2 / 2)
+
+    sigma_min = size_dist.get('ESD_log_stddev_min_cut_off', SIGMA_MIN_DEFAULT)
+    sigma_max = size_dist.get('ESD_log_stddev_max_cut_off', SIGMA_MAX_DEFAULT)
+    min_feat_ESD = np.exp(log_mean - (sigma_min * sigma))
+    max_feat_ESD = np.exp(log_mean + (sigma_max * sigma))
+
+    bin_step_size = size_dist.get('bin_step_size')
+    if bin_step_size is not None:
+        bins = np.arange(min_feat_ESD, max_feat_ESD, bin_step_size)
+    else:
+        num_bins = size_dist['num_bins']
+        bin_step_size = (max_feat_ESD - min_feat_ESD) / num_bins
+        bins = np.linspace(min_feat_ESD, max_feat_ESD, num_bins, endpoint=False)
+
+    ESD_bins = {
+        'log_mean': log_mean,
+        'log_stddev': sigma,
+        'min_ESD': min_feat_ESD,
+        'max_ESD': max_feat_ESD,
+        'bins': bins,
+        'bin_step_size': bin_step_size,
+    }
+    return ESD_bins
+
+
+def sample_ESDs(size_distribution, rng, num=None, volume=None):
+    """Sample equivalent sphere diameters (ESDs) from the truncated log-normal
+    distribution of a phase `size_distribution`, as used by Dream3D.
+
+    Parameters
+    ----------
+    size_distribution : dict
+    rng : numpy.random.Generator
+    num : int, optional
+        Number of ESDs to sample. Exactly one of `num` and `volume` must be specified.
+    volume : float, optional
+        Total volume of the spheres; ESDs are sampled until this volume is reached.
+
+    Returns
+    -------
+    ESD : ndarray of shape (N,) of float
+
+    """
+    ESD_bins = get_ESD_bins(size_distribution)
+    log_mean, sigma = ESD_bins['log_mean'], ESD_bins['log_stddev']
+    cdf_lims = ndtr((np.log([ESD_bins['min_ESD'], ESD_bins['max_ESD']]) - log_mean) /
+                    sigma)
+
+    def sample(num):
+        return np.exp(log_mean + sigma * ndtri(rng.uniform(*cdf_lims, size=num)))
+
+    if volume is None:
+        return sample(num)
+
+    mean_vol = np.pi / 6 * np.exp(3 * log_mean + 4.5 * sigma ** 2)
+    ESD = np.empty(0)
+    while np.sum(np.pi / 6 * ESD ** 3) < volume:
+        ESD = np.concatenate([ESD, sample(int(volume / mean_vol) + 1)])
+    num = np.searchsorted(np.cumsum(np.pi / 6 * ESD ** 3), volume) + 1
+    return ESD[:num]
+
+
+def get_random_quaternions(num, rng):
+    """Sample uniformly distributed random unit quaternions (scalar-vector order).
+
+    Parameters
+    ----------
+    num : int
+    rng : numpy.random.Generator
+
+    Returns
+    -------
+    quats : ndarray of shape (num, 4) of float
+
+    References
+    ----------
+    K. Shoemake, "Uniform random rotations", Graphics Gems III, 1992.
+
+    """
+    u1, u2, u3 = rng.random((3, num))
+    quats = np.array([
+        np.sqrt(u1) * np.cos(2 * np.pi * u3),
+        np.sqrt(1 - u1) * np.sin(2 * np.pi * u2),
+        np.sqrt(1 - u1) * np.cos(2 * np.pi * u2),
+        np.sqrt(u1) * np.sin(2 * np.pi * u3),
+    ]).T
+    return quats
+
+
+def get_ODF_components(ODF, crystal_structure):
+    """Get the component orientations and weights of a phase `ODF`.
+
+    Parameters
+    ----------
+    ODF : dict
+        Phase `ODF`, as in the `phase_statistics` input of `generate_volume_element`,
+        with either `presets` (names of `ODF_CUBIC_PRESETS`, with optional `weight`), or
+        `orientations` (and, optionally, `weights`).
+    crystal_structure : str
+        One of "cubic" or "hexagonal".
+
+    Returns
+    -------
+    quats : ndarray of shape (N, 4) of float
+        Component orientations as scalar-vector quaternions with P = -1, and x//a unit
+        cell alignment, as used by Dream3D.
+    weights : ndarray of shape (N,) of float
+
+    """
+
+    presets = ODF.get('presets')
+    if presets:
+        oris = process_dream3D_euler_angles(
+            np.array([ODF_CUBIC_PRESETS[i['name'].lower()] for i in presets]),
+            degrees=True,
+        )
+        weights = [i.get('weight', 1) for i in presets]
+    else:
+        oris = ODF['orientations']
+        weights = ODF.get('weights', 1)
+
+    oris = validate_orientations(oris)
+    quats = np.asarray(oris['quaternions'], dtype=float)
+    P = oris['P']
+
+    if crystal_structure == 'hexagonal' and oris['unit_cell_alignment'].get('y') == 'b':
+        hex_transform_quat = axang2quat_batch(P * np.array([[0, 0, 1]]), [np.pi / 6])
+        quats = multiply_quaternions_batch(hex_transform_quat, quats, P=P)
+
+    if P == 1:
+        quats[:, 1:] *= -1  # the conjugate represents the same rotation with P = -1
+
+    weights = np.broadcast_to(np.reshape(weights, -1), quats.shape[0]).astype(float)
+    return quats, weights
+
+
+# Default ODF kernel spread, and its unit (Dream3D ODF bin size) in degrees:
+ODF_SIGMA_DEFAULT = 2
+ODF_SIGMA_BIN_SIZE = 5
+
+
+def get_ODF_sigmas(ODF):
+    """Get the kernel spreads (in Dream3D ODF bins) of the components of a phase `ODF`,
+    in the same order as the components returned by `get_ODF_components`."""
+    presets = ODF.get('presets')
+    if presets:
+        sigmas = [i.get('sigma', ODF_SIGMA_DEFAULT) for i in presets]
+        num = len(presets)
+    else:
+        sigmas = ODF.get('sigmas', ODF_SIGMA_DEFAULT)
+        num = validate_orientations(ODF['orientations'])['quaternions'].shape[0]
+    return np.broadcast_to(np.reshape(sigmas, -1), num).astype(float)
+
+
+def sample_von_mises_fisher_quaternions(mean_quat, kappa, num, rng, P=1):
+    """Sample unit quaternions from a von Mises-Fisher distribution on the unit
+    3-sphere, with density proportional to `exp(kappa * dot(q, mean_quat))`.
+
+    Parameters
+    ----------
+    mean_quat : ndarray of shape (4,) of float
+        Mean orientation as a scalar-vector unit quaternion.
+    kappa : float
+        Concentration parameter; for large `kappa`, the rotation from the mean
+        orientation has an angular standard deviation (about each axis) of
+        approximately `2 / sqrt(kappa)` radians.
+    num : int
+    rng : numpy.random.Generator
+    P : int, optional
+        The "P" constant, either +1 or -1, of `mean_quat` and of the sampled
+        quaternions.
+
+    Returns
+    -------
+    quats : ndarray of shape (num, 4) of float
+
+    References
+    ----------
+    A. T. A. Wood, "Simulation of the von Mises Fisher distribution", Communications
+    in Statistics - Simulation and Computation 23, no. 1 (1994): 157-164.
+
+    """
+    # Sample the scalar part (cosine of the half-angle of the rotation from the mean)
+    # by Wood's rejection algorithm (dimension four), retrying only rejected samples:
+    b = 3 / (2 * kappa + np.sqrt(4 * kappa ** 2 + 9))
+    x0 = (1 - b) / (1 + b)
+    c = kappa * x0 + 3 * np.log(1 - x0 ** 2)
+    w = np.empty(0)
+    while w.size < num:
+        z = rng.beta(1.5, 1.5, size=num - w.size)
+        w_i = (1 - (1 + b) * z) / (1 - (1 - b) * z)
+        accept = kappa * w_i + 3 * np.log(1 - x0 * w_i) - c >= np.log(rng.random(z.size))
+        w = np.concatenate([w, w_i[accept]])
+
+    # Rotation axes are uniformly distributed:
+    delta = np.empty((num, 4))
+    delta[:, 0] = w
+    delta[:, 1:] = rng.normal(size=(num, 3))
+    delta[:, 1:] *= (np.sqrt(np.clip(1 - w ** 2, 0, None)) /
+                     np.linalg.norm(delta[:, 1:], axis=1))[:, None]
+
+    # Rotate about the mean; rows of `mean_mult` are the products of the mean with the
+    # quaternion basis:
+    mean_mult = multiply_quaternions_batch(np.asarray(mean_quat)[None], np.eye(4), P=P)
+    return delta @ mean_mult
+
+
+def sample_ODF_orientations(ODF, crystal_structure, num, rng,
+                            return_component_idx=False):
+    """Sample orientations from a phase `ODF` specified as a set of weighted kernels.
+
+    Parameters
+    ----------
+    ODF : dict
+        Phase `ODF`, as in the `phase_statistics` input of `generate_volume_element`,
+        with either `presets` (names of `ODF_CUBIC_PRESETS`, with optional `weight` and
+        `sigma`), or `orientations` (and, optionally, `weights` and `sigmas`). Weights
+        are relative component weights (the uniform background of Dream3D's ODF is
+        not sampled).
+    crystal_structure : str
+        One of "cubic" or "hexagonal".
+    num : int
+        Number of orientations to sample.
+    rng : numpy.random.Generator
+    return_component_idx : bool, optional
+        If True, also return the ODF component from which each orientation is sampled.
+
+    Returns
+    -------
+    orientations : dict
+        Sampled orientations (in random order) as scalar-vector quaternions with
+        P = -1, and x//a unit cell alignment, as used by Dream3D.
+    component_idx : ndarray of shape (num,) of int
+        Index of the ODF component (as ordered by `get_ODF_components`) of each
+        orientation. Only returned if `return_component_idx` is True.
+
+    Notes
+    -----
+    The number of orientations drawn from each component is multinomially distributed
+    according to the component weights, and orientations are sampled from a von
+    Mises-Fisher distribution on the quaternion sphere about each component
+    orientation. The kernel spread, `sigma`, is given in Dream3D ODF bins (of
+    `ODF_SIGMA_BIN_SIZE` degrees), and is used as the angular standard deviation about
+    each axis.
+
+    """
+    comp_quats, comp_weights = get_ODF_components(ODF, crystal_structure)
+    sigmas = np.deg2rad(get_ODF_sigmas(ODF) * ODF_SIGMA_BIN_SIZE)
+    if np.any(sigmas <= 0):
+        raise ValueError(f'ODF kernel `sigmas` must be positive, but are: {sigmas}.')
+
+    comp_counts = rng.multinomial(num, comp_weights / np.sum(comp_weights))
+    quats = np.concatenate([np.empty((0, 4))] + [
+        sample_von_mises_fisher_quaternions(
+            comp_quats[comp_idx],
+            kappa=(2 / sigmas[comp_idx]) ** 2,
+            num=comp_num,
+            rng=rng,
+            P=-1,
+        )
+        for comp_idx, comp_num in enumerate(comp_counts) if comp_num
+    ])
+    perm = rng.permutation(num)
+    quats = quats[perm]
+    quats[quats[:, 0] < 0] *= -1  # use the northern hemisphere
+    orientations = process_dream3D_quaternions(quats, P=-1)
+
+    if return_component_idx:
+        component_idx = np.repeat(np.arange(comp_counts.size), comp_counts)[perm]
+        return orientations, component_idx
+
+    return orientations
@@ -59,6 +59,7 @@ setup(
     install_requires=[
         'matflow',
         'numpy',
+        'scipy',
         'h5py',
     ],
     license="MIT license",
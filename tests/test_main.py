@@ -0,0 +1,66 @@
+"""Tests of the Dream3D output mappers, run on small fake Dream3D output files."""
+
+import h5py
+import numpy as np
+import pytest
+
+from matflow_dream3d.main import parse_dream_3D_two_point_statistics
+
+
+@pytest.fixture
+def pipeline_dream3d(tmp_path):
+    """A fake `pipeline.dream3d` file of a two-phase, four-grain volume element,
+    with the array layouts written by Dream3D."""
+
+    # Grain (feature) index of each element, in (x, y, z) order:
+    feature_ids = np.zeros((4, 4, 2), dtype=np.int32)
+    feature_ids[2:, :2] = 1
+    feature_ids[:2, 2:] = 2
+    feature_ids[2:, 2:] = 3
+
+    path = tmp_path.joinpath('pipeline.dream3d')
+    with h5py.File(path, mode='w') as fh:
+        synth_vol = fh.create_group('DataContainers/SyntheticVolumeDataContainer')
+        geom = synth_vol.create_group('_SIMPL_GEOMETRY')
+        geom['DIMENSIONS'] = np.array(feature_ids.shape, dtype=np.uint64)
+        geom['SPACING'] = np.array([0.25, 0.25, 0.5], dtype=np.float32)
+        synth_vol['CellData/FeatureIds'] = (
+            feature_ids.transpose((2, 1, 0))[..., None] + 1
+        )
+        synth_vol['Grain Data/Phases'] = np.array([[0], [1], [2], [1], [2]],
+                                                  dtype=np.int32)
+        synth_vol['CellEnsembleData/PhaseName'] = np.array(
+            [b'Unknown Phase Type', b'matrix', b'precipitate'],
+        )
+
+    return path
+
+
+def test_two_point_statistics_mapper(pipeline_dream3d):
+
+    two_point_stats = parse_dream_3D_two_point_statistics(pipeline_dream3d)
+
+    assert two_point_stats['fields'] == ['matrix', 'precipitate', 'grain_boundary']
+    assert np.allclose(two_point_stats['volume_fractions'][:2], [0.5, 0.5])
+
+    # Autocorrelations at zero separation are the volume fractions:
+    auto_idx = np.flatnonzero(
+        two_point_stats['pairs'][:, 0] == two_point_stats['pairs'][:, 1]
+    )
+    assert np.allclose(
+        two_point_stats['radial_correlations'][auto_idx, 0],
+        two_point_stats['volume_fractions'],
+        atol=1e-6,
+    )
+    assert 'correlations' not in two_point_stats
+
+
+def test_two_point_statistics_mapper_full(pipeline_dream3d):
+
+    two_point_stats = parse_dream_3D_two_point_statistics(
+        pipeline_dream3d,
+        two_point_full=True,
+    )
+    num_pairs = len(two_point_stats['pairs'])
+    assert two_point_stats['correlations'].shape == (num_pairs, 4, 4, 2)
+    assert two_point_stats['correlations'].dtype == np.float32